@@ -0,0 +1,304 @@
+"""
+Load test driving both services with a realistic request mix.
+Starts user_service and task_service with their production launchers on SQLite files, backed by an
+in-memory Redis stand-in, optionally pointing task_service at a stub user service instead of the real one.
+Virtual users then register, log in, create, list, read and update tasks at the chosen concurrency,
+and the run reports throughput plus p50/p95/p99 latency per endpoint. Given several worker counts, the
+load is repeated for each and the throughput compared, to show how the services scale with processes.
+Run from the repository root: python -m benchmarks.loadtest --concurrency 8 --duration 20
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+
+import requests
+
+from benchmarks.redis_stub import RedisStub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "register=2,login=8,create=25,list=30,get=20,update=15"
+LAUNCHERS = {"user_service": "app.user_server", "task_service": "app.task_server"}
+
+
+class StubUserHandler(BaseHTTPRequestHandler):
+    """
+    User Service stand-in that knows every user id.
+    """
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answers GET /users/{id} for any id.
+        """
+        user_id = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+        self._reply({"id": user_id, "name": f"user {user_id}", "email": f"u{user_id}@example.com"})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Answers POST /users/lookup with every requested id found.
+        """
+        ids = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["ids"]
+        self._reply({"users": [{"id": user_id, "name": f"user {user_id}", "email": f"u{user_id}@example.com"}
+                               for user_id in ids], "missing": []})
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        Keeps the stub quiet.
+        """
+
+    def _reply(self, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def free_port() -> int:
+    """
+    Returns a TCP port that is free right now.
+    """
+    with ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler) as probe:
+        return probe.server_address[1]
+
+
+@contextmanager
+def service(name: str, port: int, env: Dict[str, str], workers: int = 1) -> Iterator[str]:
+    """
+    Runs one service with its launcher until the block exits.
+    Args:
+        name (str): Service directory, user_service or task_service.
+        port (int): Port to listen on.
+        env (Dict[str, str]): Extra environment variables.
+        workers (int): Number of worker processes.
+    Returns:
+        Iterator[str]: Base URL of the running service.
+    """
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", LAUNCHERS[name], "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, name), env={**os.environ, **env})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{base_url}/health", timeout=1).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"{name} did not start")
+            time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(45)
+
+
+class Recorder:
+    """
+    Thread-safe collection of latencies and errors per endpoint.
+    """
+    def __init__(self):
+        """
+        Initializes empty samples.
+        """
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def timed(self, name: str, send) -> requests.Response:
+        """
+        Sends a request and records its latency, counting 5xx answers and connection errors as errors.
+        Args:
+            name (str): Endpoint label.
+            send: Callable sending the request.
+        Returns:
+            requests.Response: The response, or None after a connection error.
+        """
+        started = time.perf_counter()
+        try:
+            response = send()
+        except requests.RequestException:
+            response = None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if response is None or response.status_code >= 500:
+                self.errors[name] += 1
+        return response
+
+    def report(self, duration: float) -> dict:
+        """
+        Summarizes the samples.
+        Args:
+            duration (float): Wall time of the run in seconds.
+        Returns:
+            dict: Per endpoint count, throughput, errors and latency percentiles in milliseconds.
+        """
+        summary = {}
+        for name, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": len(ordered),
+                "rps": len(ordered) / duration,
+                "errors": self.errors[name],
+                **{f"p{pct}_ms": ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+                   for pct in (50, 95, 99)},
+            }
+        return summary
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """
+    Parses a request mix such as "login=10,list=30".
+    """
+    weights = {name: int(weight) for name, weight in (part.split("=") for part in mix.split(",") if part)}
+    unknown = set(weights) - set(re.findall(r"(\w+)=", DEFAULT_MIX))
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def virtual_user(user_url: str, task_url: str, mix: Dict[str, int], recorder: Recorder,
+                 stop: threading.Event, seed: int) -> None:
+    """
+    Registers one user, then sends requests drawn from the mix until stopped.
+    """
+    rng = random.Random(seed)
+    session = requests.Session()
+    email = f"{uuid.uuid4().hex}@example.com"
+    credentials = {"email": email, "password": "load-test-password"}
+    registered = recorder.timed("POST /users/register", lambda: session.post(
+        f"{user_url}/users/register", json={"name": "load", **credentials}))
+    if registered is None or not registered.ok:
+        return
+    user_id = registered.json()["id"]
+    task_ids: List[int] = []
+    operations, weights = zip(*mix.items())
+    while not stop.is_set():
+        operation = rng.choices(operations, weights)[0]
+        if operation == "register":
+            recorder.timed("POST /users/register", lambda: session.post(
+                f"{user_url}/users/register",
+                json={"name": "load", "email": f"{uuid.uuid4().hex}@example.com", "password": "x"}))
+        elif operation == "login":
+            recorder.timed("POST /users/login", lambda: session.post(f"{user_url}/users/login", json=credentials))
+        elif operation == "create" or not task_ids:
+            due = (datetime(2030, 1, 1) + timedelta(minutes=rng.randrange(100_000))).isoformat()
+            created = recorder.timed("POST /tasks", lambda: session.post(
+                f"{task_url}/tasks", json={"title": "load task", "user_id": user_id, "due_date": due}))
+            if created is not None and created.status_code == 201:
+                task_ids.append(created.json()["id"])
+        elif operation == "list":
+            recorder.timed("GET /tasks", lambda: session.get(
+                f"{task_url}/tasks", params={"user_id": user_id, "limit": 50}))
+        elif operation == "get":
+            task_id = rng.choice(task_ids)
+            recorder.timed("GET /tasks/{id}", lambda: session.get(f"{task_url}/tasks/{task_id}"))
+        elif operation == "update":
+            task_id = rng.choice(task_ids)
+            recorder.timed("PUT /tasks/{id}", lambda: session.put(
+                f"{task_url}/tasks/{task_id}", json={"status": rng.choice(["pending", "doing", "done"])}))
+
+
+def run(concurrency: int, duration: float, mix: Dict[str, int], stub_users: bool, hash_iterations: int,
+        workers: int = 1) -> dict:
+    """
+    Starts the services with the given number of worker processes each, drives the load and returns the report.
+    """
+    workdir = tempfile.mkdtemp(prefix="taskflow-load-")
+    redis_stub = RedisStub().start()
+    stub_server = None
+    common = {"REDIS_URL": redis_stub.url, "JWT_SECRET": "load-test", "DISABLE_CHECK_SAME_THREAD": "false"}
+    try:
+        with service("user_service", free_port(), {
+                **common, "USER_DATABASE_URL": f"sqlite:///{workdir}/users.db",
+                "PASSWORD_PBKDF2_ITERATIONS": str(hash_iterations)}, workers) as user_url:
+            users_for_tasks = user_url
+            if stub_users:
+                stub_server = ThreadingHTTPServer(("127.0.0.1", 0), StubUserHandler)
+                threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+                users_for_tasks = f"http://127.0.0.1:{stub_server.server_address[1]}"
+            with service("task_service", free_port(), {
+                    **common, "TASK_DATABASE_URL": f"sqlite:///{workdir}/tasks.db",
+                    "USER_SERVICE_URL": users_for_tasks}, workers) as task_url:
+                recorder, stop = Recorder(), threading.Event()
+                users = [threading.Thread(target=virtual_user, args=(user_url, task_url, mix, recorder, stop, seed))
+                         for seed in range(concurrency)]
+                started = time.perf_counter()
+                for user in users:
+                    user.start()
+                time.sleep(duration)
+                stop.set()
+                for user in users:
+                    user.join()
+                elapsed = time.perf_counter() - started
+    finally:
+        if stub_server is not None:
+            stub_server.shutdown()
+        redis_stub.stop()
+    endpoints = recorder.report(elapsed)
+    total = sum(stats["count"] for stats in endpoints.values())
+    return {"workers": workers, "concurrency": concurrency, "duration_s": elapsed, "total_rps": total / elapsed,
+            "endpoints": endpoints}
+
+
+def print_report(report: dict) -> None:
+    """
+    Prints the throughput and the per endpoint table of one run.
+    """
+    print(f"{report['total_rps']:.1f} req/s over {report['duration_s']:.1f}s at concurrency {report['concurrency']}"
+          f" with {report['workers']} worker(s)")
+    print(f"{'endpoint':<22}{'count':>8}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<22}{stats['count']:>8}{stats['rps']:>9.1f}{stats['errors']:>8}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+
+
+def main() -> None:
+    """
+    Parses the options, runs the load test and prints the report.
+    """
+    parser = argparse.ArgumentParser(description="Load test both services with a realistic request mix.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights, default {DEFAULT_MIX}")
+    parser.add_argument("--stub-user-service", action="store_true",
+                        help="Point task_service at a stub instead of the real user_service.")
+    parser.add_argument("--hash-iterations", type=int, default=600_000,
+                        help="PBKDF2 iterations used by user_service; lower it to load the rest of the stack.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="Worker processes per service; several counts run the load once for each.")
+    parser.add_argument("--json", help="Also write the report, or the list of reports, to this file.")
+    args = parser.parse_args()
+    reports = []
+    for workers in args.workers:
+        reports.append(run(args.concurrency, args.duration, parse_mix(args.mix), args.stub_user_service,
+                           args.hash_iterations, workers))
+        print_report(reports[-1])
+    if len(reports) > 1:
+        print(f"{'workers':<10}{'req/s':>9}{'speedup':>9}")
+        for report in reports:
+            speedup = report["total_rps"] / reports[0]["total_rps"]
+            print(f"{report['workers']:<10}{report['total_rps']:>9.1f}{speedup:>8.2f}x")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(reports[0] if len(reports) == 1 else reports, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
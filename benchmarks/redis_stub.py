@@ -0,0 +1,307 @@
+"""
+In-memory stand-in for Redis, speaking enough of RESP2 for both services.
+Supports the string, hash, stream, pub/sub publish and MULTI/EXEC commands the services issue; data
+lives in a dict and expiry is checked lazily on read. Meant for load tests, not for correctness checks.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class RedisStub:
+    """
+    Single-threaded asyncio RESP2 server holding its data in process.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Initializes the server without starting it.
+        Args:
+            host (str): Interface to bind.
+            port (int): Port to bind; 0 picks a free one.
+        """
+        self.host = host
+        self.port = port
+        self._data: Dict[bytes, object] = {}
+        self._expires: Dict[bytes, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._writers = set()
+        self._stream_added: Optional[asyncio.Event] = None
+
+    @property
+    def url(self) -> str:
+        """
+        Returns the redis:// URL of the running server.
+        """
+        return f"redis://{self.host}:{self.port}/0"
+
+    def start(self) -> "RedisStub":
+        """
+        Starts the server in a background thread and waits until it listens.
+        Returns:
+            RedisStub: The running server.
+        """
+        self._thread = threading.Thread(target=self._serve, name="redis-stub", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._stream_added = asyncio.Event()
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        server.close()
+        for writer in list(self._writers):
+            writer.close()
+        self._loop.run_until_complete(self._drain())
+        self._loop.close()
+
+    @staticmethod
+    async def _drain() -> None:
+        pending = asyncio.all_tasks() - {asyncio.current_task()}
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        queued: Optional[List[List[bytes]]] = None
+        self._writers.add(writer)
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b"MULTI":
+                    queued = []
+                    writer.write(b"+OK\r\n")
+                elif name == b"EXEC" and queued is not None:
+                    replies = [self._execute(queued_command) for queued_command in queued]
+                    queued = None
+                    writer.write(b"*%d\r\n" % len(replies) + b"".join(replies))
+                elif queued is not None:
+                    queued.append(command)
+                    writer.write(b"+QUEUED\r\n")
+                elif name == b"XREAD":
+                    writer.write(await self._xread(command[1:]))
+                else:
+                    writer.write(self._execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        header = await reader.readline()
+        if not header:
+            return None
+        if not header.startswith(b"*"):
+            return header.split()
+        args = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _execute(self, command: List[bytes]) -> bytes:
+        name, args = command[0].upper().decode(), command[1:]
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            return b"+OK\r\n" if name in ("CLIENT", "SELECT") else b"-ERR unknown command '%s'\r\n" % command[0]
+        try:
+            return handler(*args)
+        except (TypeError, ValueError) as exc:
+            return b"-ERR %s\r\n" % str(exc).encode()
+
+    def _get(self, key: bytes):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def _set(self, key: bytes, value, ttl: Optional[float] = None) -> None:
+        self._data[key] = value
+        if ttl is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = time.monotonic() + ttl
+
+    def _hash(self, key: bytes) -> Dict[bytes, bytes]:
+        value = self._get(key)
+        if value is None:
+            value = {}
+            self._data[key] = value
+        return value
+
+    def _cmd_ping(self, *_) -> bytes:
+        return b"+PONG\r\n"
+
+    def _cmd_get(self, key: bytes) -> bytes:
+        return _bulk(self._get(key))
+
+    def _cmd_mget(self, *keys: bytes) -> bytes:
+        return _array([self._get(key) for key in keys])
+
+    def _cmd_set(self, key: bytes, value: bytes, *options: bytes) -> bytes:
+        opts = [option.upper() for option in options]
+        ttl = None
+        if b"PX" in opts:
+            ttl = int(options[opts.index(b"PX") + 1]) / 1000
+        elif b"EX" in opts:
+            ttl = int(options[opts.index(b"EX") + 1])
+        if b"NX" in opts and self._get(key) is not None:
+            return b"$-1\r\n"
+        self._set(key, value, ttl)
+        return b"+OK\r\n"
+
+    def _cmd_setex(self, key: bytes, ttl: bytes, value: bytes) -> bytes:
+        self._set(key, value, int(ttl))
+        return b"+OK\r\n"
+
+    def _cmd_del(self, *keys: bytes) -> bytes:
+        removed = 0
+        for key in keys:
+            removed += self._get(key) is not None
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return b":%d\r\n" % removed
+
+    def _cmd_incr(self, key: bytes) -> bytes:
+        return self._cmd_incrby(key, b"1")
+
+    def _cmd_incrby(self, key: bytes, amount: bytes) -> bytes:
+        value = int(self._get(key) or 0) + int(amount)
+        self._data[key] = str(value).encode()
+        return b":%d\r\n" % value
+
+    def _cmd_expire(self, key: bytes, ttl: bytes) -> bytes:
+        if self._get(key) is None:
+            return b":0\r\n"
+        self._expires[key] = time.monotonic() + int(ttl)
+        return b":1\r\n"
+
+    def _cmd_hincrby(self, key: bytes, field: bytes, amount: bytes) -> bytes:
+        fields = self._hash(key)
+        value = int(fields.get(field, 0)) + int(amount)
+        fields[field] = str(value).encode()
+        return b":%d\r\n" % value
+
+    def _cmd_hget(self, key: bytes, field: bytes) -> bytes:
+        return _bulk((self._get(key) or {}).get(field))
+
+    def _cmd_hgetall(self, key: bytes) -> bytes:
+        items: List[Tuple[bytes, bytes]] = list((self._get(key) or {}).items())
+        return _array([part for item in items for part in item])
+
+    def _cmd_hset(self, key: bytes, *pairs: bytes) -> bytes:
+        fields = self._hash(key)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in fields
+            fields[field] = value
+        return b":%d\r\n" % added
+
+    def _cmd_publish(self, channel: bytes, message: bytes) -> bytes:
+        _ = (channel, message)
+        return b":0\r\n"
+
+    def _stream(self, key: bytes) -> List[Tuple[Tuple[int, int], List[bytes]]]:
+        value = self._get(key)
+        if value is None:
+            value = []
+            self._data[key] = value
+        return value
+
+    def _cmd_xadd(self, key: bytes, *args: bytes) -> bytes:
+        # XADD key [NOMKSTREAM] [MAXLEN [~|=] n] id field value [field value ...]; only * ids are generated.
+        options = list(args)
+        maxlen = None
+        while options[0].upper() in (b"NOMKSTREAM", b"MAXLEN"):
+            option = options.pop(0).upper()
+            if option == b"MAXLEN":
+                if options[0] in (b"~", b"="):
+                    options.pop(0)
+                maxlen = int(options.pop(0))
+        entries = self._stream(key)
+        last = entries[-1][0] if entries else (0, 0)
+        now = int(time.time() * 1000)
+        entry_id = (now, 0) if now > last[0] else (last[0], last[1] + 1)
+        entries.append((entry_id, options[1:]))
+        if maxlen is not None and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        self._stream_added.set()
+        self._stream_added = asyncio.Event()
+        return _bulk(_entry_id(entry_id))
+
+    def _cmd_xrevrange(self, key: bytes, end: bytes, start: bytes, *options: bytes) -> bytes:
+        # Only the full range (+ -) is supported, which is what the change feed asks for.
+        _ = (end, start)
+        entries = list(reversed(self._get(key) or []))
+        if options and options[0].upper() == b"COUNT":
+            entries = entries[:int(options[1])]
+        return _reply([[_entry_id(entry_id), fields] for entry_id, fields in entries])
+
+    async def _xread(self, args: List[bytes]) -> bytes:
+        # XREAD [COUNT n] [BLOCK ms] STREAMS key id, for a single stream; BLOCK 0 waits without limit.
+        options = [arg.upper() for arg in args]
+        count = int(args[options.index(b"COUNT") + 1]) if b"COUNT" in options else None
+        block = int(args[options.index(b"BLOCK") + 1]) if b"BLOCK" in options else None
+        key, after = args[options.index(b"STREAMS") + 1:options.index(b"STREAMS") + 3]
+        entries = self._get(key) or []
+        floor = (entries[-1][0] if entries else (0, 0)) if after == b"$" else _parse_entry_id(after)
+        deadline = time.monotonic() + block / 1000 if block else None
+        while True:
+            newer = [(entry_id, fields) for entry_id, fields in self._get(key) or [] if entry_id > floor]
+            if newer or block is None:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._stream_added.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+        if not newer:
+            return b"*-1\r\n"
+        return _reply([[key, [[_entry_id(entry_id), fields] for entry_id, fields in newer[:count]]]])
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(values: List[Optional[bytes]]) -> bytes:
+    return b"*%d\r\n" % len(values) + b"".join(_bulk(value) for value in values)
+
+
+def _reply(value) -> bytes:
+    # Encodes nested lists of bulk strings, as returned by the stream commands.
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_reply(item) for item in value)
+    return _bulk(value)
+
+
+def _entry_id(entry_id: Tuple[int, int]) -> bytes:
+    return b"%d-%d" % entry_id
+
+
+def _parse_entry_id(value: bytes) -> Tuple[int, int]:
+    milliseconds, _, sequence = value.partition(b"-")
+    return int(milliseconds), int(sequence or 0)
@@ -5,14 +5,91 @@ This module initializes the FastAPI application and includes all defined routers
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 logging.info(PROJECT_ROOT)
 sys.path.append(PROJECT_ROOT)
 
+from app.task_admission import AdmissionMiddleware, LoadShedder
+from app.task_db import ASYNC_MODE, init_async_db, init_db, pool_pressure, pool_stats
+from app.task_metrics import METRICS, MetricsMiddleware
+from app.task_resources import TaskResources, get_task_resources
 from app.task_routes import router
 
-app = FastAPI(title="Task Service")
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """
+    Creates the schema, builds the shared clients and starts the statistics reconciler, the overdue
+    scheduler and the change feed reader on startup, and stops them and releases the pools on shutdown.
+    Args:
+        application (FastAPI): The application whose state holds the resources.
+    """
+    init_db()
+    if ASYNC_MODE:
+        await init_async_db()
+    application.state.resources = TaskResources()
+    application.state.resources.stats_reconciler.start()
+    application.state.resources.overdue_scheduler.start()
+    application.state.resources.event_feed.start()
+    try:
+        yield
+    finally:
+        await application.state.resources.aclose()
+        application.state.resources = None
+
+
+SHEDDER = LoadShedder.from_env(pool_pressure)
+
+app = FastAPI(title="Task Service", lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware, shedder=SHEDDER)
+app.add_middleware(MetricsMiddleware)
+if ASYNC_MODE:
+    from app.task_async_routes import async_router
+    app.include_router(async_router)
 app.include_router(router)
+
+
+@app.get("/health")
+def health():
+    """
+    Liveness endpoint exposing database pool occupancy and checkout waits.
+    Returns:
+        dict: Service status and pool statistics.
+    """
+    return {"status": "ok", "db_pool": pool_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(resources: TaskResources = Depends(get_task_resources)):
+    """
+    Prometheus endpoint: request, database, Redis and outbound HTTP timings, followed by the
+    connection pool, user validation cache and circuit breaker state sampled at scrape time.
+    Args:
+        resources (TaskResources): Application-scoped resources.
+    Returns:
+        PlainTextResponse: Metrics in the Prometheus text exposition format.
+    """
+    pool = pool_stats()
+    samples = [
+        ("db_pool_checked_out", "gauge", "Connections currently checked out.", pool.get("checked_out", 0)),
+        ("db_pool_saturation", "gauge", "Share of the pool capacity in use.", pool.get("saturation", 0.0)),
+        ("db_pool_checkouts_total", "counter", "Connection checkouts.", pool.get("checkouts", 0)),
+        ("db_pool_wait_max_seconds", "gauge", "Longest connection checkout wait.", pool.get("wait_max_ms", 0.0) / 1000),
+        ("db_pool_waiting", "gauge", "Connection checkouts in progress.", pool.get("waiting", 0)),
+        ("http_requests_in_flight", "gauge", "Requests admitted and not yet answered.", SHEDDER.in_flight),
+        ("task_event_streams", "gauge", "Open change feed connections.", resources.event_feed.subscribers),
+        ("user_service_circuit_open", "gauge", "Whether the User Service circuit breaker is open.",
+         int(resources.user_client.breaker.state == resources.user_client.breaker.OPEN)),
+    ]
+    if resources.user_client.cache is not None:
+        cache = resources.user_client.cache.stats()
+        samples.append(("user_validation_cache_size", "gauge", "Entries in the local user cache.", cache.pop("size")))
+        for name, value in sorted(cache.items()):
+            samples.append((f"user_validation_cache_{name}_total", "counter",
+                            f"User validation cache {name.replace('_', ' ')}.", value))
+    return PlainTextResponse(METRICS.render(samples), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,152 @@
+"""
+Asyncio FastAPI route definitions for task-related operations.
+In async mode these handlers take precedence over the synchronous ones for creating, updating,
+deleting and listing tasks; the other endpoints keep their synchronous implementation.
+"""
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+
+from app.task_async_services import AsyncTaskService
+from app.task_resources import get_async_task_service
+from app.task_routes import (NDJSON_MEDIA_TYPE, CreateTaskRequest, UpdateTaskRequest, listing_etag, listing_filters,
+                             not_modified, rows_response, wants_ndjson)
+from app.task_services import TaskRowEncoder, UserServiceUnavailable, task_to_dict
+
+async_router = APIRouter(prefix="/tasks", tags=["tasks"])
+
+
+@async_router.post("", status_code=201)
+async def create_task(payload: CreateTaskRequest, service: AsyncTaskService = Depends(get_async_task_service)):
+    """
+    Endpoint to create a new task.
+    Args:
+        payload (CreateTaskRequest): Task details (title, user_id, due_date).
+        service (AsyncTaskService): Asyncio task service provided by dependency injection.
+    Returns:
+        dict: The created task details.
+    Raises:
+        HTTPException: If user validation fails or the User Service is unavailable.
+    """
+    try:
+        task = await service.create_task(payload.title, payload.user_id, payload.due_date)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except UserServiceUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return task_to_dict(task)
+
+
+@async_router.put("/{task_id}")
+async def update_task(task_id: int, payload: UpdateTaskRequest,
+                      service: AsyncTaskService = Depends(get_async_task_service)):
+    """
+    Endpoint to update the status of an existing task.
+    Args:
+        task_id (int): ID of the task to update.
+        payload (UpdateTaskRequest): New status for the task.
+        service (AsyncTaskService): Asyncio task service.
+    Returns:
+        dict: Updated task details.
+    Raises:
+        HTTPException: If the task is not found.
+    """
+    try:
+        task = await service.update_task_status(task_id, payload.status)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    return task_to_dict(task)
+
+
+@async_router.delete("/{task_id}")
+async def delete_task(task_id: int, service: AsyncTaskService = Depends(get_async_task_service)):
+    """
+    Endpoint to delete a task.
+    Args:
+        task_id (int): ID of the task to delete.
+        service (AsyncTaskService): Asyncio task service.
+    Returns:
+        dict: Deletion confirmation.
+    Raises:
+        HTTPException: If the task is not found.
+    """
+    try:
+        await service.delete_task(task_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    return {"deleted": True}
+
+
+async def _ndjson_lines(rows: AsyncIterator[Row], encoder: TaskRowEncoder,
+                        batch_size: int = 500) -> AsyncIterator[bytes]:
+    """
+    Encodes projected task rows as newline-delimited JSON, flushing every batch_size rows.
+    Args:
+        rows (AsyncIterator[Row]): Rows to encode.
+        encoder (TaskRowEncoder): Encoder built for the selected fields.
+        batch_size (int): Number of rows written per chunk.
+    Returns:
+        AsyncIterator[bytes]: Chunks of NDJSON.
+    """
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield encoder.encode_lines(batch)
+            batch = []
+    if batch:
+        yield encoder.encode_lines(batch)
+
+
+@async_router.get("")
+async def list_tasks(request: Request,
+                     status: Optional[List[str]] = Query(default=None),
+                     due_before: Optional[datetime] = Query(default=None),
+                     user_id: Optional[int] = Query(default=None),
+                     limit: int = Query(default=100, ge=1, le=1000),
+                     cursor: Optional[str] = Query(default=None),
+                     stream: bool = Query(default=False),
+                     fields: Optional[str] = Query(default=None),
+                     service: AsyncTaskService = Depends(get_async_task_service)
+                     ):
+    """
+    Endpoint to list tasks with optional filtering, paginated or streamed as NDJSON.
+    Only the requested columns are read, and rows are encoded straight into the response body.
+    A matching If-None-Match is answered with 304 before the database is queried.
+    Args:
+        request (Request): Incoming request, used for content negotiation.
+        status (Optional[List[str]]): Filter by task status; repeat or comma-separate for several.
+        due_before (Optional[datetime]): Filter tasks due before this timestamp.
+        user_id (Optional[int]): Filter by owner.
+        limit (int): Maximum number of tasks per page.
+        cursor (Optional[str]): Cursor of the page to fetch.
+        stream (bool): Whether to stream all matching tasks as NDJSON.
+        fields (Optional[str]): Comma-separated sparse fieldset, e.g. "id,status". Defaults to every field.
+        service (AsyncTaskService): Asyncio task service.
+    Returns:
+        Response: JSON array of the tasks matching the filters, an NDJSON stream, or an empty 304 response.
+    Raises:
+        HTTPException: If the cursor is malformed or a field is unknown.
+    """
+    statuses, selected = listing_filters(status, fields)
+    etag = None
+    if service.versions is not None:
+        etag = await asyncio.to_thread(listing_etag, request, service.versions, user_id)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    headers = {"ETag": etag} if etag is not None else {}
+    if wants_ndjson(request, stream):
+        rows = service.iter_task_rows(selected, status=statuses, due_before=due_before, user_id=user_id)
+        return StreamingResponse(_ndjson_lines(rows, TaskRowEncoder(selected)), media_type=NDJSON_MEDIA_TYPE,
+                                 headers=headers)
+    try:
+        page, next_cursor = await service.list_task_rows(selected, status=statuses, due_before=due_before,
+                                                         user_id=user_id, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return rows_response(page, TaskRowEncoder(selected), headers, next_cursor)
@@ -0,0 +1,434 @@
+"""
+Asyncio service layer for managing tasks.
+This module mirrors task_services for the opt-in async mode, using AsyncSession, httpx and redis.asyncio
+so request handlers never block the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from redis import RedisError
+from redis.asyncio import from_url
+from sqlalchemy import Row, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.task_cache import UserValidationCache
+from app.task_db import Task
+from app.task_events import TASK_CREATED, TASK_DELETED, TASK_UPDATED, TaskEvents
+from app.task_http import CircuitBreaker, RetryPolicy
+from app.task_metrics import AsyncTimedRedis
+from app.task_services import (TASK_CACHE_TTL, TASK_FIELDS, StatusFilter, TaskNotFound, UserClient, decode_cursor,
+                               encode_cursor, task_cache_key, task_filters, task_row_query, task_to_dict, user_exists,
+                               user_service_call)
+from app.task_stats import TaskStats
+from app.task_versions import ChangeVersions
+
+
+class AsyncNullCache:
+    """
+    Asyncio counterpart of NullCache, used when Redis is not available.
+    """
+    async def get(self, key):
+        """
+        Get a key from the void cache, which is always a miss.
+        """
+        _ = key
+
+    async def setex(self, key, ttl, value):
+        """
+        Set a key with an expiration time in the void.
+        """
+        _ = (key, ttl, value)
+
+    async def delete(self, key):
+        """
+        Delete a key from the void cache.
+        """
+        _ = key
+
+    async def aclose(self):
+        """
+        Nothing to release for the void cache.
+        """
+
+
+def connect_async_redis(redis_url: Optional[str] = None):
+    """
+    Builds an asyncio Redis client from the given URL or the REDIS_URL environment variable.
+    Args:
+        redis_url (Optional[str]): Redis connection URL. Defaults to REDIS_URL.
+    Returns:
+        An asyncio Redis client timing its commands, or an AsyncNullCache when no URL is configured or the URL
+        is invalid.
+    """
+    redis_url = redis_url or os.getenv("REDIS_URL")
+    if not redis_url:
+        return AsyncNullCache()
+    try:
+        return AsyncTimedRedis(from_url(redis_url))
+    except (ValueError, RedisError) as e:
+        logging.error("Error while trying to connect to redis: %s", e)
+        return AsyncNullCache()
+
+
+class AsyncUserClient:
+    """
+    Asyncio client for the User Service, with the same cache, retry and circuit breaker behaviour
+    as UserClient. Concurrent misses for one user share a single upstream call.
+    """
+    RETRYABLE_STATUSES = UserClient.RETRYABLE_STATUSES
+
+    def __init__(self, base_url: Optional[str] = None, http_client: Optional[httpx.AsyncClient] = None,
+                 cache: Optional[UserValidationCache] = None, retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Initializes the AsyncUserClient.
+        Args:
+            base_url (Optional[str]): Base URL for the User Service.
+                                     Defaults to USER_SERVICE_URL environment variable.
+            http_client (Optional[httpx.AsyncClient]): Pooled keep-alive client. Defaults to a new one.
+            cache (Optional[UserValidationCache]): Cache of validation results. Disabled when None.
+            retry_policy (Optional[RetryPolicy]): Retry schedule for failed attempts.
+            breaker (Optional[CircuitBreaker]): Circuit breaker guarding the User Service.
+        """
+        self.base_url = base_url or os.getenv("USER_SERVICE_URL")
+        self.http_client = http_client or httpx.AsyncClient(timeout=httpx.Timeout(3.0, connect=1.0))
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self._inflight: Dict[int, asyncio.Future] = {}
+
+    @classmethod
+    def from_env(cls, cache: Optional[UserValidationCache] = None) -> "AsyncUserClient":
+        """
+        Builds a client configured by the same USER_SERVICE_* environment variables as UserClient.
+        Args:
+            cache (Optional[UserValidationCache]): Cache of validation results.
+        Returns:
+            AsyncUserClient: The configured client.
+        """
+        pool_size = int(os.getenv("USER_SERVICE_POOL_SIZE", "10"))
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("USER_SERVICE_READ_TIMEOUT", "3.0")),
+                                  connect=float(os.getenv("USER_SERVICE_CONNECT_TIMEOUT", "1.0"))),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        return cls(
+            http_client=http_client,
+            cache=cache,
+            retry_policy=RetryPolicy(retries=int(os.getenv("USER_SERVICE_RETRIES", "2")),
+                                     backoff=float(os.getenv("USER_SERVICE_RETRY_BACKOFF", "0.05"))),
+            breaker=CircuitBreaker(failure_threshold=int(os.getenv("USER_SERVICE_BREAKER_THRESHOLD", "5")),
+                                   reset_timeout=float(os.getenv("USER_SERVICE_BREAKER_RESET", "30"))),
+        )
+
+    async def validate_user(self, user_id: int) -> bool:
+        """
+        Validates if a user exists, consulting the cache before calling the User Service.
+        Args:
+            user_id (int): ID of the user to validate.
+        Returns:
+            bool: True if user exists, False otherwise.
+        Raises:
+            UserServiceUnavailable: If the User Service cannot be reached.
+        """
+        if self.cache is not None:
+            cached = self.cache.peek(user_id)
+            if cached is not None:
+                return cached
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            return bool(await asyncio.shield(inflight))
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            value = await self._fetch_user(user_id)
+            if self.cache is not None:
+                self.cache.store(user_id, value)
+            future.set_result(value)
+            return bool(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[user_id]
+
+    async def aclose(self) -> None:
+        """
+        Closes the pooled HTTP connections.
+        """
+        await self.http_client.aclose()
+
+    async def _fetch_user(self, user_id: int) -> Optional[bool]:
+        """
+        Asks the User Service whether a user exists.
+        Args:
+            user_id (int): ID of the user to look up.
+        Returns:
+            Optional[bool]: True on 200, False on 404, None for any other answer.
+        """
+        return user_exists((await self._request("GET", f"/users/{user_id}")).status_code)
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Sends a request through the circuit breaker, retrying transient failures.
+        Args:
+            method (str): HTTP method.
+            path (str): Path relative to the base URL.
+            **kwargs: Extra arguments passed to the HTTP client.
+        Returns:
+            httpx.Response: The first non-retryable response.
+        Raises:
+            UserServiceUnavailable: If the circuit is open, every attempt failed or the request was malformed.
+        """
+        url = f"{self.base_url}{path}"
+        return await user_service_call(self.breaker, self.retry_policy).send_async(
+            lambda: self.http_client.request(method, url, **kwargs), (httpx.TransportError,),
+            (httpx.HTTPError, httpx.InvalidURL))
+
+
+class AsyncTaskService:
+    """
+    Asyncio service class for task-related business logic.
+    """
+    def __init__(self, db: AsyncSession, user_client: Optional[AsyncUserClient] = None, redis_client=None,
+                 stats: Optional[TaskStats] = None, versions: Optional[ChangeVersions] = None,
+                 events: Optional[TaskEvents] = None):
+        """
+        Initializes the AsyncTaskService.
+        Args:
+            db (AsyncSession): SQLAlchemy asyncio session.
+            user_client (Optional[AsyncUserClient]): Client for user validation.
+            redis_client: Asyncio Redis client for caching. Defaults to connecting via REDIS_URL.
+            stats (Optional[TaskStats]): Task counters, updated off the event loop. Without them,
+                                         writes are only counted by the next reconcile.
+            versions (Optional[ChangeVersions]): Change versions behind the ETags, bumped off the event loop.
+                                                 Without them, listings are served untagged.
+            events (Optional[TaskEvents]): Change feed publisher, called off the event loop.
+                                           Without it, writes are not announced on the feed.
+        """
+        self.db = db
+        self.user_client = user_client or AsyncUserClient()
+        self.redis_client = redis_client if redis_client is not None else connect_async_redis()
+        self.stats = stats
+        self.versions = versions
+        self.events = events
+
+    async def create_task(self, title: str, user_id: int, due_date: datetime) -> Task:
+        """
+        Creates a new task after validating the user.
+        Args:
+            title (str): Task title.
+            user_id (int): ID of the user who owns the task.
+            due_date (datetime): Task deadline.
+        Returns:
+            Task: The created Task object.
+        Raises:
+            ValueError: If the user is unknown.
+            UserServiceUnavailable: If the User Service cannot be reached.
+        """
+        if not await self.user_client.validate_user(user_id):
+            raise ValueError("Unknown user")
+        task = Task(title=title, user_id=user_id, due_date=due_date)
+        self.db.add(task)
+        await self.db.commit()
+        await self.db.refresh(task)
+        await self._bump(task.id, task.user_id)
+        await self._cache_task(task)
+        await self._record(TaskStats.record_created, [(task.status, task.user_id)])
+        await self._publish(TASK_CREATED, task_to_dict(task))
+        return task
+
+    async def update_task_status(self, task_id: int, status: str) -> Task:
+        """
+        Updates the status of an existing task.
+        Args:
+            task_id (int): ID of the task to update.
+            status (str): New status.
+        Returns:
+            Task: The updated Task object.
+        Raises:
+            TaskNotFound: If the task is not found.
+        """
+        task = await self.db.get(Task, task_id)
+        if not task:
+            raise TaskNotFound("Task not found")
+        previous = task.status
+        task.status = status
+        await self.db.commit()
+        await self.db.refresh(task)
+        await self._bump(task.id, task.user_id)
+        await self._cache_task(task)
+        if previous != status:
+            await self._record(TaskStats.record_status_change, {previous: 1}, status)
+        await self._publish(TASK_UPDATED, task_to_dict(task))
+        return task
+
+    async def delete_task(self, task_id: int) -> None:
+        """
+        Deletes a task and removes it from cache.
+        Args:
+            task_id (int): ID of the task to delete.
+        Raises:
+            TaskNotFound: If the task is not found.
+        """
+        task = await self.db.get(Task, task_id)
+        if not task:
+            raise TaskNotFound("Task not found")
+        counted = (task.status, task.user_id)
+        await self.db.delete(task)
+        await self.db.commit()
+        await self._bump(task_id, counted[1])
+        try:
+            await self.redis_client.delete(task_cache_key(task_id))
+        except RedisError:
+            logging.error("Failed to delete task from redis cache")
+        await self._record(TaskStats.record_deleted, [counted])
+        await self._publish(TASK_DELETED, {"id": task_id, "status": counted[0], "user_id": counted[1]})
+
+    async def list_tasks(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                         user_id: Optional[int] = None) -> List[Task]:
+        """
+        Lists tasks with optional status, due date and owner filters.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+        Returns:
+            List[Task]: List of Task objects.
+        """
+        result = await self.db.scalars(select(Task).where(*task_filters(status, due_before, user_id)))
+        return list(result)
+
+    async def list_tasks_page(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                              user_id: Optional[int] = None, limit: int = 100,
+                              cursor: Optional[str] = None) -> Tuple[List[Task], Optional[str]]:
+        """
+        Lists one page of tasks ordered by (due_date, id) using keyset pagination.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            limit (int): Maximum number of tasks in the page.
+            cursor (Optional[str]): Opaque cursor returned with the previous page.
+        Returns:
+            Tuple[List[Task], Optional[str]]: The page and the cursor of the next one, if any.
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        query = select(Task).where(*task_filters(status, due_before, user_id)).order_by(Task.due_date, Task.id)
+        if cursor:
+            query = query.where(tuple_(Task.due_date, Task.id) > tuple_(*decode_cursor(cursor)))
+        tasks = list(await self.db.scalars(query.limit(limit + 1)))
+        if len(tasks) <= limit:
+            return tasks, None
+        return tasks[:limit], encode_cursor(tasks[limit - 1])
+
+    async def iter_tasks(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                         user_id: Optional[int] = None, chunk_size: int = 500) -> AsyncIterator[Task]:
+        """
+        Iterates over matching tasks ordered by (due_date, id), fetching chunk_size rows at a time.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            chunk_size (int): Number of rows buffered per fetch.
+        Returns:
+            AsyncIterator[Task]: Matching tasks.
+        """
+        query = select(Task).where(*task_filters(status, due_before, user_id)).order_by(Task.due_date, Task.id)
+        result = await self.db.stream_scalars(query.execution_options(yield_per=chunk_size))
+        async for task in result:
+            yield task
+
+    async def list_task_rows(self, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                             due_before: Optional[datetime] = None, user_id: Optional[int] = None, limit: int = 100,
+                             cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+        """
+        Lean variant of list_tasks_page that selects only the requested columns as plain rows.
+        Args:
+            fields (Sequence[str]): Columns to select; they lead each row in this order.
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            limit (int): Maximum number of rows in the page.
+            cursor (Optional[str]): Opaque cursor returned with the previous page.
+        Returns:
+            Tuple[List[Row], Optional[str]]: The page and the cursor of the next one, if any.
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        query = task_row_query(fields, status, due_before, user_id)
+        if cursor:
+            query = query.where(tuple_(Task.due_date, Task.id) > tuple_(*decode_cursor(cursor)))
+        rows = (await self.db.execute(query.limit(limit + 1))).all()
+        if len(rows) <= limit:
+            return rows, None
+        return rows[:limit], encode_cursor(rows[limit - 1])
+
+    async def iter_task_rows(self, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                             due_before: Optional[datetime] = None, user_id: Optional[int] = None,
+                             chunk_size: int = 500) -> AsyncIterator[Row]:
+        """
+        Lean variant of iter_tasks yielding projected rows, fetched chunk_size at a time.
+        Args:
+            fields (Sequence[str]): Columns to select; they lead each row in this order.
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            chunk_size (int): Number of rows buffered per fetch.
+        Returns:
+            AsyncIterator[Row]: Matching rows.
+        """
+        query = task_row_query(fields, status, due_before, user_id).execution_options(yield_per=chunk_size)
+        async for row in await self.db.stream(query):
+            yield row
+
+    async def _cache_task(self, task: Task) -> None:
+        """
+        Caches the serialized task in Redis, replacing any previous version.
+        Args:
+            task (Task): Task to cache.
+        """
+        try:
+            await self.redis_client.setex(task_cache_key(task.id), TASK_CACHE_TTL, json.dumps(task_to_dict(task)))
+        except RedisError:
+            logging.error("Failed to cache task in redis")
+
+    async def _record(self, method, *args) -> None:
+        """
+        Applies a counter update in a worker thread, since the counters use the synchronous Redis client.
+        Args:
+            method: Unbound TaskStats method to call.
+            *args: Arguments of the method.
+        """
+        if self.stats is not None:
+            await asyncio.to_thread(method, self.stats, *args)
+
+    async def _bump(self, task_id: int, user_id: int) -> None:
+        """
+        Bumps the change versions of a written task in a worker thread, like the counters.
+        Args:
+            task_id (int): ID of the task.
+            user_id (int): Owner of the task.
+        """
+        if self.versions is not None:
+            await asyncio.to_thread(self.versions.bump, [task_id], [user_id])
+
+    async def _publish(self, kind: str, payload: dict) -> None:
+        """
+        Announces a written task on the change feed in a worker thread, like the counters.
+        Args:
+            kind (str): TASK_CREATED, TASK_UPDATED or TASK_DELETED.
+            payload (dict): Serialized task.
+        """
+        if self.events is not None:
+            await asyncio.to_thread(self.events.publish, kind, [payload])
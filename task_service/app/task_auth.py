@@ -0,0 +1,76 @@
+"""
+In-process verification of the access tokens issued by the User Service.
+This module checks token signatures and expiry locally, so resolving the caller of a request
+needs no network call, and keeps recently verified tokens in a small LRU cache.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Callable, Optional, Tuple
+
+from app.task_cache import MISSING, TTLCache
+
+
+class InvalidToken(ValueError):
+    """
+    Raised when a token is malformed, forged or expired.
+    """
+
+
+class TokenVerifier:
+    """
+    Verifies tokens signed with the secret shared with the User Service.
+    """
+    def __init__(self, secret: Optional[str] = None, max_age: Optional[int] = None, cache_size: int = 4096,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initializes the verifier.
+        Args:
+            secret (Optional[str]): Signing secret. Defaults to JWT_SECRET.
+            max_age (Optional[int]): Lifetime in seconds of tokens that carry no expiry.
+                                     Defaults to JWT_TTL_SECONDS.
+            cache_size (int): Number of verified tokens remembered.
+            clock (Callable[[], float]): Wall-clock time source, injectable for tests.
+        """
+        self.secret = (secret or os.getenv("JWT_SECRET", "dev-secret")).encode("utf-8")
+        self.max_age = max_age if max_age is not None else int(os.getenv("JWT_TTL_SECONDS", "3600"))
+        self._clock = clock
+        self._verified = TTLCache(maxsize=cache_size, clock=clock)
+
+    def verify_token(self, token: str) -> int:
+        """
+        Returns the user id carried by a valid token.
+        A cached token is trusted until its own expiry, so repeat calls skip the HMAC entirely.
+        Args:
+            token (str): Token as issued by the User Service.
+        Returns:
+            int: ID of the user the token was issued to.
+        Raises:
+            InvalidToken: If the token is malformed, its signature does not match or it expired.
+        """
+        user_id = self._verified.get(token)
+        if user_id is not MISSING:
+            return user_id
+        user_id, expires_at = self._decode(token)
+        remaining = expires_at - self._clock()
+        if remaining <= 0:
+            raise InvalidToken("Token expired")
+        self._verified.set(token, user_id, remaining)
+        return user_id
+
+    def _decode(self, token: str) -> Tuple[int, float]:
+        try:
+            body_hex, signature = token.split(".")
+            body = bytes.fromhex(body_hex)
+        except ValueError as exc:
+            raise InvalidToken("Malformed token") from exc
+        expected = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            raise InvalidToken("Invalid token signature")
+        try:
+            payload = json.loads(body)
+            return int(payload["user_id"]), float(payload.get("exp", payload["iat"] + self.max_age))
+        except (ValueError, KeyError, TypeError) as exc:
+            raise InvalidToken("Malformed token") from exc
@@ -0,0 +1,351 @@
+"""
+In-process caching primitives for the Task Service.
+This module provides a bounded TTL/LRU cache, single-flight call coalescing and the two-tier
+cache used by the user client to avoid calling the User Service on every task creation.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from redis import RedisError
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire after a per-entry TTL.
+    """
+    def __init__(self, maxsize: int = 1024, clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes the cache.
+        Args:
+            maxsize (int): Maximum number of entries kept; the least recently used is evicted first.
+            clock (Callable[[], float]): Monotonic time source, injectable for tests.
+        """
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=MISSING):
+        """
+        Returns the cached value for a key, or the default when absent or expired.
+        Args:
+            key (Hashable): Cache key.
+            default: Value returned on a miss. Defaults to the MISSING sentinel.
+        Returns:
+            The cached value or the default.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value, ttl: float) -> None:
+        """
+        Stores a value, evicting the least recently used entry when full.
+        Args:
+            key (Hashable): Cache key.
+            value: Value to store.
+            ttl (float): Time to live in seconds.
+        """
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """
+        Removes a key if present.
+        Args:
+            key (Hashable): Cache key.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class _Call:
+    """
+    An in-flight call shared by every caller of the same key.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key so only one of them runs.
+    """
+    def __init__(self):
+        """
+        Initializes the registry of in-flight calls.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, func: Callable[[], object]):
+        """
+        Runs func for the key, or waits for the call already running for it.
+        Args:
+            key (Hashable): Key identifying the call.
+            func (Callable[[], object]): Function to run when no call is in flight.
+        Returns:
+            The result of the single underlying call.
+        Raises:
+            Exception: Whatever the underlying call raised.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class UserValidationCache:
+    """
+    Two-tier cache of user existence checks.
+    Results live in a local TTL/LRU cache backed by an optional Redis tier shared by all workers.
+    Unknown users are cached with a shorter TTL, and concurrent misses are coalesced.
+    """
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60.0, negative_ttl: float = 5.0,
+                 redis_client=None, key_prefix: str = "user:exists:",
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes the cache.
+        Args:
+            maxsize (int): Maximum number of users kept in process.
+            ttl (float): Seconds a known user stays cached.
+            negative_ttl (float): Seconds an unknown user stays cached.
+            redis_client: Optional Redis client for the shared tier.
+            key_prefix (str): Prefix of the shared tier keys.
+            clock (Callable[[], float]): Monotonic time source, injectable for tests.
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self._local = TTLCache(maxsize=maxsize, clock=clock)
+        self._flight = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "shared_hits": 0, "misses": 0}
+
+    @classmethod
+    def from_env(cls, redis_client=None) -> "UserValidationCache":
+        """
+        Builds a cache sized by USER_CACHE_SIZE, USER_CACHE_TTL and USER_CACHE_NEGATIVE_TTL.
+        Args:
+            redis_client: Optional Redis client for the shared tier.
+        Returns:
+            UserValidationCache: The configured cache.
+        """
+        return cls(maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+                   ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+                   negative_ttl=float(os.getenv("USER_CACHE_NEGATIVE_TTL", "5")),
+                   redis_client=redis_client)
+
+    def get_or_load(self, user_id: int, loader: Callable[[int], Optional[bool]]) -> Optional[bool]:
+        """
+        Returns whether a user exists, calling the loader only on a miss in both tiers.
+        Args:
+            user_id (int): ID of the user.
+            loader (Callable[[int], Optional[bool]]): Upstream lookup. None means the answer
+                                                      is unknown and must not be cached.
+        Returns:
+            Optional[bool]: True if the user exists, False if not, None if undetermined.
+        """
+        value = self._local.get(user_id)
+        if value is not MISSING:
+            self._count("hits" if value else "negative_hits")
+            return value
+        return self._flight.do(user_id, lambda: self._load(user_id, loader))
+
+    def get_or_load_many(self, user_ids: Iterable[int],
+                         loader: Callable[[List[int]], Dict[int, Optional[bool]]]) -> Dict[int, Optional[bool]]:
+        """
+        Resolves many users at once, calling the loader a single time for all misses of both tiers.
+        Args:
+            user_ids (Iterable[int]): IDs of the users.
+            loader (Callable[[List[int]], Dict[int, Optional[bool]]]): Batched upstream lookup.
+        Returns:
+            Dict[int, Optional[bool]]: Existence per user; None where the answer is undetermined.
+        """
+        results = {}
+        pending = []
+        for user_id in dict.fromkeys(user_ids):
+            value = self._local.get(user_id)
+            if value is MISSING:
+                pending.append(user_id)
+            else:
+                self._count("hits" if value else "negative_hits")
+                results[user_id] = value
+        missing = []
+        for user_id, value in zip(pending, self._shared_get_many(pending)):
+            if value is None:
+                missing.append(user_id)
+                continue
+            self._count("shared_hits")
+            self._local.set(user_id, value, self.ttl if value else self.negative_ttl)
+            results[user_id] = value
+        if missing:
+            self._count("misses", len(missing))
+            loaded = loader(missing)
+            known = {user_id: loaded[user_id] for user_id in missing if loaded.get(user_id) is not None}
+            for user_id, value in known.items():
+                self._local.set(user_id, value, self.ttl if value else self.negative_ttl)
+            self._shared_set_many(known)
+            results.update({user_id: loaded.get(user_id) for user_id in missing})
+        return results
+
+    def peek(self, user_id: int) -> Optional[bool]:
+        """
+        Returns the locally cached answer for a user without loading it.
+        Used by callers that load on their own, such as the asyncio client.
+        Args:
+            user_id (int): ID of the user.
+        Returns:
+            Optional[bool]: The cached answer, or None on a miss.
+        """
+        value = self._local.get(user_id)
+        if value is MISSING:
+            self._count("misses")
+            return None
+        self._count("hits" if value else "negative_hits")
+        return value
+
+    def store(self, user_id: int, value: Optional[bool]) -> None:
+        """
+        Caches a loaded answer locally; undetermined answers are ignored.
+        Args:
+            user_id (int): ID of the user.
+            value (Optional[bool]): Whether the user exists, or None if undetermined.
+        """
+        if value is not None:
+            self._local.set(user_id, value, self.ttl if value else self.negative_ttl)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drops a user from both tiers.
+        Args:
+            user_id (int): ID of the user.
+        """
+        self._local.delete(user_id)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(f"{self.key_prefix}{user_id}")
+            except RedisError as exc:
+                logging.warning("Failed to invalidate shared user cache: %s", exc)
+
+    def stats(self) -> dict:
+        """
+        Reports hit and miss counters along with the current local size.
+        Returns:
+            dict: Counters keyed by name.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["size"] = len(self._local)
+        return stats
+
+    def _load(self, user_id: int, loader: Callable[[int], Optional[bool]]) -> Optional[bool]:
+        value = self._local.get(user_id)
+        if value is not MISSING:
+            self._count("hits" if value else "negative_hits")
+            return value
+        value = self._shared_get(user_id)
+        if value is not None:
+            self._count("shared_hits")
+        else:
+            self._count("misses")
+            value = loader(user_id)
+            if value is None:
+                return None
+            self._shared_set(user_id, value)
+        self._local.set(user_id, value, self.ttl if value else self.negative_ttl)
+        return value
+
+    def _shared_get(self, user_id: int) -> Optional[bool]:
+        if self.redis_client is None:
+            return None
+        try:
+            raw = self.redis_client.get(f"{self.key_prefix}{user_id}")
+        except RedisError as exc:
+            logging.warning("Failed to read shared user cache: %s", exc)
+            return None
+        if raw is None:
+            return None
+        return raw in (b"1", "1")
+
+    def _shared_set(self, user_id: int, value: bool) -> None:
+        if self.redis_client is None:
+            return
+        ttl = self.ttl if value else self.negative_ttl
+        try:
+            self.redis_client.setex(f"{self.key_prefix}{user_id}", max(1, int(ttl)), "1" if value else "0")
+        except RedisError as exc:
+            logging.warning("Failed to write shared user cache: %s", exc)
+
+    def _shared_get_many(self, user_ids: List[int]) -> List[Optional[bool]]:
+        if self.redis_client is None or not user_ids:
+            return [None] * len(user_ids)
+        try:
+            raws = self.redis_client.mget([f"{self.key_prefix}{user_id}" for user_id in user_ids])
+        except RedisError as exc:
+            logging.warning("Failed to read shared user cache: %s", exc)
+            return [None] * len(user_ids)
+        return [None if raw is None else raw in (b"1", "1") for raw in raws]
+
+    def _shared_set_many(self, values: Dict[int, bool]) -> None:
+        if self.redis_client is None or not values:
+            return
+        try:
+            pipe = self.redis_client.pipeline()
+            for user_id, value in values.items():
+                ttl = self.ttl if value else self.negative_ttl
+                pipe.setex(f"{self.key_prefix}{user_id}", max(1, int(ttl)), "1" if value else "0")
+            pipe.execute()
+        except RedisError as exc:
+            logging.warning("Failed to write shared user cache: %s", exc)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
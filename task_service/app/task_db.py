@@ -3,17 +3,132 @@ Database configuration and models for the Task Service.
 This module handles SQLAlchemy engine creation, session management, and task entity definitions.
 """
 import os
+import threading
+import time
 from datetime import datetime
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
-from sqlalchemy import Column, DateTime, Integer, String, StaticPool
-from sqlalchemy import create_engine
+from sqlalchemy import AsyncAdaptedQueuePool, Column, DateTime, Index, Integer, QueuePool, String, StaticPool
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session, DeclarativeBase
 
+from app.task_metrics import instrument_engine
+
 load_dotenv()
 
 TASK_DATABASE_URL = os.getenv("TASK_DATABASE_URL")
-DISABLE_CHECK_SAME_THREAD = os.getenv("DISABLE_CHECK_SAME_THREAD")
+DISABLE_CHECK_SAME_THREAD = os.getenv("DISABLE_CHECK_SAME_THREAD", "false")
+ASYNC_MODE = os.getenv("ASYNC_MODE", "false").lower() == "true"
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+WAIT_EWMA_WEIGHT = 0.2
+
+TITLE_SEARCH_TABLE = "tasks_fts"
+TITLE_SEARCH_INDEX = "ix_tasks_title_search"
+TITLE_SEARCH_CONFIG = "simple"
+
+
+class TimedPoolMixin:
+    """
+    Pool mixin that records how long each checkout waited for a connection, and how many are waiting.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._wait_recent = 0.0
+        self._wait_recent_at = time.perf_counter()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        with self._wait_lock:
+            self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            now = time.perf_counter()
+            waited = now - start
+            with self._wait_lock:
+                self.waiting -= 1
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                self._wait_recent = self.recent_wait(now) * (1 - WAIT_EWMA_WEIGHT) + waited * WAIT_EWMA_WEIGHT
+                self._wait_recent_at = now
+
+    def recent_wait(self, now: Optional[float] = None) -> float:
+        """
+        Returns the moving average of checkout waits, halved for every second without a checkout
+        so that it recovers once requests stop reaching the pool.
+        Args:
+            now (Optional[float]): perf_counter reading to decay to. Defaults to the current one.
+        Returns:
+            float: Recent checkout wait in seconds.
+        """
+        elapsed = (time.perf_counter() if now is None else now) - self._wait_recent_at
+        return self._wait_recent * 0.5 ** max(elapsed, 0.0)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    """
+    QueuePool that records checkout waits.
+    """
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    """
+    Asyncio-compatible QueuePool that records checkout waits.
+    """
+
+
+def pool_options(url: str, poolclass=TimedQueuePool) -> dict:
+    """
+    Builds engine pool options from the DB_POOL_* and DB_STATEMENT_TIMEOUT_MS environment variables.
+    SQLite keeps SQLAlchemy's default pool; the statement timeout only applies to PostgreSQL.
+    Args:
+        url (str): Database URL.
+        poolclass: Queue pool class used for server databases.
+    Returns:
+        dict: Keyword arguments for create_engine or create_async_engine.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    options = {"pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"}
+    if backend == "sqlite":
+        return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "-1")),
+    )
+    statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout and backend == "postgresql":
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(int(statement_timeout))}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={int(statement_timeout)}"}
+    return options
+
+
+def async_url(url: str) -> str:
+    """
+    Rewrites a database URL to use the asyncio driver of its backend.
+    Args:
+        url (str): Synchronous database URL.
+    Returns:
+        str: URL using aiosqlite for SQLite or asyncpg for PostgreSQL.
+    """
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
 
 ENGINE = None
 
@@ -21,10 +136,14 @@ if DISABLE_CHECK_SAME_THREAD.lower() == "true":
     extra_args = {"check_same_thread": False}
     ENGINE = create_engine(TASK_DATABASE_URL, poolclass=StaticPool, connect_args=extra_args)
 else:
-    ENGINE = create_engine(TASK_DATABASE_URL)
+    ENGINE = create_engine(TASK_DATABASE_URL, **pool_options(TASK_DATABASE_URL))
+instrument_engine(ENGINE)
 
 SESSION_LOCAL = sessionmaker(autocommit=False, autoflush=False, bind=ENGINE)
 
+# Engines of shards 1 and up (see task_shards), whose pools are reported and shed on along with ENGINE's.
+SHARD_ENGINES: List[Engine] = []
+
 
 class Base(DeclarativeBase):
     """
@@ -36,26 +155,236 @@ class Base(DeclarativeBase):
 class Task(Base):
     """
     SQLAlchemy model representing a task entity in the database.
+    Composite indexes back the list filters: per owner with status and deadline, per status
+    with deadline, and the (due_date, id) keyset used for pagination.
     """
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_user_status_due", "user_id", "status", "due_date"),
+        Index("ix_tasks_status_due", "status", "due_date"),
+        Index("ix_tasks_due_id", "due_date", "id"),
+        # Lets each shard start its ids at its own range (see task_shards).
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     status = Column(String, default="pending", nullable=False)
     due_date = Column(DateTime, default=datetime.now())
-    user_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+
+
+class SchedulerMark(Base):
+    """
+    Progress of a background scan, persisted so a restart resumes where the last tick stopped.
+    scanned_until is the due date high-water mark; last_task_id is the highest task id already seen.
+    """
+    __tablename__ = "task_scheduler_marks"
+
+    name = Column(String, primary_key=True)
+    scanned_until = Column(DateTime, nullable=True)
+    last_task_id = Column(Integer, nullable=False, default=0)
+
+
+# Indexes of earlier schemas made redundant by the composite ones of Task.
+_SUPERSEDED_INDEXES = ("ix_tasks_user_id",)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_missing_indexes(_target, connection, **_kw) -> None:
+    """
+    Brings the indexes of an existing tasks table in line with the model after every create_all.
+    create_all only indexes the tables it creates, so a database created before an index was added to
+    Task gets it here, and loses the indexes it superseded.
+    Args:
+        _target: The metadata being created.
+        connection: Connection running the DDL.
+    """
+    for index in Task.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    for name in _SUPERSEDED_INDEXES:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+_SQLITE_TITLE_SEARCH = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TITLE_SEARCH_TABLE} USING fts5(title, content='tasks', content_rowid='id')",
+    f"""CREATE TRIGGER IF NOT EXISTS {TITLE_SEARCH_TABLE}_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO {TITLE_SEARCH_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TITLE_SEARCH_TABLE}_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO {TITLE_SEARCH_TABLE}({TITLE_SEARCH_TABLE}, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TITLE_SEARCH_TABLE}_update AFTER UPDATE OF title ON tasks BEGIN
+        INSERT INTO {TITLE_SEARCH_TABLE}({TITLE_SEARCH_TABLE}, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO {TITLE_SEARCH_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END""",
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_title_search(_target, connection, **_kw) -> None:
+    """
+    Creates the full-text index over task titles after every create_all, when it is missing, including
+    for a tasks table that create_all found already there. SQLite gets an FTS5 table whose content is the
+    tasks table itself, kept in step by triggers, so it follows bulk statements too; when it is added to
+    existing tasks it is built from them. PostgreSQL gets a GIN index over the title's tsvector. Other
+    dialects have no index and search scans the table.
+    Args:
+        _target: The metadata being created.
+        connection: Connection running the DDL.
+    """
+    if connection.dialect.name == "sqlite":
+        exists = connection.exec_driver_sql(
+            f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{TITLE_SEARCH_TABLE}'").first()
+        for statement in _SQLITE_TITLE_SEARCH:
+            connection.exec_driver_sql(statement)
+        if exists is None:
+            connection.exec_driver_sql(f"INSERT INTO {TITLE_SEARCH_TABLE}({TITLE_SEARCH_TABLE}) VALUES ('rebuild')")
+    elif connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS {TITLE_SEARCH_INDEX} ON tasks "
+            f"USING gin (to_tsvector('{TITLE_SEARCH_CONFIG}'::regconfig, title))")
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def drop_title_search(_target, connection, **_kw) -> None:
+    """
+    Drops the SQLite FTS5 table with the tasks table; its triggers and the PostgreSQL index go with the table.
+    Args:
+        _target: The metadata being dropped.
+        connection: Connection running the DDL.
+    """
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {TITLE_SEARCH_TABLE}")
+
+
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_READY = False
+_ASYNC_ENGINE = None
+_ASYNC_SESSION_LOCAL = None
+_ASYNC_SCHEMA_READY = False
+
+
+def init_db() -> None:
+    """
+    Creates the tables once per process.
+    Called from the application lifespan; later calls are a flag check.
+    """
+    global _SCHEMA_READY  # pylint: disable=global-statement
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if not _SCHEMA_READY:
+            Base.metadata.create_all(bind=ENGINE)
+            _SCHEMA_READY = True
+
+
+def pool_stats() -> dict:
+    """
+    Reports connection pool occupancy and checkout wait times, over the pools of every shard.
+    Returns:
+        dict: Pool status, and for queue pools the size, saturation and wait statistics, added up.
+    """
+    pools = [engine.pool for engine in (ENGINE, *SHARD_ENGINES)]
+    stats = {"status": "; ".join(pool.status() for pool in pools)}
+    timed = [pool for pool in pools if isinstance(pool, TimedPoolMixin)]
+    if timed:
+        capacity = sum(pool.size() + max(pool._max_overflow, 0) for pool in timed)  # pylint: disable=protected-access
+        checked_out = sum(pool.checkedout() for pool in timed)
+        checkouts = sum(pool.checkouts for pool in timed)
+        stats.update(
+            size=sum(pool.size() for pool in timed),
+            checked_out=checked_out,
+            overflow=sum(pool.overflow() for pool in timed),
+            saturation=checked_out / capacity if capacity else 0.0,
+            checkouts=checkouts,
+            wait_avg_ms=sum(pool.wait_total for pool in timed) / checkouts * 1000 if checkouts else 0.0,
+            wait_max_ms=max(pool.wait_max for pool in timed) * 1000,
+            waiting=sum(pool.waiting for pool in timed),
+            wait_recent_ms=max(pool.recent_wait() for pool in timed) * 1000,
+        )
+    return stats
+
+
+def pool_pressure() -> Tuple[int, float]:
+    """
+    Reports how contended the most contended connection pool is right now, for load shedding.
+    Returns:
+        Tuple[int, float]: Checkouts in progress and recent checkout wait in seconds, the highest over the
+                           shards; zeros for other pools.
+    """
+    timed = [engine.pool for engine in (ENGINE, *SHARD_ENGINES) if isinstance(engine.pool, TimedPoolMixin)]
+    if not timed:
+        return 0, 0.0
+    return max(pool.waiting for pool in timed), max(pool.recent_wait() for pool in timed)
+
+
+def dispose_engines(close: bool = True) -> None:
+    """
+    Empties the connection pools; the engines open new connections on next use.
+    The launcher calls it before forking workers, and with close=False in each worker, which must not
+    close connections it inherited from the supervisor but may not reuse them either.
+    Args:
+        close (bool): Whether to close the pooled connections, or only drop them.
+    """
+    ENGINE.dispose(close=close)
+    if _ASYNC_ENGINE is not None:
+        # Asyncio connections can only be closed from their event loop, so they are always dropped.
+        _ASYNC_ENGINE.sync_engine.dispose(close=False)
 
 
 def get_task_db() -> Session:
     """
     Dependency to provide a database session for each request.
-    Ensures all tables are created and handles session cleanup.
+    Makes sure the schema exists (once per process) and handles session cleanup.
     Yields:
         Session: A SQLAlchemy database session.
     """
-    Base.metadata.create_all(bind=ENGINE)
+    init_db()
     db = SESSION_LOCAL()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Returns the asyncio engine, creating it on first use so the async drivers are only
+    needed when async mode is enabled.
+    Returns:
+        AsyncEngine: The asyncio engine for TASK_DATABASE_URL.
+    """
+    global _ASYNC_ENGINE, _ASYNC_SESSION_LOCAL  # pylint: disable=global-statement
+    if _ASYNC_ENGINE is None:
+        url = async_url(TASK_DATABASE_URL)
+        if DISABLE_CHECK_SAME_THREAD.lower() == "true":
+            _ASYNC_ENGINE = create_async_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+        else:
+            _ASYNC_ENGINE = create_async_engine(url, **pool_options(url, poolclass=TimedAsyncQueuePool))
+        instrument_engine(_ASYNC_ENGINE.sync_engine)
+        _ASYNC_SESSION_LOCAL = async_sessionmaker(bind=_ASYNC_ENGINE, autoflush=False, expire_on_commit=False)
+    return _ASYNC_ENGINE
+
+
+async def init_async_db() -> None:
+    """
+    Creates the tables through the asyncio engine once per process.
+    """
+    global _ASYNC_SCHEMA_READY  # pylint: disable=global-statement
+    if _ASYNC_SCHEMA_READY:
+        return
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    _ASYNC_SCHEMA_READY = True
+
+
+async def get_async_task_db() -> AsyncSession:
+    """
+    Dependency to provide an asyncio database session for each request.
+    Yields:
+        AsyncSession: A SQLAlchemy asyncio session.
+    """
+    await init_async_db()
+    async with _ASYNC_SESSION_LOCAL() as db:
+        yield db
@@ -0,0 +1,399 @@
+"""
+Change feed of the Task Service, served as server-sent events on GET /tasks/events.
+Writes append one entry per created, updated or deleted task to a capped Redis stream after their commit.
+Each process runs one reader thread following the stream and keeps the latest entries in a bounded replay
+buffer; every SSE connection of the process reads that buffer from its own cursor and is woken when it
+grows. Stream ids are the SSE event ids, ordered across processes, so a client reconnecting to any worker
+resumes after its Last-Event-ID. A connection that falls behind slows only itself: it keeps reading the
+buffer at the pace its socket accepts, and when the events it missed left the buffer it is told to reload.
+Streams are closed after a maximum age; clients reconnect on their own and land on any worker.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from redis import RedisError
+
+from app.task_metrics import TimedRedis
+
+TASK_EVENTS_STREAM = "tasks:events"
+TASK_EVENTS_MAXLEN = int(os.getenv("TASK_EVENTS_MAXLEN", "10000"))
+TASK_CREATED = "task.created"
+TASK_UPDATED = "task.updated"
+TASK_DELETED = "task.deleted"
+RECONNECT_DELAY_MS = 2000
+
+EventKey = Tuple[int, int]
+_EVENT_ID = re.compile(r"^(\d+)-(\d+)$")
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[EventKey]:
+    """
+    Parses a stream id such as "1718000000000-3" into a comparable key.
+    Args:
+        event_id (Optional[str]): Stream id, e.g. from the Last-Event-ID header.
+    Returns:
+        Optional[EventKey]: (milliseconds, sequence), or None when absent or malformed.
+    """
+    match = _EVENT_ID.match((event_id or "").strip())
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def task_event_fields(kind: str, payload: dict) -> Dict[str, str]:
+    """
+    Builds the stream entry announcing a change to a task.
+    Args:
+        kind (str): TASK_CREATED, TASK_UPDATED or TASK_DELETED.
+        payload (dict): Serialized task; id, user_id and status are enough for a deletion.
+    Returns:
+        Dict[str, str]: Entry fields: the kind, owner and status used by the filters, and the JSON event data.
+    """
+    return {"type": kind, "user_id": str(payload["user_id"]), "status": payload["status"],
+            "data": json.dumps(payload)}
+
+
+class TaskEvents:
+    """
+    Publisher of the change feed entries.
+    """
+    def __init__(self, redis_client, maxlen: int = TASK_EVENTS_MAXLEN):
+        """
+        Initializes the publisher.
+        Args:
+            redis_client: Redis client holding the stream.
+            maxlen (int): Approximate number of entries the stream keeps.
+        """
+        self.redis_client = redis_client
+        self.maxlen = maxlen
+
+    def publish(self, kind: str, payloads: Sequence[dict]) -> None:
+        """
+        Appends one entry per task in a single pipeline. Must be called after the write committed.
+        Args:
+            kind (str): TASK_CREATED, TASK_UPDATED or TASK_DELETED.
+            payloads (Sequence[dict]): Serialized tasks. Nothing is sent when empty.
+        """
+        if not payloads:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            self.queue(pipe, kind, payloads)
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to publish task events to redis")
+
+    def queue(self, pipe, kind: str, payloads: Sequence[dict]) -> None:
+        """
+        Queues one entry per task on a pipeline the caller executes, along with its other commands.
+        Args:
+            pipe: Redis pipeline.
+            kind (str): TASK_CREATED, TASK_UPDATED or TASK_DELETED.
+            payloads (Sequence[dict]): Serialized tasks.
+        """
+        for payload in payloads:
+            pipe.xadd(TASK_EVENTS_STREAM, task_event_fields(kind, payload), maxlen=self.maxlen, approximate=True)
+
+
+class TaskEvent:
+    """
+    Entry of the change feed as read back from the stream.
+    """
+    __slots__ = ("event_id", "key", "kind", "user_id", "status", "data")
+
+    def __init__(self, event_id: str, fields: dict):
+        """
+        Decodes a stream entry.
+        Args:
+            event_id (str): Stream id of the entry.
+            fields (dict): Entry fields, as bytes or str.
+        """
+        fields = {_text(name): _text(value) for name, value in fields.items()}
+        self.event_id = event_id
+        self.key = parse_event_id(event_id)
+        self.kind = fields.get("type", "")
+        self.user_id = int(fields.get("user_id") or 0)
+        self.status = fields.get("status", "")
+        self.data = fields.get("data", "{}")
+
+    def matches(self, user_id: Optional[int], statuses: Set[str]) -> bool:
+        """
+        Tells whether the event passes a connection's filters.
+        Args:
+            user_id (Optional[int]): Owner to follow, or None for every owner.
+            statuses (Set[str]): Statuses to follow, empty for every status.
+        Returns:
+            bool: Whether to send the event.
+        """
+        return (user_id is None or self.user_id == user_id) and (not statuses or self.status in statuses)
+
+    def frame(self) -> str:
+        """
+        Returns the event in the text/event-stream format.
+        """
+        return f"id: {self.event_id}\nevent: {self.kind}\ndata: {self.data}\n\n"
+
+
+class FeedFull(RuntimeError):
+    """
+    Raised when a process already serves its maximum number of change feed connections.
+    """
+
+
+class FeedSubscription:
+    """
+    One SSE connection: its cursor in the feed and the asyncio event waking it up.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, cursor: EventKey):
+        """
+        Initializes the subscription.
+        Args:
+            loop (asyncio.AbstractEventLoop): Event loop serving the connection.
+            cursor (EventKey): Key of the last event the client has seen.
+        """
+        self.loop = loop
+        self.cursor = cursor
+        self.wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """
+        Wakes the connection up; safe to call from the reader thread.
+        """
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+
+class TaskEventFeed:
+    """
+    Per-process reader of the change feed stream, with the replay buffer the connections read from.
+    """
+    def __init__(self, redis_client, buffer_size: int = 1000, max_subscribers: int = 1000, heartbeat: float = 15.0,
+                 max_age: float = 300.0, block_ms: int = 2000, retry_interval: float = 1.0):
+        """
+        Initializes the feed.
+        Args:
+            redis_client: Redis client holding the stream.
+            buffer_size (int): Number of recent events kept for replay.
+            max_subscribers (int): Maximum number of connections served by this process.
+            heartbeat (float): Seconds of silence after which a comment keeps an idle connection open.
+            max_age (float): Seconds after which a connection is closed for the client to reconnect.
+            block_ms (int): Longest wait of one stream read, which bounds how long stopping takes.
+            retry_interval (float): Seconds to wait before reading again after a Redis failure.
+        """
+        self.redis_client = redis_client
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.block_ms = block_ms
+        self.retry_interval = retry_interval
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._floor: Optional[EventKey] = None
+        self._last_id: Optional[str] = None
+        self._subscribers: Set[FeedSubscription] = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, redis_client) -> "TaskEventFeed":
+        """
+        Builds the feed from the TASK_EVENTS_BUFFER, TASK_EVENTS_MAX_CONNECTIONS, TASK_EVENTS_HEARTBEAT and
+        TASK_EVENTS_MAX_AGE environment variables. Blocking reads bypass the command timings, since their
+        duration is the wait for new events.
+        Args:
+            redis_client: Redis client holding the stream.
+        Returns:
+            TaskEventFeed: The feed, not yet started.
+        """
+        return cls(redis_client.unwrapped if isinstance(redis_client, TimedRedis) else redis_client,
+                   buffer_size=int(os.getenv("TASK_EVENTS_BUFFER", "1000")),
+                   max_subscribers=int(os.getenv("TASK_EVENTS_MAX_CONNECTIONS", "1000")),
+                   heartbeat=float(os.getenv("TASK_EVENTS_HEARTBEAT", "15")),
+                   max_age=float(os.getenv("TASK_EVENTS_MAX_AGE", "300")))
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether the client can read streams; NullCache cannot, and the feed then stays empty.
+        """
+        return callable(getattr(self.redis_client, "xread", None))
+
+    @property
+    def last_key(self) -> EventKey:
+        """
+        Key of the newest event read so far, where connections without Last-Event-ID start.
+        """
+        with self._lock:
+            return self._buffer[-1].key if self._buffer else (self._floor or (0, 0))
+
+    def subscribe(self, cursor: Optional[EventKey] = None) -> FeedSubscription:
+        """
+        Registers a connection of the running event loop.
+        Args:
+            cursor (Optional[EventKey]): Last event the client has seen; defaults to the newest one.
+        Returns:
+            FeedSubscription: The subscription, to pass to unsubscribe when the connection ends.
+        Raises:
+            FeedFull: If the process serves max_subscribers connections already.
+        """
+        subscription = FeedSubscription(asyncio.get_running_loop(), cursor or self.last_key)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise FeedFull("Too many change feed connections")
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FeedSubscription) -> None:
+        """
+        Forgets a connection.
+        Args:
+            subscription (FeedSubscription): Subscription returned by subscribe.
+        """
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        """
+        Number of connections currently following the feed.
+        """
+        return len(self._subscribers)
+
+    def since(self, cursor: EventKey, limit: int = 500) -> Tuple[List[TaskEvent], bool]:
+        """
+        Returns the buffered events after a cursor, oldest first.
+        Args:
+            cursor (EventKey): Key of the last event the connection has seen.
+            limit (int): Maximum number of events returned.
+        Returns:
+            Tuple[List[TaskEvent], bool]: The events, and whether some events after the cursor already left
+                                          the buffer, in which case the client must reload its state.
+        """
+        with self._lock:
+            if self._floor is None:
+                return [], False
+            events = []
+            for event in reversed(self._buffer):
+                if event.key <= cursor:
+                    break
+                events.append(event)
+            missed = cursor < self._floor
+        events.reverse()
+        return events[:limit], missed
+
+    async def stream(self, subscription: FeedSubscription, user_id: Optional[int] = None,
+                     statuses: Set[str] = frozenset()) -> AsyncIterator[str]:
+        """
+        Yields the text/event-stream frames of one connection until max_age, then forgets the subscription.
+        Each wakeup sends every matching event after the cursor in one chunk. The cursor only moves once a
+        chunk was taken by the server, so a slow client holds back its own stream and nothing else.
+        Args:
+            subscription (FeedSubscription): Subscription returned by subscribe.
+            user_id (Optional[int]): Owner to follow, or None for every owner.
+            statuses (Set[str]): Statuses to follow, empty for every status.
+        Returns:
+            AsyncIterator[str]: The frames: the reconnection delay, the events, a reset event when some
+                                were missed and keep-alive comments.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_age
+        try:
+            yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+            while True:
+                subscription.wakeup.clear()
+                events, missed = self.since(subscription.cursor)
+                if missed:
+                    yield "event: reset\ndata: {}\n\n"
+                if events:
+                    subscription.cursor = events[-1].key
+                    frames = "".join(event.frame() for event in events if event.matches(user_id, statuses))
+                    if frames:
+                        yield frames
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(subscription.wakeup.wait(), min(self.heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def append(self, entries: Iterable[Tuple[str, dict]]) -> None:
+        """
+        Adds stream entries to the buffer and wakes every connection up.
+        Args:
+            entries (Iterable[Tuple[str, dict]]): (id, fields) pairs in stream order.
+        """
+        with self._lock:
+            for event_id, fields in entries:
+                event_id = _text(event_id)
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._floor = self._buffer[0].key
+                self._buffer.append(TaskEvent(event_id, fields))
+                self._last_id = event_id
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.notify()
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def read_once(self) -> int:
+        """
+        Reads the entries added since the last read, waiting up to block_ms for new ones.
+        The first read fills the buffer with the latest entries of the stream.
+        Returns:
+            int: Number of entries read.
+        """
+        if self._floor is None:
+            latest = self.redis_client.xrevrange(TASK_EVENTS_STREAM, count=self._buffer.maxlen)
+            entries = list(reversed(latest or []))
+            with self._lock:
+                # Older entries may exist only when the stream filled the whole buffer.
+                full = len(entries) == self._buffer.maxlen
+                self._floor = parse_event_id(_text(entries[0][0])) if full else (0, 0)
+                self._last_id = _text(entries[-1][0]) if entries else "0-0"
+            self.append(entries)
+            return len(entries)
+        response = self.redis_client.xread({TASK_EVENTS_STREAM: self._last_id}, count=500, block=self.block_ms)
+        entries = [entry for _, stream_entries in (response or []) for entry in stream_entries]
+        self.append(entries)
+        return len(entries)
+
+    def start(self) -> None:
+        """
+        Starts the reader thread, unless the client cannot read streams.
+        """
+        if not self.available or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="task-events", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stops the reader thread, waiting for the current read to return.
+        Args:
+            timeout (float): Maximum number of seconds to wait for the thread.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.read_once()
+            except RedisError as exc:
+                logging.error("Failed to read task events from redis: %s", exc)
+                self._stopping.wait(self.retry_interval)
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
@@ -0,0 +1,258 @@
+"""
+Outbound HTTP building blocks for the Task Service.
+This module provides pooled keep-alive sessions, a jittered retry policy, a circuit breaker and the
+guarded call combining them, used by clients of other services.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Iterator, Optional, Tuple, Type
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.task_metrics import record_http
+
+
+def build_session(pool_size: int = 10) -> requests.Session:
+    """
+    Builds a session that keeps up to pool_size connections alive per host.
+    Args:
+        pool_size (int): Maximum number of persistent connections per host.
+    Returns:
+        requests.Session: The pooled session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class RetryPolicy:
+    """
+    Bounded retry schedule with exponential backoff and full jitter.
+    """
+    def __init__(self, retries: int = 2, backoff: float = 0.05, max_backoff: float = 1.0,
+                 rng: Callable[[], float] = random.random):
+        """
+        Initializes the policy.
+        Args:
+            retries (int): Number of retries after the first attempt.
+            backoff (float): Base delay in seconds, doubled on every retry.
+            max_backoff (float): Upper bound of a single delay in seconds.
+            rng (Callable[[], float]): Source of jitter in [0, 1), injectable for tests.
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._rng = rng
+
+    def delays(self) -> Iterator[float]:
+        """
+        Yields the sleep before each retry.
+        Returns:
+            Iterator[float]: One delay per retry.
+        """
+        for attempt in range(self.retries):
+            yield self._rng() * min(self.max_backoff, self.backoff * (2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+    After failure_threshold consecutive failures the circuit opens and calls fail fast;
+    after reset_timeout one trial call is let through and its outcome closes or reopens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes the breaker in the closed state.
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds to stay open before allowing a trial call.
+            clock (Callable[[], float]): Monotonic time source, injectable for tests.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        """
+        Returns the current state, moving from open to half-open once the reset timeout elapsed.
+        """
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Tells whether a call may proceed.
+        Returns:
+            bool: True if the call may proceed, False if it must fail fast.
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """
+        Records a successful call and closes the circuit.
+        """
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """
+        Records a failed call, opening the circuit when the threshold is reached.
+        """
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+
+
+class GuardedCall:
+    """
+    One call to another service through its circuit breaker and retry policy.
+    send and send_async take the transport as a function sending one attempt and share every retry and
+    breaker decision. Whatever ends the call, including an unexpected error or the cancellation of an
+    asyncio call, settles the breaker, so a trial call in the half-open state never stays in flight.
+    """
+    def __init__(self, service: str, breaker: CircuitBreaker, retry_policy: RetryPolicy,
+                 retryable_statuses: frozenset, unavailable: Type[Exception] = RuntimeError):
+        """
+        Initializes the call.
+        Args:
+            service (str): Name of the service in metrics, such as "user_service"; error messages spell it
+                           "User service".
+            breaker (CircuitBreaker): Circuit breaker guarding the service.
+            retry_policy (RetryPolicy): Retry schedule for failed attempts.
+            retryable_statuses (frozenset): Response statuses retried like transport errors.
+            unavailable (Type[Exception]): Exception raised when the service gives no answer.
+        """
+        self.service = service
+        self.name = service.replace("_", " ").capitalize()
+        self.breaker = breaker
+        self.retryable_statuses = retryable_statuses
+        self.unavailable = unavailable
+        self._delays = retry_policy.delays()
+        self._settled = False
+
+    def send(self, attempt: Callable[[], requests.Response], transient: Tuple[Type[Exception], ...],
+             errors: Tuple[Type[Exception], ...], sleep: Callable[[float], None] = time.sleep):
+        """
+        Sends the call, retrying transient failures.
+        Args:
+            attempt (Callable[[], requests.Response]): Sends one attempt and returns its response.
+            transient (Tuple[Type[Exception], ...]): Transport errors worth retrying.
+            errors (Tuple[Type[Exception], ...]): Every transport error, failing the call when not transient.
+            sleep (Callable[[float], None]): Sleep function used between retries.
+        Returns:
+            The first non-retryable response.
+        Raises:
+            Exception: The unavailable exception if the circuit is open or the call failed.
+        """
+        self._allow()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = attempt()
+                except errors as exc:
+                    delay = self._failed(started, exc, isinstance(exc, transient))
+                else:
+                    delay = self._answered(started, response.status_code)
+                    if delay is None:
+                        return response
+                sleep(delay)
+        finally:
+            self._settle()
+
+    async def send_async(self, attempt: Callable[[], Awaitable], transient: Tuple[Type[Exception], ...],
+                         errors: Tuple[Type[Exception], ...]):
+        """
+        Sends the call from an asyncio task, retrying transient failures.
+        Args:
+            attempt (Callable[[], Awaitable]): Sends one attempt and returns an awaitable of its response.
+            transient (Tuple[Type[Exception], ...]): Transport errors worth retrying.
+            errors (Tuple[Type[Exception], ...]): Every transport error, failing the call when not transient.
+        Returns:
+            The first non-retryable response.
+        Raises:
+            Exception: The unavailable exception if the circuit is open or the call failed.
+        """
+        self._allow()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = await attempt()
+                except errors as exc:
+                    delay = self._failed(started, exc, isinstance(exc, transient))
+                else:
+                    delay = self._answered(started, response.status_code)
+                    if delay is None:
+                        return response
+                await asyncio.sleep(delay)
+        finally:
+            self._settle()
+
+    def _allow(self) -> None:
+        if not self.breaker.allow():
+            self._settled = True
+            raise self.unavailable(f"{self.name} circuit is open")
+
+    def _answered(self, started: float, status_code: int) -> Optional[float]:
+        # Returns None for a final response, else the delay before the next attempt.
+        record_http(self.service, status_code, time.perf_counter() - started)
+        if status_code not in self.retryable_statuses:
+            self._settled = True
+            self.breaker.record_success()
+            return None
+        return self._retry(f"status {status_code}")
+
+    def _failed(self, started: float, exc: Exception, transient: bool) -> float:
+        record_http(self.service, "error", time.perf_counter() - started)
+        if not transient:
+            self._settle()
+            raise self.unavailable(f"{self.name} request failed: {exc}") from exc
+        return self._retry(str(exc))
+
+    def _retry(self, failure: str) -> float:
+        delay = next(self._delays, None)
+        if delay is None:
+            self._settle()
+            raise self.unavailable(f"{self.name} unavailable: {failure}")
+        return delay
+
+    def _settle(self) -> None:
+        # Records the failure of a call that ended without an answer, once.
+        if not self._settled:
+            self._settled = True
+            self.breaker.record_failure()
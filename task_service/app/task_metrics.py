@@ -0,0 +1,477 @@
+"""
+Request timing and Prometheus metrics for the Task Service.
+A pure ASGI middleware times every request and opens a per-request breakdown in a context variable;
+SQLAlchemy cursor events, the Redis client wrapper and the User Service client add the time they spend
+to it. Totals are kept in a small in-process registry rendered in the Prometheus text format, and
+requests slower than SLOW_REQUEST_MS are logged with their breakdown.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+Sample = Tuple[str, str, str, float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        """
+        Initializes the counter.
+        Args:
+            name (str): Metric name.
+            documentation (str): HELP text.
+            label_names (Sequence[str]): Names of the labels every sample carries.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        """
+        Adds to the counter.
+        Args:
+            *labels: Label values, in label_names order.
+            amount (float): Increment.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        """
+        Returns the current value for the given label values.
+        """
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        """
+        Renders the sample lines.
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {_format_value(value)}" for labels, value in values]
+
+
+class Histogram:
+    """
+    Cumulative histogram with optional labels.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        """
+        Initializes the histogram.
+        Args:
+            name (str): Metric name.
+            documentation (str): HELP text.
+            label_names (Sequence[str]): Names of the labels every sample carries.
+            buckets (Sequence[float]): Upper bounds of the buckets, in increasing order.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        """
+        Records one observation.
+        Args:
+            value (float): Observed value.
+            *labels: Label values, in label_names order.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels) -> int:
+        """
+        Returns the number of observations for the given label values.
+        """
+        with self._lock:
+            series = self._series.get(labels)
+            return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        """
+        Renders the bucket, sum and count lines.
+        """
+        with self._lock:
+            series = sorted((labels, (list(buckets), total, count))
+                            for labels, (buckets, total, count) in self._series.items())
+        lines = []
+        for labels, (buckets, total, count) in series:
+            cumulative = 0
+            for bound, hits in zip((*self.buckets, math.inf), buckets):
+                cumulative += hits
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registry of the process metrics, rendered in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        """
+        Initializes an empty registry.
+        """
+        self._metrics: List = []
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """
+        Registers a counter.
+        """
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        """
+        Registers a histogram.
+        """
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, extra: Iterable[Sample] = ()) -> str:
+        """
+        Renders every metric, followed by point-in-time samples read from other components.
+        Args:
+            extra (Iterable[Sample]): (name, type, help, value) of gauges and counters sampled at scrape time.
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for name, kind, documentation, value in extra:
+            lines.extend((f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"))
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+REQUESTS = METRICS.counter("http_requests_total", "Requests served.", ("method", "route", "status"))
+REQUEST_DURATION = METRICS.histogram("http_request_duration_seconds", "Request latency.", ("method", "route"))
+REQUEST_DB_QUERIES = METRICS.histogram("http_request_db_queries", "Database queries issued per request.",
+                                       ("method", "route"), buckets=COUNT_BUCKETS)
+REQUEST_DB_DURATION = METRICS.histogram("http_request_db_duration_seconds", "Database time spent per request.",
+                                        ("method", "route"))
+SLOW_REQUESTS = METRICS.counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.",
+                                ("method", "route"))
+DB_QUERY_DURATION = METRICS.histogram("db_query_duration_seconds", "Database statement latency.", ("operation",))
+REDIS_COMMAND_DURATION = METRICS.histogram("redis_command_duration_seconds", "Redis command latency.", ("command",))
+ADMISSION_REJECTIONS = METRICS.counter("http_requests_rejected_total", "Requests refused by admission control.",
+                                       ("reason",))
+HTTP_CLIENT_DURATION = METRICS.histogram("http_client_request_duration_seconds", "Outbound HTTP call latency.",
+                                         ("target", "outcome"))
+
+
+class RequestTimings:
+    """
+    Breakdown of the time one request spent in the database, Redis and outbound HTTP calls.
+    """
+    __slots__ = ("db_queries", "db_seconds", "redis_calls", "redis_seconds", "http_calls", "http_seconds")
+
+    def __init__(self):
+        """
+        Initializes an empty breakdown.
+        """
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+        self.http_calls = 0
+        self.http_seconds = 0.0
+
+    def describe(self) -> str:
+        """
+        Returns the breakdown as one log-friendly line.
+        """
+        return (f"db {self.db_queries} queries {self.db_seconds * 1000:.1f} ms, "
+                f"redis {self.redis_calls} calls {self.redis_seconds * 1000:.1f} ms, "
+                f"http {self.http_calls} calls {self.http_seconds * 1000:.1f} ms")
+
+
+_CURRENT: ContextVar[Optional[RequestTimings]] = ContextVar("task_request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """
+    Returns the breakdown of the request being served, or None outside of a request.
+    """
+    return _CURRENT.get()
+
+
+def record_query(statement: str, seconds: float) -> None:
+    """
+    Records one database statement.
+    Args:
+        statement (str): SQL text; its first keyword labels the sample.
+        seconds (float): Execution time.
+    """
+    DB_QUERY_DURATION.observe(seconds, statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "")
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += seconds
+
+
+def record_redis(command: str, seconds: float) -> None:
+    """
+    Records one Redis command or pipeline round trip.
+    Args:
+        command (str): Command name, or "pipeline".
+        seconds (float): Round-trip time.
+    """
+    REDIS_COMMAND_DURATION.observe(seconds, command)
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.redis_calls += 1
+        timings.redis_seconds += seconds
+
+
+def record_http(target: str, outcome, seconds: float) -> None:
+    """
+    Records one outbound HTTP attempt.
+    Args:
+        target (str): Name of the called service.
+        outcome: Response status code, or "error" when no response arrived.
+        seconds (float): Time until the response or the failure.
+    """
+    HTTP_CLIENT_DURATION.observe(seconds, target, str(outcome))
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.http_calls += 1
+        timings.http_seconds += seconds
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Times every statement executed through the engine.
+    Args:
+        engine (Engine): Engine to instrument; pass AsyncEngine.sync_engine for asyncio engines.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, *_):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, _cursor, statement, *_):
+        record_query(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            record_query(context.statement or "", time.perf_counter() - started.pop())
+
+
+class TimedRedis:
+    """
+    Redis client wrapper that records the latency of every command and pipeline.
+    """
+    def __init__(self, client):
+        """
+        Wraps a client.
+        Args:
+            client: Redis client to wrap.
+        """
+        self._client = client
+
+    @property
+    def unwrapped(self):
+        """
+        The wrapped client, for commands whose duration should not be recorded, such as blocking reads.
+        """
+        return self._client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == "pipeline":
+            return lambda *args, **kwargs: TimedPipeline(attr(*args, **kwargs))
+        if not callable(attr) or name.startswith("_") or name == "close":
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record_redis(name, time.perf_counter() - started)
+        return timed
+
+
+class TimedPipeline:
+    """
+    Redis pipeline wrapper that records the latency of its execution.
+    """
+    def __init__(self, pipeline):
+        """
+        Wraps a pipeline.
+        Args:
+            pipeline: Redis pipeline to wrap.
+        """
+        self._pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def execute(self, *args, **kwargs):
+        """
+        Executes the queued commands in one round trip.
+        """
+        started = time.perf_counter()
+        try:
+            return self._pipeline.execute(*args, **kwargs)
+        finally:
+            record_redis("pipeline", time.perf_counter() - started)
+
+
+class AsyncTimedRedis:
+    """
+    Asyncio Redis client wrapper that records the latency of every command.
+    """
+    def __init__(self, client):
+        """
+        Wraps a client.
+        Args:
+            client: Asyncio Redis client to wrap.
+        """
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("_") or name in ("aclose", "pipeline"):
+            return attr
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                record_redis(name, time.perf_counter() - started)
+        return timed
+
+
+def route_label(scope: dict) -> str:
+    """
+    Returns the route template that served a request, keeping label cardinality bounded.
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def is_event_stream(message: dict) -> bool:
+    """
+    Tells whether an http.response.start message opens a server-sent events stream.
+    Such responses last as long as the client stays connected, so they are timed and admitted only
+    until their headers are sent.
+    Args:
+        message (dict): ASGI message.
+    Returns:
+        bool: Whether the response has the text/event-stream content type.
+    """
+    return any(name == b"content-type" and value.startswith(b"text/event-stream")
+               for name, value in message.get("headers", ()))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request and logging those slower than the threshold.
+    Event streams are timed until their headers are sent.
+    """
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        """
+        Wraps an ASGI application.
+        Args:
+            app: The wrapped ASGI application.
+            slow_request_ms (float): Latency in milliseconds above which a request is logged.
+        """
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _CURRENT.set(timings)
+        status = 500
+        started = time.perf_counter()
+        observed = False
+
+        async def send_with_status(message):
+            nonlocal status, observed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if is_event_stream(message):
+                    observed = True
+                    self._observe(scope, status, time.perf_counter() - started, timings)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _CURRENT.reset(token)
+            if not observed:
+                self._observe(scope, status, time.perf_counter() - started, timings)
+
+    def _observe(self, scope: dict, status: int, seconds: float, timings: RequestTimings) -> None:
+        method, route = scope["method"], route_label(scope)
+        REQUESTS.inc(method, route, str(status))
+        REQUEST_DURATION.observe(seconds, method, route)
+        REQUEST_DB_QUERIES.observe(timings.db_queries, method, route)
+        REQUEST_DB_DURATION.observe(timings.db_seconds, method, route)
+        if seconds * 1000 >= self.slow_request_ms:
+            SLOW_REQUESTS.inc(method, route)
+            logging.warning("Slow request %s %s -> %d took %.1f ms: %s", method, scope["path"], status,
+                            seconds * 1000, timings.describe())
@@ -0,0 +1,192 @@
+"""
+Background detection of overdue tasks for the Task Service.
+Each tick moves the open tasks that became due since the previous tick to the overdue status. It scans
+forward from a persisted due date high-water mark on the (status, due_date) index, so its cost follows
+the number of tasks that became due rather than the size of the table. A second cursor over new task ids
+catches tasks created with a due date already behind the mark.
+"""
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from redis import RedisError
+from sqlalchemy import Select, func, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.task_db import SchedulerMark, Task
+from app.task_events import TASK_UPDATED, TaskEvents
+from app.task_periodic import PeriodicWorker
+from app.task_services import TASK_CACHE_TTL, task_cache_key, task_to_dict
+from app.task_stats import TaskStats
+from app.task_versions import ChangeVersions
+
+OVERDUE_STATUS = "overdue"
+OVERDUE_CHANNEL = "task.overdue"
+OVERDUE_LOCK_KEY = "tasks:overdue:lock"
+OVERDUE_MARK = "overdue"
+OPEN_STATUSES = ("pending", "doing")
+
+
+def task_overdue_event(payload: dict) -> str:
+    """
+    Builds the message published when a task becomes overdue.
+    Args:
+        payload (dict): Serialized task.
+    Returns:
+        str: JSON message with the task id, owner and due date.
+    """
+    return json.dumps({"task_id": payload["id"], "user_id": payload["user_id"], "due_date": payload["due_date"]})
+
+
+class OverdueScheduler(PeriodicWorker):
+    """
+    Background thread moving newly due open tasks to the overdue status every interval seconds.
+    A short Redis lock makes a single process per interval do the work.
+    """
+    thread_name = "task-overdue-scheduler"
+    failure_message = "Overdue scan failed: %s"
+
+    def __init__(self, session_factory: Callable[[], Session], redis_client, stats: TaskStats,
+                 open_statuses: Sequence[str] = OPEN_STATUSES, batch_size: int = 500, interval: float = 30.0,
+                 clock: Callable[[], datetime] = datetime.now, versions: Optional[ChangeVersions] = None):
+        """
+        Initializes the scheduler.
+        Args:
+            session_factory (Callable[[], Session]): Factory of database sessions, or of the sessions of every
+                                                     shard (see task_shards), each scanned in turn.
+            redis_client: Redis client used for the lock, the task cache and the events.
+            stats (TaskStats): Counters moved along with the tasks.
+            open_statuses (Sequence[str]): Statuses that become overdue once the due date passed.
+            batch_size (int): Maximum number of tasks moved per transaction.
+            interval (float): Seconds between two ticks.
+            clock (Callable[[], datetime]): Time source deciding what is due.
+            versions (Optional[ChangeVersions]): Change versions bumped with the moves. Defaults to versions on
+                                                 redis_client.
+        """
+        super().__init__(interval)
+        self.open_statuses = tuple(open_statuses)
+        self.batch_size = batch_size
+        self._session_factory = session_factory
+        self._redis_client = redis_client
+        self._stats = stats
+        self._versions = versions or ChangeVersions(redis_client)
+        self._events = TaskEvents(redis_client)
+        self._clock = clock
+
+    @classmethod
+    def from_env(cls, session_factory: Callable[[], Session], redis_client, stats: TaskStats,
+                 versions: Optional[ChangeVersions] = None) -> "OverdueScheduler":
+        """
+        Builds a scheduler configured by the OVERDUE_* environment variables.
+        Args:
+            session_factory (Callable[[], Session]): Factory of database sessions.
+            redis_client: Redis client used for the lock, the task cache and the events.
+            stats (TaskStats): Counters moved along with the tasks.
+            versions (Optional[ChangeVersions]): Change versions bumped with the moves.
+        Returns:
+            OverdueScheduler: The configured scheduler.
+        """
+        statuses = os.getenv("OVERDUE_OPEN_STATUSES", ",".join(OPEN_STATUSES))
+        return cls(session_factory, redis_client, stats,
+                   open_statuses=[status.strip() for status in statuses.split(",") if status.strip()],
+                   batch_size=int(os.getenv("OVERDUE_BATCH_SIZE", "500")),
+                   interval=float(os.getenv("OVERDUE_SCAN_INTERVAL", "30")), versions=versions)
+
+    def run_once(self) -> Optional[int]:
+        """
+        Runs one tick unless another process did within the interval.
+        Returns:
+            Optional[int]: Number of tasks moved to overdue, or None when the tick was skipped.
+        """
+        try:
+            if not self._redis_client.set(OVERDUE_LOCK_KEY, str(time.time()), nx=True,
+                                          ex=max(1, int(self.interval))):
+                return None
+        except RedisError:
+            return None
+        with self._session_factory() as db:
+            if isinstance(db, Session):
+                return self.tick(db)
+            # Sharded tasks: each shard keeps its own mark.
+            return sum(self.tick(shard_db) for shard_db in db)
+
+    def tick(self, db: Session) -> int:
+        """
+        Moves the open tasks that became due since the previous tick, then advances the mark.
+        Args:
+            db (Session): Database session.
+        Returns:
+            int: Number of tasks moved to overdue.
+        """
+        now = self._clock()
+        mark = db.get(SchedulerMark, OVERDUE_MARK)
+        scanned_until = mark.scanned_until if mark is not None else None
+        last_task_id = mark.last_task_id if mark is not None else 0
+        newest_id = db.scalar(select(func.max(Task.id))) or 0
+        moved = 0
+        if scanned_until is not None and newest_id > last_task_id:
+            moved += self._drain(db, (Task.id,), Task.id > last_task_id, Task.id <= newest_id,
+                                 Task.due_date <= scanned_until)
+        window = [Task.due_date <= now]
+        if scanned_until is not None:
+            window.append(Task.due_date > scanned_until)
+        moved += self._drain(db, (Task.due_date, Task.id), *window)
+        mark = db.get(SchedulerMark, OVERDUE_MARK) or SchedulerMark(name=OVERDUE_MARK)
+        mark.scanned_until = now
+        mark.last_task_id = newest_id
+        db.add(mark)
+        db.commit()
+        return moved
+
+    def _drain(self, db: Session, keys: tuple, *criteria) -> int:
+        # Walks the matching open tasks in key order, one bounded transaction per batch.
+        moved = 0
+        cursor = None
+        while True:
+            rows = db.execute(self._batch_query(keys, criteria, cursor)).all()
+            if not rows:
+                return moved
+            cursor = (*rows[-1][2:], rows[-1].id)
+            moved += self._move(db, rows)
+            if len(rows) < self.batch_size:
+                return moved
+
+    def _batch_query(self, keys: tuple, criteria: Sequence, cursor: Optional[tuple]) -> Select:
+        # Selects id, status and the leading keys of the next batch, locking the rows until the batch commits.
+        query = select(Task.id, Task.status, *keys[:-1]).where(Task.status.in_(self.open_statuses), *criteria)
+        if cursor is not None:
+            query = query.where(tuple_(*keys) > tuple_(*cursor))
+        return query.order_by(*keys).limit(self.batch_size).with_for_update()
+
+    def _move(self, db: Session, rows: List) -> int:
+        # The status guard skips rows another writer changed since the batch query, where FOR UPDATE is
+        # not enforced (SQLite), so a task is never moved or counted twice.
+        statuses = {row.id: row.status for row in rows}
+        tasks = db.scalars(update(Task).where(Task.id.in_(list(statuses)), Task.status.in_(self.open_statuses))
+                           .values(status=OVERDUE_STATUS).returning(Task)).all()
+        previous = Counter(statuses[task.id] for task in tasks)
+        payloads = [task_to_dict(task) for task in tasks]
+        db.commit()
+        self._versions.bump([payload["id"] for payload in payloads], [payload["user_id"] for payload in payloads])
+        self._publish(payloads)
+        self._stats.record_status_change(previous, OVERDUE_STATUS)
+        return len(payloads)
+
+    def _publish(self, payloads: List[dict]) -> None:
+        # Refreshes the cached copies and announces the change, on its channel and on the change feed,
+        # in one pipeline round trip.
+        if not payloads:
+            return
+        try:
+            pipe = self._redis_client.pipeline()
+            for payload in payloads:
+                pipe.setex(task_cache_key(payload["id"]), TASK_CACHE_TTL, json.dumps(payload))
+                pipe.publish(OVERDUE_CHANNEL, task_overdue_event(payload))
+            self._events.queue(pipe, TASK_UPDATED, payloads)
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to publish overdue tasks to redis")
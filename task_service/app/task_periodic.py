@@ -0,0 +1,60 @@
+"""
+Background threads running a job at a fixed interval for the Task Service.
+"""
+import logging
+import threading
+from typing import Optional
+
+
+class PeriodicWorker:
+    """
+    Daemon thread calling run_once every interval seconds until stopped. Its first pass waits a full interval.
+    Subclasses implement run_once and name their thread and failure message.
+    """
+    thread_name = "task-periodic-worker"
+    failure_message = "Periodic task failed: %s"
+
+    def __init__(self, interval: float):
+        """
+        Initializes the worker.
+        Args:
+            interval (float): Seconds between two runs.
+        """
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self):
+        """
+        Runs the job once.
+        """
+        raise NotImplementedError
+
+    def start(self) -> None:
+        """
+        Starts the background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stops the background thread.
+        Args:
+            timeout (float): Seconds to wait for the thread to finish.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logging.error(self.failure_message, exc)
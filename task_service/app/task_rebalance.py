@@ -0,0 +1,127 @@
+"""
+Rebalancing tool for the task shards.
+After a URL is appended to TASK_SHARD_URLS, some owners hash to the new shard (see task_shards); this tool
+moves their tasks there, owner by owner, in batches. Each batch is copied to the target shard, committed,
+then deleted from the source shard, with the source rows locked meanwhile so no write to them is lost. An
+interrupted run is resumed by running it again: rows already copied are not copied twice. Task ids are kept,
+and the owners' listing versions are bumped so cached listings are revalidated.
+Run from the service directory: python -m app.task_rebalance [--dry-run] [--batch-size 500]
+"""
+import argparse
+import logging
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+
+from app.task_db import Task
+from app.task_services import connect_redis
+from app.task_shards import ShardRouter
+from app.task_versions import ChangeVersions
+
+
+def misplaced_owners(router: ShardRouter, index: int) -> Dict[int, int]:
+    """
+    Lists the owners with tasks on a shard that is no longer theirs.
+    Args:
+        router (ShardRouter): Router of the shards.
+        index (int): Shard to inspect.
+    Returns:
+        Dict[int, int]: Shard each misplaced owner now belongs to, by owner id.
+    """
+    with router.session_factories[index]() as db:
+        owners = db.scalars(select(Task.user_id).distinct()).all()
+    return {user_id: router.shard_for(user_id) for user_id in owners if router.shard_for(user_id) != index}
+
+
+def move_owner(router: ShardRouter, source: int, target: int, user_id: int, batch_size: int = 500,
+               versions: Optional[ChangeVersions] = None) -> int:
+    """
+    Moves every task of an owner from one shard to another, one batch per transaction pair.
+    Args:
+        router (ShardRouter): Router of the shards.
+        source (int): Shard holding the tasks.
+        target (int): Shard the owner belongs to.
+        user_id (int): ID of the owner.
+        batch_size (int): Maximum number of tasks per batch.
+        versions (Optional[ChangeVersions]): Change versions to bump for each moved batch.
+    Returns:
+        int: Number of tasks moved.
+    """
+    moved = 0
+    while True:
+        with router.session_factories[source]() as src, router.session_factories[target]() as dst:
+            rows = src.execute(select(Task.id, Task.title, Task.status, Task.due_date, Task.user_id)
+                               .where(Task.user_id == user_id).order_by(Task.id).limit(batch_size)
+                               .with_for_update()).all()
+            if not rows:
+                return moved
+            ids = [row.id for row in rows]
+            copied = set(dst.scalars(select(Task.id).where(Task.id.in_(ids))))
+            missing = [row._asdict() for row in rows if row.id not in copied]
+            if missing:
+                dst.execute(insert(Task), missing)
+            dst.commit()
+            src.execute(delete(Task).where(Task.id.in_(ids)))
+            src.commit()
+        if versions is not None:
+            versions.bump(ids, [user_id])
+        moved += len(ids)
+
+
+def rebalance(router: ShardRouter, versions: Optional[ChangeVersions] = None, batch_size: int = 500,
+              dry_run: bool = False) -> Dict[Tuple[int, int], int]:
+    """
+    Moves the tasks of every misplaced owner to its shard.
+    Args:
+        router (ShardRouter): Router of the shards.
+        versions (Optional[ChangeVersions]): Change versions of the moved tasks and owners to bump.
+        batch_size (int): Maximum number of tasks per batch.
+        dry_run (bool): Only count the owners to move.
+    Returns:
+        Dict[Tuple[int, int], int]: Tasks moved, or owners to move on a dry run, per (source, target) shard pair.
+    Raises:
+        ValueError: If an owner would move to a lower shard, which happens when shards were removed or reordered.
+    """
+    router.init_schema()
+    plan = {index: misplaced_owners(router, index) for index in range(len(router))}
+    for source, owners in plan.items():
+        if any(target < source for target in owners.values()):
+            raise ValueError(f"Owners of shard {source} would move to a lower shard: shards can only be appended")
+    totals: Counter = Counter()
+    for source, owners in plan.items():
+        for user_id, target in sorted(owners.items()):
+            if dry_run:
+                totals[(source, target)] += 1
+                continue
+            moved = move_owner(router, source, target, user_id, batch_size, versions)
+            totals[(source, target)] += moved
+            logging.info("Moved %d tasks of user %d from shard %d to shard %d", moved, user_id, source, target)
+    return dict(totals)
+
+
+def main() -> None:
+    """
+    Rebalances the shards configured by TASK_DATABASE_URL and TASK_SHARD_URLS.
+    """
+    parser = argparse.ArgumentParser(description="Move task owners to the shard they hash to.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many owners would move.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s", force=True)
+    router = ShardRouter.from_env()
+    if router is None:
+        parser.error("TASK_SHARD_URLS is not set: the tasks are not sharded")
+    try:
+        totals = rebalance(router, ChangeVersions(connect_redis()), args.batch_size, args.dry_run)
+    finally:
+        router.close()
+    unit = "owners to move" if args.dry_run else "tasks moved"
+    for (source, target), count in sorted(totals.items()):
+        print(f"shard {source} -> shard {target}: {count} {unit}")
+    if not totals:
+        print("Every owner is on its shard")
+
+
+if __name__ == "__main__":
+    main()
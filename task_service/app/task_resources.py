@@ -0,0 +1,180 @@
+"""
+Application-scoped resources for the Task Service.
+This module holds the clients that are built once per process (Redis, HTTP session, user client,
+token verifier, change feed reader, and their asyncio counterparts in async mode) and the FastAPI
+dependencies that hand them to each request.
+"""
+import os
+from typing import Optional
+
+import requests
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.task_admission import RateLimiter
+from app.task_auth import InvalidToken, TokenVerifier
+from app.task_async_services import AsyncTaskService, AsyncUserClient, connect_async_redis
+from app.task_cache import UserValidationCache
+from app.task_db import ASYNC_MODE, SESSION_LOCAL, get_async_task_db, get_task_db
+from app.task_events import TaskEventFeed, TaskEvents
+from app.task_http import build_session
+from app.task_overdue import OverdueScheduler
+from app.task_services import TaskService, UserClient, connect_redis
+from app.task_shards import ShardedTaskService, ShardRouter, ShardSessions
+from app.task_stats import StatsReconciler, TaskStats
+from app.task_versions import ChangeVersions
+
+
+class TaskResources:
+    """
+    Container for the long-lived clients shared by every request.
+    """
+    def __init__(self, redis_client=None, http_session: Optional[requests.Session] = None,
+                 user_client: Optional[UserClient] = None, async_mode: Optional[bool] = None,
+                 token_verifier: Optional[TokenVerifier] = None):
+        """
+        Initializes the shared clients.
+        Args:
+            redis_client: Redis client for caching. Defaults to connecting via REDIS_URL.
+            http_session (Optional[requests.Session]): Session used for outbound HTTP calls.
+            user_client (Optional[UserClient]): Client for user validation, built on the shared session.
+            async_mode (Optional[bool]): Whether to also build asyncio clients. Defaults to ASYNC_MODE.
+            token_verifier (Optional[TokenVerifier]): Verifier of caller tokens.
+        Raises:
+            ValueError: If the tasks are sharded in async mode, which only serves shard 0.
+        """
+        self.redis_client = redis_client if redis_client is not None else connect_redis()
+        self.http_session = http_session or build_session(int(os.getenv("USER_SERVICE_POOL_SIZE", "10")))
+        self.user_client = user_client or UserClient.from_env(
+            session=self.http_session, cache=UserValidationCache.from_env(self.redis_client))
+        self.token_verifier = token_verifier or TokenVerifier()
+        self.rate_limiter = RateLimiter.from_env(self.redis_client)
+        self.task_stats = TaskStats(self.redis_client)
+        self.task_versions = ChangeVersions(self.redis_client)
+        self.shards = ShardRouter.from_env()
+        session_factory = SESSION_LOCAL if self.shards is None else self.shards.sessions
+        self.task_events = TaskEvents(self.redis_client)
+        self.event_feed = TaskEventFeed.from_env(self.redis_client)
+        self.stats_reconciler = StatsReconciler(session_factory, self.task_stats,
+                                                interval=float(os.getenv("TASK_STATS_RECONCILE_INTERVAL", "300")))
+        self.overdue_scheduler = OverdueScheduler.from_env(session_factory, self.redis_client, self.task_stats,
+                                                           versions=self.task_versions)
+        self.async_redis_client = None
+        self.async_user_client = None
+        if ASYNC_MODE if async_mode is None else async_mode:
+            if self.shards is not None:
+                raise ValueError("Sharded tasks are not supported in async mode")
+            self.async_redis_client = connect_async_redis()
+            self.async_user_client = AsyncUserClient.from_env(cache=self.user_client.cache)
+
+    def close(self) -> None:
+        """
+        Stops the background threads and releases the HTTP and Redis connection pools.
+        """
+        self.event_feed.stop()
+        self.overdue_scheduler.stop()
+        self.stats_reconciler.stop()
+        if self.shards is not None:
+            self.shards.close()
+        self.http_session.close()
+        self.redis_client.close()
+
+    async def aclose(self) -> None:
+        """
+        Releases the asyncio pools, then the synchronous ones.
+        """
+        if self.async_user_client is not None:
+            await self.async_user_client.aclose()
+        if self.async_redis_client is not None:
+            await self.async_redis_client.aclose()
+        self.close()
+
+
+def get_task_resources(request: Request) -> TaskResources:
+    """
+    Dependency returning the resources created by the application lifespan.
+    Builds them on first use when the app is served without running its lifespan.
+    Args:
+        request (Request): Incoming request, used to reach the application state.
+    Returns:
+        TaskResources: The application-scoped resources.
+    """
+    resources = getattr(request.app.state, "resources", None)
+    if resources is None:
+        resources = TaskResources()
+        request.app.state.resources = resources
+    return resources
+
+
+def get_task_shard_sessions(db: Session = Depends(get_task_db),
+                            resources: TaskResources = Depends(get_task_resources)) -> Optional[ShardSessions]:
+    """
+    Dependency providing the sessions of every shard for the current request when the tasks are sharded.
+    Shard 0 uses the request session; the others are opened on first use and closed with the request.
+    Args:
+        db (Session): Database session for the current request.
+        resources (TaskResources): Application-scoped resources.
+    Yields:
+        Optional[ShardSessions]: The shard sessions, or None when the tasks are not sharded.
+    """
+    if resources.shards is None:
+        yield None
+        return
+    with resources.shards.sessions(db) as sessions:
+        yield sessions
+
+
+def get_task_service(db: Session = Depends(get_task_db),
+                     resources: TaskResources = Depends(get_task_resources),
+                     shard_sessions: Optional[ShardSessions] = Depends(get_task_shard_sessions)) -> TaskService:
+    """
+    Dependency providing a TaskService bound to the request session and the shared clients,
+    or a ShardedTaskService routing over the shard sessions when the tasks are sharded.
+    Args:
+        db (Session): Database session for the current request.
+        resources (TaskResources): Application-scoped resources.
+        shard_sessions (Optional[ShardSessions]): Sessions of every shard, when sharded.
+    Returns:
+        TaskService: Service instance for the current request.
+    """
+    clients = {"user_client": resources.user_client, "redis_client": resources.redis_client,
+               "stats": resources.task_stats, "versions": resources.task_versions, "events": resources.task_events}
+    if shard_sessions is not None:
+        return ShardedTaskService(resources.shards, shard_sessions, **clients)
+    return TaskService(db, **clients)
+
+
+def get_async_task_service(db: AsyncSession = Depends(get_async_task_db),
+                           resources: TaskResources = Depends(get_task_resources)) -> AsyncTaskService:
+    """
+    Dependency providing an AsyncTaskService bound to the request session and the shared asyncio clients.
+    Args:
+        db (AsyncSession): Asyncio database session for the current request.
+        resources (TaskResources): Application-scoped resources.
+    Returns:
+        AsyncTaskService: Service instance for the current request.
+    """
+    return AsyncTaskService(db, user_client=resources.async_user_client, redis_client=resources.async_redis_client,
+                            stats=resources.task_stats, versions=resources.task_versions,
+                            events=resources.task_events)
+
+
+def get_current_user_id(request: Request, resources: TaskResources = Depends(get_task_resources)) -> int:
+    """
+    Dependency resolving the caller from its bearer token without calling the User Service.
+    Args:
+        request (Request): Incoming request carrying the Authorization header.
+        resources (TaskResources): Application-scoped resources holding the verifier.
+    Returns:
+        int: ID of the authenticated user.
+    Raises:
+        HTTPException: 401 if the token is missing or invalid.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return resources.token_verifier.verify_token(token)
+    except InvalidToken as exc:
+        raise HTTPException(status_code=401, detail=str(exc), headers={"WWW-Authenticate": "Bearer"}) from exc
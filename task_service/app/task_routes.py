@@ -1,19 +1,111 @@
 """
 FastAPI route definitions for task-related operations.
-This module defines the endpoints for creating, updating, deleting, and listing tasks.
+This module defines the endpoints for creating, updating, deleting, and listing tasks, and the change feed.
 """
 from datetime import datetime
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from sqlalchemy import Row
 
-from app.task_db import get_task_db
-from app.task_services import TaskService
+from app.task_events import FeedFull, parse_event_id
+from app.task_resources import TaskResources, get_current_user_id, get_task_resources, get_task_service
+from app.task_services import TaskRowEncoder, TaskService, UserServiceUnavailable, parse_fields, task_to_dict
+from app.task_versions import TASKS_VERSION_KEY, ChangeVersions, etag_matches, owner_version_key, task_version_key
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def listing_etag(request: Request, versions: ChangeVersions, user_id: Optional[int]) -> Optional[str]:
+    """
+    Returns the ETag of a task listing without querying the database.
+    A listing restricted to one owner follows the version of that owner's tasks, any other listing the
+    version of the whole collection; the path, query string and Accept header tell the variants apart.
+    Args:
+        request (Request): Incoming request.
+        versions (ChangeVersions): Change versions of the tasks.
+        user_id (Optional[int]): Owner the listing is restricted to.
+    Returns:
+        Optional[str]: The tag, or None when the versions cannot be read.
+    """
+    key = TASKS_VERSION_KEY if user_id is None else owner_version_key(user_id)
+    return versions.etag([key], f"{request.url.path}?{request.url.query}|{request.headers.get('accept', '')}")
+
+
+def not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """
+    Returns an empty 304 response when the If-None-Match header holds the current tag.
+    Args:
+        request (Request): Incoming request.
+        etag (Optional[str]): Current tag of the resource.
+    Returns:
+        Optional[Response]: The 304 response, or None when the representation must be sent.
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def split_values(values: Optional[List[str]]) -> List[str]:
+    """
+    Flattens a repeatable parameter whose values may also be comma-separated.
+    Args:
+        values (Optional[List[str]]): Values as received, e.g. ["pending,doing", "done"].
+    Returns:
+        List[str]: The non-empty values, e.g. ["pending", "doing", "done"].
+    """
+    return [part for value in values or [] for part in value.split(",") if part]
+
+
+def listing_filters(status: Optional[List[str]], fields: Optional[str]) -> Tuple[List[str], Tuple[str, ...]]:
+    """
+    Parses the status filter and sparse fieldset shared by the listing endpoints.
+    Args:
+        status (Optional[List[str]]): Status filter; repeat or comma-separate for several.
+        fields (Optional[str]): Comma-separated sparse fieldset. Defaults to every field.
+    Returns:
+        Tuple[List[str], Tuple[str, ...]]: The statuses and the selected fields.
+    Raises:
+        HTTPException: If a field is unknown.
+    """
+    try:
+        return split_values(status), parse_fields(fields)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def wants_ndjson(request: Request, stream: bool) -> bool:
+    """
+    Tells whether a listing must be streamed as NDJSON, asked with stream=true or the Accept header.
+    Args:
+        request (Request): Incoming request.
+        stream (bool): The stream query parameter.
+    Returns:
+        bool: Whether to stream.
+    """
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def rows_response(rows: List[Row], encoder: TaskRowEncoder, headers: dict, next_cursor: Optional[str]) -> Response:
+    """
+    Encodes one page of projected rows as a JSON array, with the cursor of the next page in X-Next-Cursor.
+    Args:
+        rows (List[Row]): The page.
+        encoder (TaskRowEncoder): Encoder built for the selected fields.
+        headers (dict): Headers of the response, such as the ETag.
+        next_cursor (Optional[str]): Cursor of the next page, if any.
+    Returns:
+        Response: The JSON response.
+    """
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=encoder.encode_rows(rows), media_type="application/json", headers=headers)
+
 
 class CreateTaskRequest(BaseModel):
     """
@@ -24,6 +116,13 @@ class CreateTaskRequest(BaseModel):
     due_date: datetime
 
 
+class CreateTasksBatchRequest(BaseModel):
+    """
+    Pydantic model for batch task creation request payload.
+    """
+    tasks: List[CreateTaskRequest] = Field(min_length=1, max_length=5000)
+
+
 class UpdateTaskRequest(BaseModel):
     """
     Pydantic model for task update request payload.
@@ -31,72 +130,309 @@ class UpdateTaskRequest(BaseModel):
     status: str
 
 
+class TaskFilter(BaseModel):
+    """
+    Pydantic model for the filters selecting the tasks of a bulk operation.
+    """
+    status: Optional[List[str]] = None
+    due_before: Optional[datetime] = None
+    user_id: Optional[int] = None
+
+
+class BulkUpdateStatusRequest(BaseModel):
+    """
+    Pydantic model for bulk status update request payload.
+    """
+    status: str
+    ids: Optional[List[int]] = Field(default=None, max_length=10000)
+    filter: TaskFilter = Field(default_factory=TaskFilter)
+
+
 @router.post("", status_code=201)
-def create_task(payload: CreateTaskRequest, db: Session = Depends(get_task_db)):
+def create_task(payload: CreateTaskRequest, service: TaskService = Depends(get_task_service)):
     """
     Endpoint to create a new task.
     Args:
         payload (CreateTaskRequest): Task details (title, user_id, due_date).
-        db (Session): Database session provided by dependency injection.
+        service (TaskService): Task service provided by dependency injection.
     Returns:
         dict: The created task details.
     Raises:
-        HTTPException: If user validation fails.
+        HTTPException: If user validation fails or the User Service is unavailable.
     """
-    service = TaskService(db)
     try:
         task = service.create_task(payload.title, payload.user_id, payload.due_date)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    return {
-        "id": task.id,
-        "title": task.title,
-        "status": task.status,
-        "due_date": task.due_date.isoformat(),
-        "user_id": task.user_id,
-    }
+    except UserServiceUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return task_to_dict(task)
+
+
+@router.post("/batch")
+def create_tasks_batch(payload: CreateTasksBatchRequest, service: TaskService = Depends(get_task_service)):
+    """
+    Endpoint to create many tasks in one request.
+    Args:
+        payload (CreateTasksBatchRequest): List of task details.
+        service (TaskService): Task service provided by dependency injection.
+    Returns:
+        dict: Created and failed counts and a per-item result in input order.
+    Raises:
+        HTTPException: If the User Service is unavailable.
+    """
+    try:
+        outcomes = service.create_tasks([item.model_dump() for item in payload.tasks])
+    except UserServiceUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    results = [
+        {"index": index, "status": 400, "error": str(outcome)} if isinstance(outcome, ValueError)
+        else {"index": index, "status": 201, "task": task_to_dict(outcome)}
+        for index, outcome in enumerate(outcomes)
+    ]
+    created = sum(1 for result in results if result["status"] == 201)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.patch("/status")
+def update_tasks_status(payload: BulkUpdateStatusRequest, service: TaskService = Depends(get_task_service)):
+    """
+    Endpoint to set the status of many tasks, selected by ids and/or filters, in one statement.
+    Args:
+        payload (BulkUpdateStatusRequest): New status, task ids and filters.
+        service (TaskService): Task service.
+    Returns:
+        dict: Number of tasks updated.
+    Raises:
+        HTTPException: If neither ids nor a filter is given.
+    """
+    try:
+        updated = service.update_tasks_status(payload.status, ids=payload.ids,
+                                              status=split_values(payload.filter.status),
+                                              due_before=payload.filter.due_before,
+                                              user_id=payload.filter.user_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"updated": updated}
+
+
+@router.delete("")
+def delete_tasks(ids: Optional[List[str]] = Query(default=None),
+                 status: Optional[List[str]] = Query(default=None),
+                 due_before: Optional[datetime] = Query(default=None),
+                 user_id: Optional[int] = Query(default=None),
+                 service: TaskService = Depends(get_task_service)):
+    """
+    Endpoint to delete many tasks, selected by ids and/or filters, in one statement.
+    Args:
+        ids (Optional[List[str]]): Task ids; repeat or comma-separate for several.
+        status (Optional[List[str]]): Filter by task status; repeat or comma-separate for several.
+        due_before (Optional[datetime]): Filter tasks due before this timestamp.
+        user_id (Optional[int]): Filter by owner.
+        service (TaskService): Task service.
+    Returns:
+        dict: Number of tasks deleted.
+    Raises:
+        HTTPException: If an id is not an integer, or neither ids nor a filter is given.
+    """
+    try:
+        task_ids = None if ids is None else [int(part) for part in split_values(ids)]
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="ids must be integers") from exc
+    statuses = split_values(status)
+    try:
+        deleted = service.delete_tasks(ids=task_ids, status=statuses, due_before=due_before, user_id=user_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"deleted": deleted}
+
+
+@router.get("/stats")
+def get_task_stats(user_id: Optional[int] = Query(default=None),
+                   service: TaskService = Depends(get_task_service)):
+    """
+    Endpoint returning task counts by status, by owner and overdue.
+    Counts come from counters maintained on every write, so the cost does not grow with the table.
+    Args:
+        user_id (Optional[int]): Restrict the per-owner counts to this user.
+        service (TaskService): Task service.
+    Returns:
+        dict: total, by_status, by_user, overdue, overdue_as_of and source of the figures.
+    """
+    return service.get_stats(user_id)
+
+
+@router.get("/search")
+def search_tasks(request: Request,
+                 q: str = Query(min_length=1, max_length=200),
+                 status: Optional[List[str]] = Query(default=None),
+                 due_before: Optional[datetime] = Query(default=None),
+                 user_id: Optional[int] = Query(default=None),
+                 limit: int = Query(default=20, ge=1, le=100),
+                 cursor: Optional[str] = Query(default=None),
+                 fields: Optional[str] = Query(default=None),
+                 service: TaskService = Depends(get_task_service)
+                 ):
+    """
+    Endpoint searching task titles through the full-text index.
+    Every word of q must match the start of a word of the title. Results come best match first and are
+    paginated with the cursor returned in the X-Next-Cursor header. Responses carry the same ETag as
+    the task listing; a matching If-None-Match is answered with 304 before the database is queried.
+    Args:
+        request (Request): Incoming request, carrying If-None-Match.
+        q (str): Words to look for.
+        status (Optional[List[str]]): Filter by task status; repeat or comma-separate for several.
+        due_before (Optional[datetime]): Filter tasks due before this timestamp.
+        user_id (Optional[int]): Filter by owner.
+        limit (int): Maximum number of tasks per page.
+        cursor (Optional[str]): Cursor of the page to fetch.
+        fields (Optional[str]): Comma-separated sparse fieldset. Defaults to every field.
+        service (TaskService): Task service.
+    Returns:
+        Response: JSON array of the matching tasks, or an empty 304 response.
+    Raises:
+        HTTPException: If q holds no word, the cursor is malformed or a field is unknown.
+    """
+    statuses, selected = listing_filters(status, fields)
+    etag = listing_etag(request, service.versions, user_id)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    try:
+        rows, next_cursor = service.search_task_rows(q, selected, status=statuses, due_before=due_before,
+                                                     user_id=user_id, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return rows_response(rows, TaskRowEncoder(selected), {"ETag": etag} if etag is not None else {}, next_cursor)
+
+
+@router.get("/events")
+async def task_events(request: Request,
+                      user_id: Optional[int] = Query(default=None),
+                      status: Optional[List[str]] = Query(default=None),
+                      resources: TaskResources = Depends(get_task_resources)
+                      ):
+    """
+    Endpoint streaming task changes as server-sent events.
+    Each event is named task.created, task.updated or task.deleted, carries the task as data and the
+    stream id as id. A client reconnecting with Last-Event-ID receives the events it missed from the
+    replay buffer, or a reset event when they are no longer buffered and it must reload its tasks.
+    Args:
+        request (Request): Incoming request, carrying Last-Event-ID.
+        user_id (Optional[int]): Only stream the changes to this user's tasks.
+        status (Optional[List[str]]): Only stream tasks in these statuses; repeat or comma-separate for several.
+        resources (TaskResources): Application-scoped resources holding the change feed.
+    Returns:
+        StreamingResponse: The text/event-stream response.
+    Raises:
+        HTTPException: 503 when this process already serves its maximum number of streams.
+    """
+    statuses = set(split_values(status))
+    feed = resources.event_feed
+    try:
+        subscription = feed.subscribe(parse_event_id(request.headers.get("last-event-id")))
+    except FeedFull as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"}) from exc
+    return StreamingResponse(feed.stream(subscription, user_id, statuses), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(feed.unsubscribe, subscription))
+
+
+@router.get("/me")
+def list_my_tasks(request: Request,
+                  status: Optional[List[str]] = Query(default=None),
+                  due_before: Optional[datetime] = Query(default=None),
+                  limit: int = Query(default=100, ge=1, le=1000),
+                  cursor: Optional[str] = Query(default=None),
+                  stream: bool = Query(default=False),
+                  fields: Optional[str] = Query(default=None),
+                  caller_id: int = Depends(get_current_user_id),
+                  service: TaskService = Depends(get_task_service)
+                  ):
+    """
+    Endpoint to list the tasks of the authenticated caller.
+    The caller is resolved from its bearer token in process, without calling the User Service.
+    Accepts the same filters, pagination and streaming options as the task listing.
+    Args:
+        request (Request): Incoming request, used for content negotiation.
+        status (Optional[List[str]]): Filter by task status; repeat or comma-separate for several.
+        due_before (Optional[datetime]): Filter tasks due before this timestamp.
+        limit (int): Maximum number of tasks per page.
+        cursor (Optional[str]): Cursor of the page to fetch.
+        stream (bool): Whether to stream all matching tasks as NDJSON.
+        fields (Optional[str]): Comma-separated sparse fieldset. Defaults to every field.
+        caller_id (int): ID of the authenticated user.
+        service (TaskService): Task service.
+    Returns:
+        Response: JSON array of the caller's tasks matching the filters, or an NDJSON stream.
+    Raises:
+        HTTPException: If the token is missing or invalid, the cursor is malformed or a field is unknown.
+    """
+    return list_tasks(request, status=status, due_before=due_before, user_id=caller_id, limit=limit,
+                      cursor=cursor, stream=stream, fields=fields, service=service)
+
+
+@router.get("/{task_id}")
+def get_task(task_id: int, request: Request, response: Response, service: TaskService = Depends(get_task_service)):
+    """
+    Endpoint to fetch a single task, served from the read-through cache when possible.
+    The response carries an ETag following the task's change version; a matching If-None-Match is
+    answered with 304 before the cache or the database is consulted.
+    Args:
+        task_id (int): ID of the task.
+        request (Request): Incoming request, carrying If-None-Match.
+        response (Response): Response whose headers carry the ETag.
+        service (TaskService): Task service.
+    Returns:
+        dict: The task details, or an empty 304 response.
+    Raises:
+        HTTPException: If the task is not found.
+    """
+    etag = service.versions.etag([task_version_key(task_id)])
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    try:
+        task = service.get_task(task_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return task
 
 
 @router.put("/{task_id}")
-def update_task(task_id: int, payload: UpdateTaskRequest, db: Session = Depends(get_task_db)):
+def update_task(task_id: int, payload: UpdateTaskRequest, service: TaskService = Depends(get_task_service)):
     """
     Endpoint to update the status of an existing task.
     Args:
         task_id (int): ID of the task to update.
         payload (UpdateTaskRequest): New status for the task.
-        db (Session): Database session.
+        service (TaskService): Task service.
     Returns:
         dict: Updated task details.
     Raises:
         HTTPException: If the task is not found.
     """
-    service = TaskService(db)
     try:
         task = service.update_task_status(task_id, payload.status)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
-    return {
-        "id": task.id,
-        "title": task.title,
-        "status": task.status,
-        "due_date": task.due_date.isoformat(),
-        "user_id": task.user_id,
-    }
+    return task_to_dict(task)
 
 
 @router.delete("/{task_id}")
-def delete_task(task_id: int, db: Session = Depends(get_task_db)):
+def delete_task(task_id: int, service: TaskService = Depends(get_task_service)):
     """
     Endpoint to delete a task.
     Args:
         task_id (int): ID of the task to delete.
-        db (Session): Database session.
+        service (TaskService): Task service.
     Returns:
         dict: Deletion confirmation.
     Raises:
         HTTPException: If the task is not found.
     """
-    service = TaskService(db)
     try:
         service.delete_task(task_id)
     except ValueError as exc:
@@ -104,29 +440,73 @@ def delete_task(task_id: int, db: Session = Depends(get_task_db)):
     return {"deleted": True}
 
 
+def _ndjson_lines(rows: Iterator[Row], encoder: TaskRowEncoder, batch_size: int = 500) -> Iterator[bytes]:
+    """
+    Encodes projected task rows as newline-delimited JSON, flushing every batch_size rows.
+    Args:
+        rows (Iterator[Row]): Rows to encode.
+        encoder (TaskRowEncoder): Encoder built for the selected fields.
+        batch_size (int): Number of rows written per chunk.
+    Returns:
+        Iterator[bytes]: Chunks of NDJSON.
+    """
+    buffer = []
+    for row in rows:
+        buffer.append(encoder.encode_row(row))
+        if len(buffer) >= batch_size:
+            yield ("\n".join(buffer) + "\n").encode("utf-8")
+            buffer.clear()
+    if buffer:
+        yield ("\n".join(buffer) + "\n").encode("utf-8")
+
+
 @router.get("")
-def list_tasks(status: Optional[str] = Query(default=None),
+def list_tasks(request: Request,
+               status: Optional[List[str]] = Query(default=None),
                due_before: Optional[datetime] = Query(default=None),
-               db: Session = Depends(get_task_db)
+               user_id: Optional[int] = Query(default=None),
+               limit: int = Query(default=100, ge=1, le=1000),
+               cursor: Optional[str] = Query(default=None),
+               stream: bool = Query(default=False),
+               fields: Optional[str] = Query(default=None),
+               service: TaskService = Depends(get_task_service)
                ):
     """
     Endpoint to list tasks with optional filtering.
+    Results are ordered by (due_date, id) and paginated with an opaque cursor returned in the
+    X-Next-Cursor header. With stream=true or an application/x-ndjson Accept header, every
+    matching task is streamed as NDJSON instead. Only the requested columns are read, and rows
+    are encoded straight into the response body. Responses carry an ETag following the change version
+    of the listed owner, or of the collection; a matching If-None-Match is answered with 304 before the
+    database is queried.
     Args:
-        status (Optional[str]): Filter by task status.
+        request (Request): Incoming request, used for content negotiation.
+        status (Optional[List[str]]): Filter by task status; repeat or comma-separate for several.
         due_before (Optional[datetime]): Filter tasks due before this timestamp.
-        db (Session): Database session.
-    Returns:
-        list[dict]: List of task details matching the filters.
-    """
-    service = TaskService(db)
-    tasks = service.list_tasks(status=status, due_before=due_before)
-    return [
-        {
-            "id": task.id,
-            "title": task.title,
-            "status": task.status,
-            "due_date": task.due_date.isoformat(),
-            "user_id": task.user_id,
-        }
-        for task in tasks
-    ]
+        user_id (Optional[int]): Filter by owner.
+        limit (int): Maximum number of tasks per page.
+        cursor (Optional[str]): Cursor of the page to fetch.
+        stream (bool): Whether to stream all matching tasks as NDJSON.
+        fields (Optional[str]): Comma-separated sparse fieldset, e.g. "id,status". Defaults to every field.
+        service (TaskService): Task service.
+    Returns:
+        Response: JSON array of the tasks matching the filters, an NDJSON stream, or an empty 304 response.
+    Raises:
+        HTTPException: If the cursor is malformed or a field is unknown.
+    """
+    statuses, selected = listing_filters(status, fields)
+    etag = listing_etag(request, service.versions, user_id)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    headers = {"ETag": etag} if etag is not None else {}
+    encoder = TaskRowEncoder(selected)
+    if wants_ndjson(request, stream):
+        rows = service.iter_task_rows(selected, status=statuses, due_before=due_before, user_id=user_id)
+        return StreamingResponse(_ndjson_lines(rows, encoder), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    try:
+        rows, next_cursor = service.list_task_rows(selected, status=statuses, due_before=due_before,
+                                                   user_id=user_id, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return rows_response(rows, encoder, headers, next_cursor)
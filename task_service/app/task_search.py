@@ -0,0 +1,106 @@
+"""
+Full-text search over task titles.
+Queries run against the index created with the schema (see task_db): the FTS5 table on SQLite, ranked
+with bm25, and the GIN tsvector index on PostgreSQL, ranked with ts_rank. Every word of the query must
+match the start of a word of the title, so "rep q" finds "Quarterly report". Results come best match
+first and are paginated on (rank, id). Other dialects fall back to a LIKE scan without ranking.
+"""
+import base64
+import json
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, Select, and_, column, func, literal, literal_column, select, table, tuple_
+
+from app.task_db import TITLE_SEARCH_CONFIG, TITLE_SEARCH_TABLE, Task
+
+MAX_SEARCH_TERMS = 16
+_WORD = re.compile(r"[^\W_]+")
+
+
+def search_terms(query: str) -> List[str]:
+    """
+    Splits a search query into the distinct lowercase words it is matched on.
+    Only letters and digits are kept, so nothing in the query reaches the index as syntax.
+    Args:
+        query (str): Text typed by the user.
+    Returns:
+        List[str]: Up to MAX_SEARCH_TERMS words, in query order.
+    Raises:
+        ValueError: If the query holds no word.
+    """
+    terms = list(dict.fromkeys(word.lower() for word in _WORD.findall(query)))
+    if not terms:
+        raise ValueError("Search query must contain a letter or digit")
+    return terms[:MAX_SEARCH_TERMS]
+
+
+def encode_search_cursor(row: Row) -> str:
+    """
+    Encodes the (rank, id) position of the last row of a page into an opaque cursor.
+    Args:
+        row (Row): Last row of a page returned by search_statement.
+    Returns:
+        str: URL-safe cursor.
+    """
+    raw = json.dumps([row.search_rank, row.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    Decodes a cursor produced by encode_search_cursor.
+    Args:
+        cursor (str): Opaque cursor.
+    Returns:
+        Tuple[float, int]: The (rank, id) position after which the next page starts.
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        rank, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(rank), int(task_id)
+    except (ValueError, TypeError, UnicodeEncodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def search_statement(dialect: str, fields: Sequence[str], terms: Sequence[str], criteria: Sequence = (),
+                     cursor: Optional[str] = None) -> Select:
+    """
+    Builds the ranked search query. Lower ranks are better on every dialect.
+    Args:
+        dialect (str): Name of the database dialect.
+        fields (Sequence[str]): Columns to select; they lead each row in this order, followed by the
+                                id when not requested and by search_rank.
+        terms (Sequence[str]): Words from search_terms, all of which must match.
+        criteria (Sequence): Further WHERE criteria, such as the list filters.
+        cursor (Optional[str]): Opaque cursor returned with the previous page.
+    Returns:
+        Select: The statement, ordered by (search_rank, id); the caller applies the limit.
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    columns = [getattr(Task, field) for field in fields]
+    if "id" not in fields:
+        columns.append(Task.id)
+    source = Task.__table__
+    if dialect == "sqlite":
+        index = table(TITLE_SEARCH_TABLE, column("rowid"))
+        source = source.join(index, index.c.rowid == Task.id)
+        match = literal_column(TITLE_SEARCH_TABLE).op("MATCH")(" ".join(f'"{term}"*' for term in terms))
+        rank = func.bm25(literal_column(TITLE_SEARCH_TABLE))
+    elif dialect == "postgresql":
+        config = literal_column(f"'{TITLE_SEARCH_CONFIG}'::regconfig")
+        vector = func.to_tsvector(config, Task.title)
+        query = func.to_tsquery(config, " & ".join(f"{term}:*" for term in terms))
+        match = vector.op("@@")(query)
+        rank = -func.ts_rank(vector, query)
+    else:
+        match = and_(*[Task.title.ilike(f"%{term}%") for term in terms])
+        rank = literal(0.0)
+    ranked = select(*columns, rank.label("search_rank")).select_from(source).where(match, *criteria).subquery()
+    statement = (select(*[ranked.c[col.key] for col in columns], ranked.c.search_rank)
+                 .order_by(ranked.c.search_rank, ranked.c.id))
+    if cursor:
+        statement = statement.where(tuple_(ranked.c.search_rank, ranked.c.id) > tuple_(*decode_search_cursor(cursor)))
+    return statement
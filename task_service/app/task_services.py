@@ -1,17 +1,53 @@
+# pylint: disable=too-many-lines
 """
 Service layer for managing tasks.
 This module contains the business logic for task operations and clients for external services.
 """
+import base64
+import hashlib
+import json
 import logging
 import os
+import time
+import uuid
+from collections import Counter
 from datetime import datetime
-from typing import Optional
+from json.encoder import encode_basestring_ascii
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import requests
 from redis import from_url, RedisError
+from redis.exceptions import NoScriptError
+from sqlalchemy import Row, delete, insert, select, tuple_, update
 from sqlalchemy.orm import Session
 
+from app.task_cache import SingleFlight, UserValidationCache
 from app.task_db import Task
+from app.task_events import TASK_CREATED, TASK_DELETED, TASK_UPDATED, TaskEvents
+from app.task_http import CircuitBreaker, GuardedCall, RetryPolicy, build_session
+from app.task_metrics import TimedRedis
+from app.task_search import encode_search_cursor, search_statement, search_terms
+from app.task_stats import TaskStats
+from app.task_versions import ChangeVersions, task_version_key
+
+StatusFilter = Union[str, Sequence[str], None]
+
+TASK_CACHE_TTL = int(os.getenv("TASK_CACHE_TTL", "300"))
+TASK_CACHE_LOCK_MS = 2000
+TASK_CACHE_LOCK_POLLS = 10
+TASK_CACHE_LOCK_POLL_INTERVAL = 0.02
+
+# KEYS[1]: cached task, KEYS[2]: its change version; ARGV: version read before loading the task, payload, TTL.
+TASK_CACHE_FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+TASK_CACHE_FILL_SHA = hashlib.sha1(TASK_CACHE_FILL_SCRIPT.encode("utf-8")).hexdigest()
+
+_TASK_LOADS = SingleFlight()
 
 
 class NullCache:
@@ -19,6 +55,25 @@ class NullCache:
     A fallback cache implementation that does nothing.
     Used when Redis is not available.
     """
+    def get(self, key):
+        """
+        Get a key from the void cache, which is always a miss.
+        """
+        _ = key
+
+    def mget(self, keys):
+        """
+        Get many keys from the void cache, which are always misses.
+        """
+        return [None] * len(keys)
+
+    def set(self, key, value, **kwargs):
+        """
+        Set a key in the void; conditional sets always succeed.
+        """
+        _ = (key, value, kwargs)
+        return True
+
     def setex(self, key, ttl, value):
         """
         Set a key with an expiration time in the void.
@@ -31,60 +86,504 @@ class NullCache:
         """
         _ = key
 
+    def incr(self, key):
+        """
+        Increment a key in the void.
+        """
+        _ = key
+        return 1
+
+    def hincrby(self, key, field, amount=1):
+        """
+        Increment a hash field in the void.
+        """
+        _ = (key, field)
+        return amount
+
+    def hget(self, key, field):
+        """
+        Get a hash field from the void cache, which is always a miss.
+        """
+        _ = (key, field)
+
+    def hgetall(self, key):
+        """
+        Get a hash from the void cache, which is always empty.
+        """
+        _ = key
+        return {}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        """
+        Set hash fields in the void.
+        """
+        _ = (key, field, value, mapping)
+        return 0
+
+    def publish(self, channel, message):
+        """
+        Publish a message to nobody.
+        """
+        _ = (channel, message)
+        return 0
+
+    def xadd(self, name, fields, **kwargs):
+        """
+        Append an entry to a stream in the void; nothing can read it back.
+        """
+        _ = (name, fields, kwargs)
+
+    def pipeline(self, transaction: bool = True):
+        """
+        The void cache batches commands by answering each of them as it would unbatched.
+        """
+        _ = transaction
+        return NullPipeline(self)
+
+    def close(self):
+        """
+        Nothing to release for the void cache.
+        """
+
+
+class NullPipeline:
+    """
+    Pipeline of the void cache, collecting the answer of every queued command.
+    """
+    def __init__(self, cache: NullCache):
+        """
+        Initializes an empty pipeline.
+        Args:
+            cache (NullCache): Cache answering the queued commands.
+        """
+        self._cache = cache
+        self._results = []
+
+    def __getattr__(self, name):
+        command = getattr(self._cache, name)
+
+        def queue(*args, **kwargs):
+            self._results.append(command(*args, **kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        """
+        Returns the answers of the queued commands, in order.
+        """
+        results, self._results = self._results, []
+        return results
+
+
+def connect_redis(redis_url: Optional[str] = None):
+    """
+    Builds a Redis client from the given URL or the REDIS_URL environment variable.
+    Args:
+        redis_url (Optional[str]): Redis connection URL. Defaults to REDIS_URL.
+    Returns:
+        A Redis client timing its commands, or a NullCache when no URL is configured or the URL is invalid.
+    """
+    redis_url = redis_url or os.getenv("REDIS_URL")
+    if not redis_url:
+        logging.warning("No redis URL found, using NullCache")
+        return NullCache()
+    try:
+        client = TimedRedis(from_url(redis_url))
+        logging.info("Connected to redis cache")
+        return client
+    except (ValueError, RedisError) as e:
+        logging.error("Error while trying to connect to redis: %s", e)
+        return NullCache()
+
+
+def task_to_dict(task: Task) -> dict:
+    """
+    Serializes a task for API responses and the read-through cache.
+    Args:
+        task (Task): Task to serialize.
+    Returns:
+        dict: The task details.
+    """
+    return {
+        "id": task.id,
+        "title": task.title,
+        "status": task.status,
+        "due_date": task.due_date.isoformat(),
+        "user_id": task.user_id,
+    }
+
+
+TASK_FIELDS = ("id", "title", "status", "due_date", "user_id")
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Parses a comma-separated sparse fieldset.
+    Args:
+        fields (Optional[str]): Requested fields, e.g. "id,status". Empty means every field.
+    Returns:
+        Tuple[str, ...]: The requested fields, in TASK_FIELDS order.
+    Raises:
+        ValueError: If a field is unknown.
+    """
+    requested = {part.strip() for part in (fields or "").split(",") if part.strip()}
+    unknown = requested.difference(TASK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in TASK_FIELDS if field in requested) if requested else TASK_FIELDS
+
+
+def _encode_int(value) -> str:
+    return "null" if value is None else str(value)
+
+
+def _encode_str(value) -> str:
+    return "null" if value is None else encode_basestring_ascii(value)
+
+
+def _encode_datetime(value) -> str:
+    return "null" if value is None else f'"{value.isoformat()}"'
+
+
+_FIELD_ENCODERS = {"id": _encode_int, "title": _encode_str, "status": _encode_str,
+                   "due_date": _encode_datetime, "user_id": _encode_int}
+
+
+class TaskRowEncoder:
+    """
+    JSON encoder for projected task rows, built once per fieldset.
+    Keys are pre-encoded and each column has a dedicated value encoder, so rows are written
+    straight to JSON text without intermediate dicts or a generic encoder pass.
+    """
+    def __init__(self, fields: Sequence[str] = TASK_FIELDS):
+        """
+        Initializes the encoder.
+        Args:
+            fields (Sequence[str]): Fields to write; rows carry them first, in this order.
+        """
+        self.fields = tuple(fields)
+        self._columns = [(index, f'"{field}":', _FIELD_ENCODERS[field]) for index, field in enumerate(self.fields)]
+
+    def encode_row(self, row: Sequence) -> str:
+        """
+        Encodes one row as a JSON object.
+        Args:
+            row (Sequence): Row whose leading values match the fields.
+        Returns:
+            str: The JSON object.
+        """
+        return "{" + ",".join([key + encode(row[index]) for index, key, encode in self._columns]) + "}"
+
+    def encode_rows(self, rows: Iterable[Sequence]) -> bytes:
+        """
+        Encodes rows as a JSON array.
+        Args:
+            rows (Iterable[Sequence]): Rows to encode.
+        Returns:
+            bytes: UTF-8 JSON array.
+        """
+        return ("[" + ",".join([self.encode_row(row) for row in rows]) + "]").encode("utf-8")
+
+    def encode_lines(self, rows: Iterable[Sequence]) -> bytes:
+        """
+        Encodes rows as newline-delimited JSON, one object per line.
+        Args:
+            rows (Iterable[Sequence]): Rows to encode.
+        Returns:
+            bytes: UTF-8 NDJSON, ending with a newline.
+        """
+        return "".join([self.encode_row(row) + "\n" for row in rows]).encode("utf-8")
+
+
+def task_cache_key(task_id: int) -> str:
+    """
+    Returns the Redis key holding a serialized task.
+    Args:
+        task_id (int): ID of the task.
+    Returns:
+        str: The cache key.
+    """
+    return f"task:{task_id}"
+
+
+def task_filters(status: StatusFilter = None, due_before: Optional[datetime] = None,
+                 user_id: Optional[int] = None) -> list:
+    """
+    Builds the WHERE criteria shared by the task list queries.
+    Args:
+        status (StatusFilter): Filter by one task status or any of several.
+        due_before (Optional[datetime]): Filter tasks due on or before this date.
+        user_id (Optional[int]): Filter by owner.
+    Returns:
+        list: SQLAlchemy criteria to combine with AND.
+    """
+    criteria = []
+    if user_id is not None:
+        criteria.append(Task.user_id == user_id)
+    statuses = [status] if isinstance(status, str) else list(status or [])
+    if len(statuses) == 1:
+        criteria.append(Task.status == statuses[0])
+    elif statuses:
+        criteria.append(Task.status.in_(statuses))
+    if due_before:
+        criteria.append(Task.due_date <= due_before)
+    return criteria
+
+
+def task_row_query(fields: Sequence[str], status: StatusFilter = None, due_before: Optional[datetime] = None,
+                   user_id: Optional[int] = None):
+    """
+    Builds the projected query of the lean list methods, ordered by (due_date, id).
+    The keyset columns are appended when not requested so cursors can always be built.
+    Args:
+        fields (Sequence[str]): Columns to select first.
+        status (StatusFilter): Filter by one task status or any of several.
+        due_before (Optional[datetime]): Filter tasks due on or before this date.
+        user_id (Optional[int]): Filter by owner.
+    Returns:
+        Select: The projected, filtered and ordered statement.
+    """
+    columns = [getattr(Task, field) for field in fields]
+    columns += [column for column in (Task.due_date, Task.id) if column.key not in fields]
+    return select(*columns).where(*task_filters(status, due_before, user_id)).order_by(Task.due_date, Task.id)
+
+
+def encode_cursor(task: Union[Task, Row]) -> str:
+    """
+    Encodes the keyset position of a task into an opaque pagination cursor.
+    Args:
+        task (Union[Task, Row]): Last task or projected row of a page.
+    Returns:
+        str: URL-safe cursor.
+    """
+    raw = json.dumps([task.due_date.isoformat(), task.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodes a cursor produced by encode_cursor.
+    Args:
+        cursor (str): Opaque cursor.
+    Returns:
+        Tuple[datetime, int]: The (due_date, id) position after which the next page starts.
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        due_date, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(due_date), int(task_id)
+    except (ValueError, TypeError, UnicodeEncodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+class TaskNotFound(ValueError):
+    """
+    Raised when a task does not exist.
+    """
+
+
+class UserServiceUnavailable(RuntimeError):
+    """
+    Raised when the User Service cannot give an answer (circuit open, timeouts, 5xx).
+    """
+
+
+def user_service_call(breaker: CircuitBreaker, retry_policy: RetryPolicy) -> GuardedCall:
+    """
+    Starts a call to the User Service, shared by the sync and asyncio clients.
+    Args:
+        breaker (CircuitBreaker): Circuit breaker guarding the User Service.
+        retry_policy (RetryPolicy): Retry schedule for failed attempts.
+    Returns:
+        GuardedCall: The call, raising UserServiceUnavailable when it gets no answer.
+    """
+    return GuardedCall("user_service", breaker, retry_policy, UserClient.RETRYABLE_STATUSES, UserServiceUnavailable)
+
+
+def user_exists(status_code: int) -> Optional[bool]:
+    """
+    Reads the answer of the User Service to a user lookup.
+    Args:
+        status_code (int): Status of the GET /users/{id} response.
+    Returns:
+        Optional[bool]: True on 200, False on 404, None for any other answer.
+    """
+    if status_code == 200:
+        return True
+    if status_code == 404:
+        return False
+    return None
+
 
 class UserClient:
     """
     Client for interacting with the User Service.
+    Calls go through a pooled keep-alive session, bounded jittered retries and a circuit breaker.
     """
-    def __init__(self, base_url: Optional[str] = None):
+    RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, base_url: Optional[str] = None, session: Optional[requests.Session] = None,
+                 cache: Optional[UserValidationCache] = None, timeout=(1.0, 3.0),
+                 retry_policy: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                 sleep: Callable[[float], None] = time.sleep):
         """
         Initializes the UserClient.
         Args:
             base_url (Optional[str]): Base URL for the User Service. 
                                      Defaults to USER_SERVICE_URL environment variable.
+            session (Optional[requests.Session]): HTTP session whose connections are reused
+                                                  across calls. Defaults to a new pooled session.
+            cache (Optional[UserValidationCache]): Cache of validation results. Disabled when None.
+            timeout: Per-attempt (connect, read) timeout in seconds.
+            retry_policy (Optional[RetryPolicy]): Retry schedule for failed attempts.
+            breaker (Optional[CircuitBreaker]): Circuit breaker guarding the User Service.
+            sleep (Callable[[float], None]): Sleep function used between retries.
         """
         self.base_url = base_url or os.getenv("USER_SERVICE_URL")
+        self.session = session or build_session()
+        self.cache = cache
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+
+    @classmethod
+    def from_env(cls, session: Optional[requests.Session] = None,
+                 cache: Optional[UserValidationCache] = None) -> "UserClient":
+        """
+        Builds a client configured by the USER_SERVICE_* environment variables.
+        Args:
+            session (Optional[requests.Session]): Shared HTTP session. Defaults to a session
+                                                  sized by USER_SERVICE_POOL_SIZE.
+            cache (Optional[UserValidationCache]): Cache of validation results.
+        Returns:
+            UserClient: The configured client.
+        """
+        return cls(
+            session=session or build_session(int(os.getenv("USER_SERVICE_POOL_SIZE", "10"))),
+            cache=cache,
+            timeout=(float(os.getenv("USER_SERVICE_CONNECT_TIMEOUT", "1.0")),
+                     float(os.getenv("USER_SERVICE_READ_TIMEOUT", "3.0"))),
+            retry_policy=RetryPolicy(retries=int(os.getenv("USER_SERVICE_RETRIES", "2")),
+                                     backoff=float(os.getenv("USER_SERVICE_RETRY_BACKOFF", "0.05"))),
+            breaker=CircuitBreaker(failure_threshold=int(os.getenv("USER_SERVICE_BREAKER_THRESHOLD", "5")),
+                                   reset_timeout=float(os.getenv("USER_SERVICE_BREAKER_RESET", "30"))),
+        )
 
     def validate_user(self, user_id: int) -> bool:
         """
-        Validates if a user exists by calling the User Service.
+        Validates if a user exists, consulting the cache before calling the User Service.
         Args:
             user_id (int): ID of the user to validate.
         Returns:
             bool: True if user exists, False otherwise.
+        Raises:
+            UserServiceUnavailable: If the User Service cannot be reached.
         """
-        response = requests.get(f"{self.base_url}/users/{user_id}", timeout=3)
-        return response.status_code == 200
+        if self.cache is None:
+            return bool(self._fetch_user(user_id))
+        return bool(self.cache.get_or_load(user_id, self._fetch_user))
+
+    def validate_users(self, user_ids: Iterable[int]) -> Dict[int, bool]:
+        """
+        Validates many users with as few User Service calls as possible.
+        Args:
+            user_ids (Iterable[int]): IDs of the users to validate.
+        Returns:
+            Dict[int, bool]: Existence per distinct user ID.
+        Raises:
+            UserServiceUnavailable: If the User Service cannot be reached.
+        """
+        ids = list(dict.fromkeys(user_ids))
+        if self.cache is None:
+            found = self._fetch_users(ids)
+        else:
+            found = self.cache.get_or_load_many(ids, self._fetch_users)
+        return {user_id: bool(found.get(user_id)) for user_id in ids}
+
+    def get_users(self, user_ids: Iterable[int]) -> Dict[int, dict]:
+        """
+        Fetches many users through the bulk lookup endpoint, one call per LOOKUP_BATCH_SIZE ids.
+        Args:
+            user_ids (Iterable[int]): IDs of the users to fetch.
+        Returns:
+            Dict[int, dict]: User details keyed by ID; unknown users are absent.
+        Raises:
+            UserServiceUnavailable: If the User Service cannot be reached or rejects the lookup.
+        """
+        ids = list(dict.fromkeys(user_ids))
+        users = {}
+        for start in range(0, len(ids), self.LOOKUP_BATCH_SIZE):
+            response = self._request("POST", "/users/lookup", json={"ids": ids[start:start + self.LOOKUP_BATCH_SIZE]})
+            if response.status_code != 200:
+                raise UserServiceUnavailable(f"User lookup failed with status {response.status_code}")
+            users.update({user["id"]: user for user in response.json()["users"]})
+        return users
+
+    def _fetch_users(self, user_ids: List[int]) -> Dict[int, bool]:
+        """
+        Asks the User Service which of the given users exist.
+        Args:
+            user_ids (List[int]): IDs of the users to look up.
+        Returns:
+            Dict[int, bool]: Existence per user ID.
+        """
+        users = self.get_users(user_ids)
+        return {user_id: user_id in users for user_id in user_ids}
+
+    def _fetch_user(self, user_id: int) -> Optional[bool]:
+        """
+        Asks the User Service whether a user exists.
+        Args:
+            user_id (int): ID of the user to look up.
+        Returns:
+            Optional[bool]: True on 200, False on 404, None for any other answer.
+        """
+        return user_exists(self._request("GET", f"/users/{user_id}").status_code)
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through the circuit breaker, retrying transient failures.
+        Args:
+            method (str): HTTP method.
+            path (str): Path relative to the base URL.
+            **kwargs: Extra arguments passed to the session.
+        Returns:
+            requests.Response: The first non-retryable response.
+        Raises:
+            UserServiceUnavailable: If the circuit is open, every attempt failed or the request was malformed.
+        """
+        url = f"{self.base_url}{path}"
+        return user_service_call(self.breaker, self.retry_policy).send(
+            lambda: self.session.request(method, url, timeout=self.timeout, **kwargs),
+            (requests.ConnectionError, requests.Timeout), (requests.RequestException,), self._sleep)
 
 
 class TaskService:
     """
     Service class for task-related business logic.
     """
-    def __init__(self, db: Session, user_client: Optional[UserClient] = None, redis_client=None):
+    def __init__(self, db: Session, user_client: Optional[UserClient] = None, redis_client=None,
+                 stats: Optional[TaskStats] = None, versions: Optional[ChangeVersions] = None,
+                 events: Optional[TaskEvents] = None):
         """
         Initializes the TaskService.
         Args:
             db (Session): SQLAlchemy database session.
             user_client (Optional[UserClient]): Client for user validation.
             redis_client: Redis client for caching. Defaults to connecting via REDIS_URL.
+            stats (Optional[TaskStats]): Task counters. Defaults to counters on redis_client.
+            versions (Optional[ChangeVersions]): Change versions behind the ETags. Defaults to versions on redis_client.
+            events (Optional[TaskEvents]): Change feed publisher. Defaults to the feed on redis_client.
         """
         self.db = db
         self.user_client = user_client or UserClient()
-        if redis_client is not None:
-            self.redis_client = redis_client
-        else:
-            redis_url = os.getenv("REDIS_URL")
-            if not redis_url:
-                logging.warning("No redis URL found, using NullCache")
-                self.redis_client = NullCache()
-            else:
-                try:
-                    self.redis_client = from_url(redis_url)
-                    logging.info("Connected to redis cache")
-                except [ValueError, RedisError] as e:
-                    logging.error("Error while trying to connect to redis: %s", e)
-                    self.redis_client = NullCache()
+        self.redis_client = redis_client if redis_client is not None else connect_redis()
+        self.stats = stats or TaskStats(self.redis_client)
+        self.versions = versions or ChangeVersions(self.redis_client)
+        self.events = events or TaskEvents(self.redis_client)
 
     def create_task(self, title: str, user_id: int, due_date: datetime) -> Task:
         """
@@ -97,6 +596,7 @@ class TaskService:
             Task: The created Task object.
         Raises:
             ValueError: If the user is unknown.
+            UserServiceUnavailable: If the User Service cannot be reached.
         """
         if not self.user_client.validate_user(user_id):
             raise ValueError("Unknown user")
@@ -104,9 +604,42 @@ class TaskService:
         self.db.add(task)
         self.db.commit()
         self.db.refresh(task)
-        self._cache_status(task.id, task.status)
+        self.versions.bump([task.id], [task.user_id])
+        self._cache_task(task)
+        self.stats.record_created([(task.status, task.user_id)])
+        self.events.publish(TASK_CREATED, [task_to_dict(task)])
         return task
 
+    def create_tasks(self, items: List[dict]) -> List[Union[Task, ValueError]]:
+        """
+        Creates many tasks at once.
+        Distinct users are validated with one batched lookup, valid rows are inserted with a single bulk statement
+        in one transaction, and the new tasks are cached through one Redis pipeline.
+        Args:
+            items (List[dict]): Task payloads with title, user_id and due_date keys.
+        Returns:
+            List[Union[Task, ValueError]]: Per item, in input order, the created Task
+                                           or the error that rejected it.
+        Raises:
+            UserServiceUnavailable: If the User Service cannot be reached.
+        """
+        valid_users = self.user_client.validate_users(list(dict.fromkeys(item["user_id"] for item in items)))
+        rows = [{"title": item["title"], "user_id": item["user_id"], "due_date": item["due_date"]}
+                for item in items if valid_users[item["user_id"]]]
+        created = []
+        if rows:
+            created = self.db.scalars(insert(Task).returning(Task, sort_by_parameter_order=True), rows).all()
+        payloads = [task_to_dict(task) for task in created]
+        self.db.commit()
+        created = iter(created)
+        results = [next(created) if valid_users[item["user_id"]] else ValueError("Unknown user")
+                   for item in items]
+        self.versions.bump([payload["id"] for payload in payloads], [payload["user_id"] for payload in payloads])
+        self._cache_tasks(payloads)
+        self.stats.record_created((payload["status"], payload["user_id"]) for payload in payloads)
+        self.events.publish(TASK_CREATED, payloads)
+        return results
+
     def update_task_status(self, task_id: int, status: str) -> Task:
         """
         Updates the status of an existing task.
@@ -116,16 +649,21 @@ class TaskService:
         Returns:
             Task: The updated Task object.
         Raises:
-            ValueError: If the task is not found.
+            TaskNotFound: If the task is not found.
         """
         task = self.db.query(Task).filter(Task.id == task_id).first()
         if not task:
-            raise ValueError("Task not found")
+            raise TaskNotFound("Task not found")
+        previous = task.status
         task.status = status
         self.db.add(task)
         self.db.commit()
         self.db.refresh(task)
-        self._cache_status(task.id, task.status)
+        self.versions.bump([task.id], [task.user_id])
+        self._cache_task(task)
+        if previous != status:
+            self.stats.record_status_change({previous: 1}, status)
+        self.events.publish(TASK_UPDATED, [task_to_dict(task)])
         return task
 
     def delete_task(self, task_id: int) -> None:
@@ -134,42 +672,416 @@ class TaskService:
         Args:
             task_id (int): ID of the task to delete.
         Raises:
-            ValueError: If the task is not found.
+            TaskNotFound: If the task is not found.
         """
         task = self.db.query(Task).filter(Task.id == task_id).first()
         if not task:
-            raise ValueError("Task not found")
+            raise TaskNotFound("Task not found")
+        counted = (task.status, task.user_id)
         self.db.delete(task)
         self.db.commit()
+        self.versions.bump([task_id], [counted[1]])
         try:
-            self.redis_client.delete(f"task:{task_id}")
-        except RuntimeError:
+            self.redis_client.delete(task_cache_key(task_id))
+        except RedisError:
             logging.error("Failed to delete task from redis cache")
+        self.stats.record_deleted([counted])
+        self.events.publish(TASK_DELETED, [{"id": task_id, "status": counted[0], "user_id": counted[1]}])
+
+    def update_tasks_status(self, new_status: str, ids: Optional[Sequence[int]] = None,
+                            status: StatusFilter = None, due_before: Optional[datetime] = None,
+                            user_id: Optional[int] = None) -> int:
+        """
+        Sets the status of every task matching the ids and filters with one UPDATE statement.
+        The statement also returns the status each task had, from the rows it locked, so the statistics move
+        exactly the tasks it changed. Other dialects cannot return the columns of the FROM clause, so there the
+        previous statuses are read from the locked rows by a SELECT in the same transaction.
+        The cached copies of the updated tasks are refreshed through one Redis pipeline.
+        Args:
+            new_status (str): Status to set.
+            ids (Optional[Sequence[int]]): Restrict the update to these task ids.
+            status (StatusFilter): Filter by one current status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+        Returns:
+            int: Number of tasks updated.
+        Raises:
+            ValueError: If neither ids nor a filter is given.
+        """
+        criteria = self._bulk_criteria(ids, status, due_before, user_id)
+        old = select(Task.id, Task.status.label("old_status")).where(*criteria).with_for_update()
+        if self.db.get_bind().dialect.name == "postgresql":
+            old = old.subquery()
+            rows = self.db.execute(update(Task).where(Task.id == old.c.id).values(status=new_status)
+                                   .returning(Task, old.c.old_status)).all()
+        else:
+            old_statuses = dict(self.db.execute(old).all())
+            tasks = self.db.scalars(update(Task).where(*criteria).values(status=new_status).returning(Task)).all()
+            rows = [(task, old_statuses.get(task.id, new_status)) for task in tasks]
+        payloads = [task_to_dict(task) for task, _ in rows]
+        previous = Counter(old_status for _, old_status in rows if old_status != new_status)
+        self.db.commit()
+        self.versions.bump([payload["id"] for payload in payloads], [payload["user_id"] for payload in payloads])
+        self._cache_tasks(payloads)
+        self.stats.record_status_change(previous, new_status)
+        self.events.publish(TASK_UPDATED, payloads)
+        return len(payloads)
 
-    def list_tasks(self, status: Optional[str] = None, due_before: Optional[datetime] = None):
+    def delete_tasks(self, ids: Optional[Sequence[int]] = None, status: StatusFilter = None,
+                     due_before: Optional[datetime] = None, user_id: Optional[int] = None) -> int:
         """
-        Lists tasks with optional status and due date filters.
+        Deletes every task matching the ids and filters with one DELETE statement.
+        The cached copies of the deleted tasks are removed through one Redis pipeline.
         Args:
-            status (Optional[str]): Filter by task status.
+            ids (Optional[Sequence[int]]): Restrict the deletion to these task ids.
+            status (StatusFilter): Filter by one task status or any of several.
             due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+        Returns:
+            int: Number of tasks deleted.
+        Raises:
+            ValueError: If neither ids nor a filter is given.
+        """
+        criteria = self._bulk_criteria(ids, status, due_before, user_id)
+        deleted = self.db.execute(delete(Task).where(*criteria).returning(Task.id, Task.status, Task.user_id)).all()
+        self.db.commit()
+        self.versions.bump([row.id for row in deleted], [row.user_id for row in deleted])
+        self._uncache_tasks([row.id for row in deleted])
+        self.stats.record_deleted((row.status, row.user_id) for row in deleted)
+        self.events.publish(TASK_DELETED, [row._asdict() for row in deleted])
+        return len(deleted)
+
+    def get_stats(self, user_id: Optional[int] = None) -> dict:
+        """
+        Returns task counts by status, by owner and overdue from the maintained counters.
+        Args:
+            user_id (Optional[int]): Restrict the per-owner counts to this user.
+        Returns:
+            dict: The task statistics.
+        """
+        return self.stats.read(self.db, user_id)
+
+    def get_task(self, task_id: int) -> dict:
+        """
+        Returns a serialized task through the read-through cache.
+        On a miss, concurrent readers in this process share one load, and across processes a
+        short Redis lock lets a single reader hit the database while the others wait for the
+        cache to be filled. The fill is dropped when a write bumped the task's change version
+        meanwhile, so a task read just before an update is never cached after it. When Redis is
+        unavailable the task is read from the database.
+        Args:
+            task_id (int): ID of the task.
+        Returns:
+            dict: The task details.
+        Raises:
+            TaskNotFound: If the task is not found.
+        """
+        cached = self._cached_task(task_id)
+        if cached is not None:
+            return cached
+        return _TASK_LOADS.do(task_id, lambda: self._load_task(task_id))
+
+    def list_tasks(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                   user_id: Optional[int] = None):
+        """
+        Lists tasks with optional status, due date and owner filters.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
         Returns:
             List[Task]: List of Task objects.
         """
-        query = self.db.query(Task)
-        if status:
-            query = query.filter(Task.status == status)
-        if due_before:
-            query = query.filter(Task.due_date <= due_before)
-        return query.all()
+        return self._task_query(status, due_before, user_id).all()
+
+    def list_tasks_page(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                        user_id: Optional[int] = None, limit: int = 100,
+                        cursor: Optional[str] = None) -> Tuple[List[Task], Optional[str]]:
+        """
+        Lists one page of tasks ordered by (due_date, id) using keyset pagination.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            limit (int): Maximum number of tasks in the page.
+            cursor (Optional[str]): Opaque cursor returned with the previous page.
+        Returns:
+            Tuple[List[Task], Optional[str]]: The page and the cursor of the next one, if any.
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        query = self._task_query(status, due_before, user_id).order_by(Task.due_date, Task.id)
+        if cursor:
+            query = query.filter(tuple_(Task.due_date, Task.id) > tuple_(*decode_cursor(cursor)))
+        tasks = query.limit(limit + 1).all()
+        if len(tasks) <= limit:
+            return tasks, None
+        return tasks[:limit], encode_cursor(tasks[limit - 1])
+
+    def iter_tasks(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                   user_id: Optional[int] = None, chunk_size: int = 500) -> Iterator[Task]:
+        """
+        Iterates over matching tasks ordered by (due_date, id), fetching chunk_size rows at a time.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            chunk_size (int): Number of rows buffered per fetch.
+        Returns:
+            Iterator[Task]: Matching tasks.
+        """
+        query = self._task_query(status, due_before, user_id).order_by(Task.due_date, Task.id)
+        yield from query.yield_per(chunk_size)
+
+    def list_task_rows(self, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                       due_before: Optional[datetime] = None, user_id: Optional[int] = None, limit: int = 100,
+                       cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+        """
+        Lean variant of list_tasks_page that selects only the requested columns as plain rows.
+        No ORM instances are built, so nothing enters the identity map.
+        Args:
+            fields (Sequence[str]): Columns to select; they lead each row in this order.
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            limit (int): Maximum number of rows in the page.
+            cursor (Optional[str]): Opaque cursor returned with the previous page.
+        Returns:
+            Tuple[List[Row], Optional[str]]: The page and the cursor of the next one, if any.
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        query = task_row_query(fields, status, due_before, user_id)
+        if cursor:
+            query = query.where(tuple_(Task.due_date, Task.id) > tuple_(*decode_cursor(cursor)))
+        rows = self.db.execute(query.limit(limit + 1)).all()
+        if len(rows) <= limit:
+            return rows, None
+        return rows[:limit], encode_cursor(rows[limit - 1])
+
+    def iter_task_rows(self, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                       due_before: Optional[datetime] = None, user_id: Optional[int] = None,
+                       chunk_size: int = 500) -> Iterator[Row]:
+        """
+        Lean variant of iter_tasks yielding projected rows, fetched chunk_size at a time.
+        Args:
+            fields (Sequence[str]): Columns to select; they lead each row in this order.
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            chunk_size (int): Number of rows buffered per fetch.
+        Returns:
+            Iterator[Row]: Matching rows.
+        """
+        query = task_row_query(fields, status, due_before, user_id).execution_options(yield_per=chunk_size)
+        yield from self.db.execute(query)
+
+    def search_task_rows(self, query: str, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                         due_before: Optional[datetime] = None, user_id: Optional[int] = None, limit: int = 100,
+                         cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+        """
+        Searches task titles through the full-text index, best matches first, one page at a time.
+        Every word of the query must match the start of a word of the title; the list filters apply too.
+        Args:
+            query (str): Words to look for.
+            fields (Sequence[str]): Columns to select; they lead each row in this order.
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+            limit (int): Maximum number of rows in the page.
+            cursor (Optional[str]): Opaque cursor returned with the previous page.
+        Returns:
+            Tuple[List[Row], Optional[str]]: The page and the cursor of the next one, if any.
+        Raises:
+            ValueError: If the query holds no word or the cursor is malformed.
+        """
+        statement = search_statement(self.db.get_bind().dialect.name, fields, search_terms(query),
+                                     task_filters(status, due_before, user_id), cursor)
+        rows = self.db.execute(statement.limit(limit + 1)).all()
+        if len(rows) <= limit:
+            return rows, None
+        return rows[:limit], encode_search_cursor(rows[limit - 1])
+
+    def _task_query(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                    user_id: Optional[int] = None):
+        """
+        Builds the task query shared by the list methods.
+        Args:
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+        Returns:
+            Query: The filtered query.
+        """
+        return self.db.query(Task).filter(*task_filters(status, due_before, user_id))
+
+    @staticmethod
+    def _bulk_criteria(ids: Optional[Sequence[int]], status: StatusFilter, due_before: Optional[datetime],
+                       user_id: Optional[int]) -> list:
+        """
+        Builds the WHERE criteria of a bulk operation, refusing to target the whole table.
+        Args:
+            ids (Optional[Sequence[int]]): Restrict the operation to these task ids.
+            status (StatusFilter): Filter by one task status or any of several.
+            due_before (Optional[datetime]): Filter tasks due on or before this date.
+            user_id (Optional[int]): Filter by owner.
+        Returns:
+            list: SQLAlchemy criteria to combine with AND.
+        Raises:
+            ValueError: If neither ids nor a filter is given.
+        """
+        criteria = task_filters(status, due_before, user_id)
+        if ids is not None:
+            criteria.append(Task.id.in_(list(ids)))
+        if not criteria:
+            raise ValueError("Task ids or a filter are required")
+        return criteria
+
+    def _load_task(self, task_id: int) -> dict:
+        """
+        Loads a task from the database under the cache-fill lock and caches it.
+        Args:
+            task_id (int): ID of the task.
+        Returns:
+            dict: The task details.
+        Raises:
+            TaskNotFound: If the task is not found.
+        """
+        lock_key = f"{task_cache_key(task_id)}:lock"
+        token = uuid.uuid4().hex
+        try:
+            locked = self.redis_client.set(lock_key, token, nx=True, px=TASK_CACHE_LOCK_MS)
+        except RedisError:
+            logging.warning("Redis unavailable, reading task %s from the database", task_id)
+            locked = None
+        if locked is False:
+            for _ in range(TASK_CACHE_LOCK_POLLS):
+                time.sleep(TASK_CACHE_LOCK_POLL_INTERVAL)
+                cached = self._cached_task(task_id)
+                if cached is not None:
+                    return cached
+        try:
+            version = self._task_version(task_id) if locked else None
+            task = self.db.query(Task).filter(Task.id == task_id).first()
+            if not task:
+                raise TaskNotFound("Task not found")
+            if version is not None:
+                self._fill_cache(task, version)
+            return task_to_dict(task)
+        finally:
+            if locked:
+                self._release_lock(lock_key, token)
+
+    def _cached_task(self, task_id: int) -> Optional[dict]:
+        """
+        Reads a serialized task from Redis.
+        Args:
+            task_id (int): ID of the task.
+        Returns:
+            Optional[dict]: The cached task, or None on a miss, an unreadable entry or a Redis error.
+        """
+        try:
+            raw = self.redis_client.get(task_cache_key(task_id))
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _release_lock(self, lock_key: str, token: str) -> None:
+        """
+        Releases the cache-fill lock if this reader still owns it.
+        Args:
+            lock_key (str): Redis key of the lock.
+            token (str): Token written when the lock was taken.
+        """
+        try:
+            owner = self.redis_client.get(lock_key)
+            if owner in (token, token.encode("ascii")):
+                self.redis_client.delete(lock_key)
+        except RedisError:
+            logging.warning("Failed to release task cache lock %s", lock_key)
+
+    def _cache_task(self, task: Task) -> None:
+        """
+        Caches the serialized task in Redis, replacing any previous version.
+        Args:
+            task (Task): Task to cache.
+        """
+        try:
+            self.redis_client.setex(task_cache_key(task.id), TASK_CACHE_TTL, json.dumps(task_to_dict(task)))
+        except RedisError:
+            logging.error("Failed to cache task in redis")
+
+    def _task_version(self, task_id: int) -> Optional[str]:
+        """
+        Reads the change version of a task, as the cache fill script compares it.
+        Args:
+            task_id (int): ID of the task.
+        Returns:
+            Optional[str]: The version, empty when the task was never written, or None on a Redis error.
+        """
+        try:
+            version = self.redis_client.get(task_version_key(task_id))
+        except RedisError:
+            return None
+        if isinstance(version, bytes):
+            return version.decode("ascii")
+        return "" if version is None else str(version)
+
+    def _fill_cache(self, task: Task, version: str) -> None:
+        """
+        Caches a task loaded on a miss, unless a write bumped its change version since version was read.
+        Writers bump the version before refreshing the cache, so a fill that read the row before a write
+        either lands before the writer's refresh or is refused.
+        Args:
+            task (Task): Task read from the database.
+            version (str): Change version read before the task was.
+        """
+        if not callable(getattr(self.redis_client, "evalsha", None)):
+            return  # Clients without scripting, such as the NullCache, hold no cache to fill.
+        args = (task_cache_key(task.id), task_version_key(task.id), version, json.dumps(task_to_dict(task)),
+                TASK_CACHE_TTL)
+        try:
+            try:
+                self.redis_client.evalsha(TASK_CACHE_FILL_SHA, 2, *args)
+            except NoScriptError:
+                self.redis_client.eval(TASK_CACHE_FILL_SCRIPT, 2, *args)
+        except RedisError:
+            logging.error("Failed to cache task in redis")
+
+    def _cache_tasks(self, payloads: List[dict]) -> None:
+        """
+        Caches many serialized tasks in Redis with a single pipeline round trip.
+        Callers serialize before committing, so expired instances are not reloaded one by one.
+        Args:
+            payloads (List[dict]): Serialized tasks to cache.
+        """
+        if not payloads:
+            return
+        try:
+            pipe = self.redis_client.pipeline()
+            for payload in payloads:
+                pipe.setex(task_cache_key(payload["id"]), TASK_CACHE_TTL, json.dumps(payload))
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to cache tasks in redis")
 
-    def _cache_status(self, task_id: int, status: str) -> None:
+    def _uncache_tasks(self, task_ids: List[int]) -> None:
         """
-        Caches the task status in Redis.
+        Removes many tasks from Redis with a single pipeline round trip.
         Args:
-            task_id (int): Task ID.
-            status (str): Status to cache.
+            task_ids (List[int]): IDs of the tasks to remove.
         """
+        if not task_ids:
+            return
         try:
-            self.redis_client.setex(f"task:{task_id}", 300, status)
-        except RuntimeError:
-            logging.error("Failed to cache task status in redis")
+            pipe = self.redis_client.pipeline()
+            for task_id in task_ids:
+                pipe.delete(task_cache_key(task_id))
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to delete tasks from redis cache")
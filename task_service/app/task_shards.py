@@ -0,0 +1,396 @@
+"""
+Horizontal sharding of the tasks table by owner.
+Shard 0 is the TASK_DATABASE_URL database; TASK_SHARD_URLS lists the databases of the further shards, in a
+fixed order to which shards are only ever appended. Each owner lives on the shard picked by a jump consistent
+hash of its id, so adding a shard only moves the owners that now hash to it (see task_rebalance). Each shard
+numbers its new tasks from its own id range, which keeps task ids unique across shards and tells where a task
+was created. Writes and reads restricted to one owner go to that owner's shard; other reads are sent to every
+shard in parallel and their ordered results merged.
+"""
+import heapq
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.task_db import ENGINE, SHARD_ENGINES, Base, Task, pool_options
+from app.task_metrics import instrument_engine
+from app.task_search import encode_search_cursor
+from app.task_services import StatusFilter, TASK_FIELDS, TaskNotFound, TaskService, encode_cursor
+
+MAX_SHARDS = 16
+SHARD_ID_SPAN = (2 ** 31 - 1) // MAX_SHARDS
+
+T = TypeVar("T")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping and Veach): maps a key to one of buckets so that going from n to n + 1
+    buckets only moves the keys that land in the new one.
+    Args:
+        key (int): Key to place, here a user id.
+        buckets (int): Number of buckets.
+    Returns:
+        int: Bucket index in [0, buckets).
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_id_range(index: int) -> Tuple[int, int]:
+    """
+    Returns the ids a shard gives to the tasks created on it.
+    Args:
+        index (int): Shard index.
+    Returns:
+        Tuple[int, int]: First and last id of the range.
+    """
+    return index * SHARD_ID_SPAN + 1, (index + 1) * SHARD_ID_SPAN
+
+
+class ShardRouter:
+    """
+    The shard databases, the mapping of owners to shards and the threads running cross-shard queries.
+    """
+    def __init__(self, engines: Sequence[Engine], fan_out_threads: Optional[int] = None):
+        """
+        Initializes the router.
+        Args:
+            engines (Sequence[Engine]): Engine of each shard, in shard order.
+            fan_out_threads (Optional[int]): Threads shared by the cross-shard queries. Defaults to 4 per shard.
+        Raises:
+            ValueError: If there are no engines or more than MAX_SHARDS.
+        """
+        if not 1 <= len(engines) <= MAX_SHARDS:
+            raise ValueError(f"Between 1 and {MAX_SHARDS} shards are supported")
+        self.engines = list(engines)
+        self.session_factories = [sessionmaker(autocommit=False, autoflush=False, bind=engine) for engine in engines]
+        self._executor = ThreadPoolExecutor(max_workers=fan_out_threads or 4 * len(engines),
+                                            thread_name_prefix="task-shards")
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @classmethod
+    def from_env(cls) -> Optional["ShardRouter"]:
+        """
+        Builds the router from TASK_SHARD_URLS, a comma-separated list of the database URLs of shards 1 and up.
+        Returns:
+            Optional[ShardRouter]: The router, or None when the tasks are not sharded.
+        """
+        urls = [url.strip() for url in os.getenv("TASK_SHARD_URLS", "").split(",") if url.strip()]
+        if not urls:
+            return None
+        engines = [ENGINE]
+        for url in urls:
+            engine = create_engine(url, **pool_options(url))
+            instrument_engine(engine)
+            engines.append(engine)
+        SHARD_ENGINES.extend(engines[1:])
+        threads = os.getenv("TASK_SHARD_FAN_OUT_THREADS")
+        return cls(engines, fan_out_threads=int(threads) if threads else None)
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def shard_for(self, user_id: int) -> int:
+        """
+        Returns the shard holding an owner's tasks.
+        Args:
+            user_id (int): ID of the owner.
+        Returns:
+            int: Shard index.
+        """
+        return jump_hash(user_id, len(self.engines))
+
+    def home_shard(self, task_id: int) -> int:
+        """
+        Returns the shard a task was created on, which holds it unless its owner was rebalanced since.
+        Args:
+            task_id (int): ID of the task.
+        Returns:
+            int: Shard index, possibly beyond the configured shards for a malformed id.
+        """
+        return max(task_id - 1, 0) // SHARD_ID_SPAN
+
+    def init_schema(self) -> None:
+        """
+        Creates the tables on every shard and moves each shard's id sequence into its range, once per process.
+        """
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            for index, engine in enumerate(self.engines):
+                Base.metadata.create_all(bind=engine)
+                with engine.begin() as conn:
+                    _position_id_sequence(conn, index)
+            self._schema_ready = True
+
+    def sessions(self, first: Optional[Session] = None) -> "ShardSessions":
+        """
+        Opens a set of sessions, one per shard on first use.
+        Args:
+            first (Optional[Session]): Session already open on shard 0, such as the request session.
+        Returns:
+            ShardSessions: The sessions; closing them leaves first open.
+        """
+        self.init_schema()
+        return ShardSessions(self, first)
+
+    def fan_out(self, calls: Dict[int, Callable[[], T]]) -> Dict[int, T]:
+        """
+        Runs one call per shard in parallel.
+        Args:
+            calls (Dict[int, Callable[[], T]]): Call for each shard index, using only that shard's session.
+        Returns:
+            Dict[int, T]: Result of each call. A failure is raised once every call finished, so no
+                          session is still in use when the caller closes them.
+        """
+        if len(calls) == 1:
+            return {index: call() for index, call in calls.items()}
+        futures = {index: self._executor.submit(call) for index, call in calls.items()}
+        wait(futures.values())
+        return {index: future.result() for index, future in futures.items()}
+
+    def close(self) -> None:
+        """
+        Stops the fan-out threads and releases the pools of shards 1 and up, which stop being reported in
+        pool_stats; shard 0 is the main engine.
+        """
+        self._executor.shutdown(wait=True)
+        for engine in self.engines[1:]:
+            engine.dispose()
+            if engine in SHARD_ENGINES:
+                SHARD_ENGINES.remove(engine)
+
+
+def _position_id_sequence(conn, index: int) -> None:
+    # Makes the shard number new tasks after the start of its range, unless it already does.
+    floor = shard_id_range(index)[0] - 1
+    if floor == 0:
+        return
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("UPDATE sqlite_sequence SET seq = :floor WHERE name = 'tasks' AND seq < :floor"),
+                     {"floor": floor})
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) SELECT 'tasks', :floor "
+                          "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'tasks')"), {"floor": floor})
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT setval('tasks_id_seq', :floor) WHERE (SELECT last_value FROM tasks_id_seq) < :floor"),
+                     {"floor": floor})
+    else:
+        logging.warning("Cannot position the task ids of shard %d on %s", index, conn.dialect.name)
+
+
+class ShardSessions:
+    """
+    One session per shard, opened on first use and closed together.
+    Iterating yields the session of every shard in order.
+    """
+    def __init__(self, router: ShardRouter, first: Optional[Session] = None):
+        """
+        Initializes the set.
+        Args:
+            router (ShardRouter): Router of the shards.
+            first (Optional[Session]): Session already open on shard 0, left open by close.
+        """
+        self.router = router
+        self._borrowed = first
+        self._sessions: Dict[int, Session] = {0: first} if first is not None else {}
+
+    def __getitem__(self, index: int) -> Session:
+        if index not in self._sessions:
+            self._sessions[index] = self.router.session_factories[index]()
+        return self._sessions[index]
+
+    def __iter__(self) -> Iterator[Session]:
+        return (self[index] for index in range(len(self.router)))
+
+    def __len__(self) -> int:
+        return len(self.router)
+
+    def close(self) -> None:
+        """
+        Closes the sessions opened by this set.
+        """
+        for session in self._sessions.values():
+            if session is not self._borrowed:
+                session.close()
+        self._sessions.clear()
+
+    def __enter__(self) -> "ShardSessions":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _merge_page(pages: List[Tuple[list, Optional[str]]], key: Callable, limit: int,
+                encode: Callable[[object], str]) -> Tuple[list, Optional[str]]:
+    # Merges the ordered pages of every shard, all read after the same cursor, into the first limit items.
+    merged = list(heapq.merge(*(items for items, _ in pages), key=key))
+    more = len(merged) > limit or any(next_cursor for _, next_cursor in pages)
+    merged = merged[:limit]
+    return merged, encode(merged[-1]) if more and merged else None
+
+
+class ShardedTaskService(TaskService):
+    """
+    TaskService spread over the shards: each call is routed to the shard of the owner it concerns, or
+    sent to every shard with the results merged. One TaskService per shard does the work, sharing the
+    Redis cache, counters, change versions and change feed.
+    """
+    def __init__(self, shards: ShardRouter, sessions: ShardSessions, **kwargs):
+        """
+        Initializes the service.
+        Args:
+            shards (ShardRouter): Router of the shards.
+            sessions (ShardSessions): Sessions of the current request.
+            **kwargs: user_client, redis_client, stats, versions and events, as for TaskService.
+        """
+        super().__init__(sessions[0], **kwargs)
+        self.shards = shards
+        self.sessions = sessions
+        self._services: Dict[int, TaskService] = {}
+
+    def shard(self, index: int) -> TaskService:
+        """
+        Returns the service working on one shard.
+        Args:
+            index (int): Shard index.
+        Returns:
+            TaskService: Service bound to the shard's session and to the shared clients.
+        """
+        if index not in self._services:
+            self._services[index] = TaskService(self.sessions[index], user_client=self.user_client,
+                                                redis_client=self.redis_client, stats=self.stats,
+                                                versions=self.versions, events=self.events)
+        return self._services[index]
+
+    def create_task(self, title: str, user_id: int, due_date: datetime) -> Task:
+        return self.shard(self.shards.shard_for(user_id)).create_task(title, user_id, due_date)
+
+    def create_tasks(self, items: List[dict]) -> List[Union[Task, ValueError]]:
+        """
+        Creates many tasks at once, with one bulk insert per shard, the shards in parallel.
+        Each shard commits on its own, so a failure on one shard leaves the tasks created on the others.
+        Args:
+            items (List[dict]): Task payloads with title, user_id and due_date keys.
+        Returns:
+            List[Union[Task, ValueError]]: Per item, in input order, the created Task
+                                           or the error that rejected it.
+        Raises:
+            UserServiceUnavailable: If the User Service cannot be reached.
+        """
+        positions: Dict[int, List[int]] = {}
+        for position, item in enumerate(items):
+            positions.setdefault(self.shards.shard_for(item["user_id"]), []).append(position)
+        services = {index: self.shard(index) for index in positions}
+        created = self.shards.fan_out({
+            index: (lambda service=services[index], group=group: service.create_tasks([items[p] for p in group]))
+            for index, group in positions.items()})
+        results: List[Union[Task, ValueError]] = [None] * len(items)
+        for index, group in positions.items():
+            for position, result in zip(group, created[index]):
+                results[position] = result
+        return results
+
+    def update_task_status(self, task_id: int, status: str) -> Task:
+        return self._locate(task_id, lambda service: service.update_task_status(task_id, status))
+
+    def delete_task(self, task_id: int) -> None:
+        self._locate(task_id, lambda service: service.delete_task(task_id))
+
+    def get_task(self, task_id: int) -> dict:
+        return self._locate(task_id, lambda service: service.get_task(task_id))
+
+    def update_tasks_status(self, new_status: str, ids: Optional[Sequence[int]] = None,
+                            status: StatusFilter = None, due_before: Optional[datetime] = None,
+                            user_id: Optional[int] = None) -> int:
+        counts = self._fan_out(user_id, lambda service: service.update_tasks_status(new_status, ids, status,
+                                                                                     due_before, user_id))
+        return sum(counts)
+
+    def delete_tasks(self, ids: Optional[Sequence[int]] = None, status: StatusFilter = None,
+                     due_before: Optional[datetime] = None, user_id: Optional[int] = None) -> int:
+        return sum(self._fan_out(user_id, lambda service: service.delete_tasks(ids, status, due_before, user_id)))
+
+    def get_stats(self, user_id: Optional[int] = None) -> dict:
+        return self.stats.read(self.sessions, user_id)
+
+    def list_tasks(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                   user_id: Optional[int] = None):
+        return [task for tasks in self._fan_out(user_id, lambda service: service.list_tasks(status, due_before,
+                                                                                             user_id))
+                for task in tasks]
+
+    def list_tasks_page(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                        user_id: Optional[int] = None, limit: int = 100,
+                        cursor: Optional[str] = None) -> Tuple[List[Task], Optional[str]]:
+        pages = self._fan_out(user_id, lambda service: service.list_tasks_page(status, due_before, user_id, limit,
+                                                                                cursor))
+        return _merge_page(pages, lambda task: (task.due_date, task.id), limit, encode_cursor)
+
+    def iter_tasks(self, status: StatusFilter = None, due_before: Optional[datetime] = None,
+                   user_id: Optional[int] = None, chunk_size: int = 500) -> Iterator[Task]:
+        yield from heapq.merge(*(self.shard(index).iter_tasks(status, due_before, user_id, chunk_size)
+                                 for index in self._targets(user_id)), key=lambda task: (task.due_date, task.id))
+
+    def list_task_rows(self, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                       due_before: Optional[datetime] = None, user_id: Optional[int] = None, limit: int = 100,
+                       cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        pages = self._fan_out(user_id, lambda service: service.list_task_rows(fields, status, due_before, user_id,
+                                                                               limit, cursor))
+        return _merge_page(pages, lambda row: (row.due_date, row.id), limit, encode_cursor)
+
+    def iter_task_rows(self, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                       due_before: Optional[datetime] = None, user_id: Optional[int] = None,
+                       chunk_size: int = 500) -> Iterator:
+        yield from heapq.merge(*(self.shard(index).iter_task_rows(fields, status, due_before, user_id, chunk_size)
+                                 for index in self._targets(user_id)), key=lambda row: (row.due_date, row.id))
+
+    def search_task_rows(self, query: str, fields: Sequence[str] = TASK_FIELDS, status: StatusFilter = None,
+                         due_before: Optional[datetime] = None, user_id: Optional[int] = None, limit: int = 100,
+                         cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """
+        Searches every shard's index and merges the matches by rank. Ranks are computed per shard, against
+        that shard's word frequencies, so the merged order is close to, not exactly, a single index's order.
+        """
+        pages = self._fan_out(user_id, lambda service: service.search_task_rows(query, fields, status, due_before,
+                                                                                 user_id, limit, cursor))
+        return _merge_page(pages, lambda row: (row.search_rank, row.id), limit, encode_search_cursor)
+
+    def _targets(self, user_id: Optional[int]) -> List[int]:
+        # Shards a query restricted to user_id, or not restricted when None, has to read.
+        return [self.shards.shard_for(user_id)] if user_id is not None else list(range(len(self.shards)))
+
+    def _fan_out(self, user_id: Optional[int], call: Callable[[TaskService], T]) -> List[T]:
+        # Runs call on the service of each target shard in parallel; results come in shard order.
+        targets = self._targets(user_id)
+        services = {index: self.shard(index) for index in targets}
+        results = self.shards.fan_out({index: (lambda service=service: call(service))
+                                       for index, service in services.items()})
+        return [results[index] for index in targets]
+
+    def _locate(self, task_id: int, call: Callable[[TaskService], T]) -> T:
+        # Runs call on the shard holding the task: its home shard first, the others only for moved tasks.
+        home = self.shards.home_shard(task_id)
+        order = [home] if home < len(self.shards) else []
+        order += [index for index in range(len(self.shards)) if index != home]
+        for index in order:
+            try:
+                return call(self.shard(index))
+            except TaskNotFound:
+                pass
+        raise TaskNotFound("Task not found")
@@ -0,0 +1,253 @@
+"""
+Incrementally maintained task statistics for the Task Service.
+Counts by status and by owner live in Redis hashes that every write adjusts, so reading them costs
+the same whatever the size of the tasks table. A periodic reconcile recomputes them from the
+database to correct drift, and refreshes the overdue count, which changes with time alone.
+Each process also keeps a copy adjusted by its own writes, read when Redis holds no counters.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from redis import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.task_db import Task
+from app.task_periodic import PeriodicWorker
+
+STATS_STATUS_KEY = "tasks:stats:status"
+STATS_USER_KEY = "tasks:stats:user"
+STATS_META_KEY = "tasks:stats:meta"
+STATS_LOCK_KEY = "tasks:stats:lock"
+CLOSED_STATUSES = ("done",)
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class TaskStats:
+    """
+    Task counters kept in Redis, with the database as the source of truth.
+    """
+    def __init__(self, redis_client, clock: Callable[[], datetime] = datetime.now):
+        """
+        Initializes the counters.
+        Args:
+            redis_client: Redis client holding the counters.
+            clock (Callable[[], datetime]): Time source used to decide what is overdue.
+        """
+        self.redis_client = redis_client
+        self._clock = clock
+        self._local: Optional[dict] = None
+        self._local_lock = threading.Lock()
+
+    def record(self, status_deltas: Dict[str, int], user_deltas: Optional[Dict[int, int]] = None) -> None:
+        """
+        Applies count changes with one Redis pipeline. Failures are logged and left to the reconcile.
+        Args:
+            status_deltas (Dict[str, int]): Change of the task count per status.
+            user_deltas (Optional[Dict[int, int]]): Change of the task count per owner.
+        """
+        changes = [(STATS_STATUS_KEY, status, delta) for status, delta in status_deltas.items() if delta]
+        changes += [(STATS_USER_KEY, user_id, delta) for user_id, delta in (user_deltas or {}).items() if delta]
+        if not changes:
+            return
+        with self._local_lock:
+            if self._local is not None:
+                for key, field, delta in changes:
+                    counts = self._local["by_status" if key == STATS_STATUS_KEY else "by_user"]
+                    counts[field] = counts.get(field, 0) + delta
+        try:
+            pipe = self.redis_client.pipeline()
+            for key, field, delta in changes:
+                pipe.hincrby(key, field, delta)
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to update task statistics in redis")
+
+    def record_created(self, rows: Iterable[Tuple[str, int]]) -> None:
+        """
+        Counts new tasks.
+        Args:
+            rows (Iterable[Tuple[str, int]]): (status, user_id) of each created task.
+        """
+        rows = list(rows)
+        self.record(Counter(status for status, _ in rows), Counter(user_id for _, user_id in rows))
+
+    def record_deleted(self, rows: Iterable[Tuple[str, int]]) -> None:
+        """
+        Uncounts deleted tasks.
+        Args:
+            rows (Iterable[Tuple[str, int]]): (status, user_id) of each deleted task.
+        """
+        statuses, users = Counter(), Counter()
+        for status, user_id in rows:
+            statuses[status] -= 1
+            users[user_id] -= 1
+        self.record(statuses, users)
+
+    def record_status_change(self, previous: Dict[str, int], new_status: str) -> None:
+        """
+        Moves tasks from their previous statuses to a new one.
+        Args:
+            previous (Dict[str, int]): Number of changed tasks per previous status.
+            new_status (str): Status they now have.
+        """
+        deltas = Counter({status: -count for status, count in previous.items()})
+        deltas[new_status] += sum(previous.values())
+        self.record(deltas)
+
+    def read(self, db: Union[Session, Iterable[Session]], user_id: Optional[int] = None) -> dict:
+        """
+        Returns the statistics from the counters, in a constant number of Redis round trips.
+        When Redis holds no reconciled counters or is unavailable, the copy kept by this process is returned.
+        It is computed from the database on first use, then adjusted by the writes of this process and
+        recomputed by each reconcile, so reads without Redis do not scan the tasks table.
+        Args:
+            db (Union[Session, Iterable[Session]]): Session, or shard sessions, used for the database fallback.
+            user_id (Optional[int]): Restrict the per-owner counts to this user.
+        Returns:
+            dict: total, by_status, by_user, overdue, overdue_as_of and source.
+        """
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hgetall(STATS_META_KEY)
+            pipe.hgetall(STATS_STATUS_KEY)
+            if user_id is None:
+                pipe.hgetall(STATS_USER_KEY)
+            else:
+                pipe.hget(STATS_USER_KEY, user_id)
+            meta, statuses, users = pipe.execute()
+        except RedisError:
+            logging.warning("Redis unavailable, reading the task statistics kept by this process")
+            return self._restrict(self._read_local() or self.refresh(db), user_id)
+        meta = {_decode(key): _decode(value) for key, value in (meta or {}).items()}
+        if "reconciled_at" not in meta:
+            return self._restrict(self._read_local() or self.reconcile(db), user_id)
+        by_status = {_decode(key): int(value) for key, value in statuses.items() if int(value)}
+        if user_id is None:
+            by_user = {int(key): int(value) for key, value in users.items() if int(value)}
+        else:
+            by_user = {user_id: int(users or 0)}
+        return {"total": sum(by_status.values()), "by_status": by_status, "by_user": by_user,
+                "overdue": int(meta.get("overdue", 0)), "overdue_as_of": meta["reconciled_at"], "source": "counters"}
+
+    def compute(self, db: Union[Session, Iterable[Session]]) -> dict:
+        """
+        Computes the statistics with aggregate queries over the tasks table.
+        Args:
+            db (Union[Session, Iterable[Session]]): Database session, or the sessions of every shard,
+                                                    whose counts are added up.
+        Returns:
+            dict: Statistics in the shape returned by read.
+        """
+        now = self._clock()
+        by_status, by_user, overdue = Counter(), Counter(), 0
+        for session in [db] if isinstance(db, Session) else db:
+            # pylint: disable=not-callable
+            by_status.update(dict(session.execute(select(Task.status, func.count()).group_by(Task.status)).all()))
+            by_user.update(dict(session.execute(select(Task.user_id, func.count()).group_by(Task.user_id)).all()))
+            overdue += session.scalar(select(func.count()).select_from(Task).where(
+                Task.status.not_in(CLOSED_STATUSES), Task.due_date < now))
+            # pylint: enable=not-callable
+        return {"total": sum(by_status.values()), "by_status": dict(by_status), "by_user": dict(by_user),
+                "overdue": overdue, "overdue_as_of": now.isoformat(), "source": "database"}
+
+    def reconcile(self, db: Union[Session, Iterable[Session]]) -> dict:
+        """
+        Recomputes the statistics from the database and atomically replaces the counters.
+        Args:
+            db (Union[Session, Iterable[Session]]): Database session, or the sessions of every shard.
+        Returns:
+            dict: The recomputed statistics.
+        """
+        stats = self.refresh(db)
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(STATS_STATUS_KEY)
+            pipe.delete(STATS_USER_KEY)
+            if stats["by_status"]:
+                pipe.hset(STATS_STATUS_KEY, mapping=stats["by_status"])
+            if stats["by_user"]:
+                pipe.hset(STATS_USER_KEY, mapping=stats["by_user"])
+            pipe.hset(STATS_META_KEY, mapping={"overdue": stats["overdue"], "reconciled_at": stats["overdue_as_of"]})
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to store reconciled task statistics in redis")
+        return stats
+
+    def refresh(self, db: Union[Session, Iterable[Session]]) -> dict:
+        """
+        Recomputes the statistics from the database into the copy kept by this process, leaving Redis alone.
+        Args:
+            db (Union[Session, Iterable[Session]]): Database session, or the sessions of every shard.
+        Returns:
+            dict: The recomputed statistics.
+        """
+        stats = self.compute(db)
+        with self._local_lock:
+            self._local = {"by_status": Counter(stats["by_status"]), "by_user": Counter(stats["by_user"]),
+                           "overdue": stats["overdue"], "overdue_as_of": stats["overdue_as_of"]}
+        return stats
+
+    def _read_local(self) -> Optional[dict]:
+        with self._local_lock:
+            if self._local is None:
+                return None
+            by_status = {status: count for status, count in self._local["by_status"].items() if count}
+            by_user = {user_id: count for user_id, count in self._local["by_user"].items() if count}
+            return {"total": sum(by_status.values()), "by_status": by_status, "by_user": by_user,
+                    "overdue": self._local["overdue"], "overdue_as_of": self._local["overdue_as_of"],
+                    "source": "process"}
+
+    @staticmethod
+    def _restrict(stats: dict, user_id: Optional[int]) -> dict:
+        if user_id is not None:
+            stats["by_user"] = {user_id: stats["by_user"].get(user_id, 0)}
+        return stats
+
+
+class StatsReconciler(PeriodicWorker):
+    """
+    Background thread that reconciles the task statistics every interval seconds.
+    A short Redis lock makes a single process per interval do the work. The first pass waits a full
+    interval, as read() already computes counters that never were.
+    """
+    thread_name = "task-stats-reconciler"
+    failure_message = "Task statistics reconcile failed: %s"
+
+    def __init__(self, session_factory: Callable[[], Session], stats: TaskStats, interval: float = 300.0):
+        """
+        Initializes the reconciler.
+        Args:
+            session_factory (Callable[[], Session]): Factory of database sessions, or of the sessions of every shard.
+            stats (TaskStats): Counters to reconcile.
+            interval (float): Seconds between two reconciles.
+        """
+        super().__init__(interval)
+        self._session_factory = session_factory
+        self._stats = stats
+
+    def run_once(self) -> bool:
+        """
+        Reconciles the counters unless another process did within the interval.
+        While Redis is unavailable, only the copy kept by this process is recomputed.
+        Returns:
+            bool: Whether this call reconciled.
+        """
+        try:
+            if not self._stats.redis_client.set(STATS_LOCK_KEY, str(time.time()), nx=True,
+                                                ex=max(1, int(self.interval))):
+                return False
+        except RedisError:
+            with self._session_factory() as db:
+                self._stats.refresh(db)
+            return False
+        with self._session_factory() as db:
+            self._stats.reconcile(db)
+        return True
@@ -0,0 +1,124 @@
+"""
+Change-version counters backing conditional GETs on the Task Service.
+After its commit, every write bumps the version of the task collection, of each owner whose tasks it
+touched and of each task it touched. ETags are derived from these counters alone, so a poll carrying a
+current If-None-Match is answered with 304 after one Redis round trip, without a database query or any
+serialization. A random epoch is part of every tag: when Redis loses the counters it loses the epoch
+with them, and tags handed out before can no longer match.
+"""
+import hashlib
+import logging
+import uuid
+from typing import Iterable, List, Optional, Sequence
+
+from redis import RedisError
+
+VERSION_EPOCH_KEY = "tasks:version:epoch"
+TASKS_VERSION_KEY = "tasks:version"
+
+
+def owner_version_key(user_id: int) -> str:
+    """
+    Returns the key of the version of one owner's tasks.
+    Args:
+        user_id (int): ID of the owner.
+    Returns:
+        str: The Redis key.
+    """
+    return f"tasks:version:user:{user_id}"
+
+
+def task_version_key(task_id: int) -> str:
+    """
+    Returns the key of the version of a single task.
+    Args:
+        task_id (int): ID of the task.
+    Returns:
+        str: The Redis key.
+    """
+    return f"tasks:version:task:{task_id}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Compares an If-None-Match header with an ETag using the weak comparison of RFC 9110.
+    Args:
+        if_none_match (Optional[str]): Header value, a list of tags or "*".
+        etag (Optional[str]): Current tag of the resource, None when it has none.
+    Returns:
+        bool: Whether the client already holds the current representation.
+    """
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class ChangeVersions:
+    """
+    Version counters kept in Redis, bumped by the writes and read to tag the responses.
+    """
+    def __init__(self, redis_client):
+        """
+        Initializes the counters.
+        Args:
+            redis_client: Redis client holding the counters.
+        """
+        self.redis_client = redis_client
+
+    def bump(self, task_ids: Iterable[int], user_ids: Iterable[int]) -> None:
+        """
+        Increments the collection version and the versions of the given owners and tasks in one pipeline.
+        Must be called after the write committed, so that a tag never announces data not yet visible, and
+        before the cached copies are refreshed, so that a cache fill that read the old row is refused.
+        Args:
+            task_ids (Iterable[int]): IDs of the created, changed or deleted tasks. Nothing is bumped when empty.
+            user_ids (Iterable[int]): Owners of those tasks.
+        """
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        keys = [TASKS_VERSION_KEY]
+        keys += [owner_version_key(user_id) for user_id in dict.fromkeys(user_ids)]
+        keys += [task_version_key(task_id) for task_id in task_ids]
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.incr(key)
+            pipe.execute()
+        except RedisError:
+            logging.error("Failed to bump task versions in redis, rotating the version epoch")
+            self._rotate_epoch()
+
+    def etag(self, keys: Sequence[str], variant: str = "") -> Optional[str]:
+        """
+        Returns a weak ETag covering the given versions, read with a single MGET.
+        Args:
+            keys (Sequence[str]): Version keys the representation depends on.
+            variant (str): What else selects the representation, such as the query string.
+        Returns:
+            Optional[str]: The tag, or None when Redis is unavailable and responses go untagged.
+        """
+        try:
+            values = self.redis_client.mget([VERSION_EPOCH_KEY, *keys])
+            if values[0] is None:
+                self.redis_client.set(VERSION_EPOCH_KEY, uuid.uuid4().hex, nx=True)
+                values = self.redis_client.mget([VERSION_EPOCH_KEY, *keys])
+        except RedisError:
+            logging.warning("Redis unavailable, serving responses without ETag")
+            return None
+        if values[0] is None:
+            return None
+        parts: List[bytes] = [value if isinstance(value, bytes) else str(value or 0).encode() for value in values]
+        parts += [key.encode("utf-8") for key in keys]
+        digest = hashlib.blake2b(b"|".join([*parts, variant.encode("utf-8")]), digest_size=12).hexdigest()
+        return f'W/"{digest}"'
+
+    def _rotate_epoch(self) -> None:
+        # A lost bump could leave a stale tag current; dropping the epoch invalidates every tag instead.
+        try:
+            self.redis_client.delete(VERSION_EPOCH_KEY)
+        except RedisError:
+            logging.error("Failed to rotate the task version epoch")
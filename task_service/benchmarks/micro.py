@@ -0,0 +1,158 @@
+"""
+Micro-benchmarks of the TaskService hot methods, with stored baselines.
+Each benchmark runs against an in-memory SQLite database and a NullCache, takes the best of several
+rounds, and is expressed as a multiple of a fixed pure-Python calibration loop so that results
+recorded on one machine stay comparable on another.
+Run from task_service:
+    python -m benchmarks.micro                  # print the results
+    python -m benchmarks.micro --update         # store them as the new baselines
+    python -m benchmarks.micro --check          # exit 1 when a benchmark regressed past the tolerance
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+os.environ.setdefault("TASK_DATABASE_URL", "sqlite://")
+
+from sqlalchemy import StaticPool, create_engine, insert  # pylint: disable=wrong-import-position
+from sqlalchemy.orm import sessionmaker  # pylint: disable=wrong-import-position
+
+from app.task_db import Base, Task  # pylint: disable=wrong-import-position
+from app.task_services import (TASK_FIELDS, NullCache, TaskRowEncoder, TaskService,  # pylint: disable=wrong-import-position
+                               UserClient)
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SEED_ROWS = 5_000
+
+
+class LocalUserClient(UserClient):
+    """
+    User client that accepts every user without calling the User Service.
+    """
+    def validate_user(self, user_id: int) -> bool:
+        """
+        Accepts the user.
+        """
+        return True
+
+    def validate_users(self, user_ids) -> Dict[int, bool]:
+        """
+        Accepts every user.
+        """
+        return {user_id: True for user_id in user_ids}
+
+
+def calibrate(rounds: int = 5) -> float:
+    """
+    Returns the best time of a fixed pure-Python loop, the unit of every result.
+    It is measured again right after each benchmark so both see the same machine load.
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        total = 0
+        for i in range(200_000):
+            total += i % 7
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def best_per_op(func: Callable[[], object], ops: int, rounds: int) -> float:
+    """
+    Returns the best per-call time of func over several rounds of ops calls.
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(ops):
+            func()
+        best = min(best, (time.perf_counter() - started) / ops)
+    return best
+
+
+def build_service() -> TaskService:
+    """
+    Returns a TaskService over a seeded in-memory database.
+    """
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2030, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Task), [{"title": f"task {i}", "status": "pending", "user_id": i % 50,
+                                     "due_date": start + timedelta(minutes=i)} for i in range(SEED_ROWS)])
+    db = sessionmaker(bind=engine)()
+    return TaskService(db, user_client=LocalUserClient(base_url="http://users.invalid"), redis_client=NullCache())
+
+
+def run_benchmarks(rounds: int) -> Dict[str, float]:
+    """
+    Runs every benchmark.
+    Returns:
+        Dict[str, float]: Per benchmark, the best per-call time divided by the calibration time.
+    """
+    service = build_service()
+    due = datetime(2031, 1, 1)
+    batch = [{"title": f"bulk {i}", "user_id": i % 10, "due_date": due} for i in range(100)]
+    encoder = TaskRowEncoder(TASK_FIELDS)
+    page, _ = service.list_task_rows(limit=100)
+    benchmarks = {
+        "create_task": (lambda: service.create_task("micro", 1, due), 200),
+        "create_tasks_100": (lambda: service.create_tasks(batch), 10),
+        "get_task": (lambda: service.get_task(42), 500),
+        "update_task_status": (lambda: service.update_task_status(42, "doing"), 200),
+        "list_task_rows_100": (lambda: service.list_task_rows(limit=100, user_id=7), 100),
+        "encode_rows_100": (lambda: encoder.encode_rows(page), 500),
+    }
+    return {name: best_per_op(func, ops, rounds) / calibrate() for name, (func, ops) in benchmarks.items()}
+
+
+def compare(results: Dict[str, float], baselines: Dict[str, float], tolerance: float) -> bool:
+    """
+    Prints results next to their baselines.
+    Returns:
+        bool: Whether every benchmark stayed within the tolerance of its baseline.
+    """
+    ok = True
+    print(f"{'benchmark':<22}{'baseline':>10}{'current':>10}{'change':>9}")
+    for name, value in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<22}{'-':>10}{value:>10.4g}{'new':>9}")
+            continue
+        change = value / baseline - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{name:<22}{baseline:>10.4g}{value:>10.4g}{change:>+8.0%}{'  REGRESSED' if regressed else ''}")
+    return ok
+
+
+def main() -> None:
+    """
+    Runs the benchmarks, then prints, stores or checks the results.
+    """
+    parser = argparse.ArgumentParser(description="TaskService micro-benchmarks.")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baselines.")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a benchmark regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="Allowed slowdown, 0.4 meaning 40%%.")
+    args = parser.parse_args()
+    results = run_benchmarks(args.rounds)
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as stored:
+            baselines = json.load(stored)
+    ok = compare(results, baselines, args.tolerance)
+    if args.update:
+        with open(BASELINES_PATH, "w", encoding="utf-8") as stored:
+            json.dump({name: float(f"{value:.4g}") for name, value in results.items()}, stored, indent=2)
+            stored.write("\n")
+    elif args.check and not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of task title search.
+Times a page of GET /tasks/search results through the full-text index against the LIKE scan it replaces,
+for growing tables in which each word appears in about the same number of titles.
+Run from task_service: python -m benchmarks.search_tasks --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("TASK_DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert, select  # pylint: disable=wrong-import-position
+from sqlalchemy.orm import sessionmaker  # pylint: disable=wrong-import-position
+
+from app.task_db import Base, Task  # pylint: disable=wrong-import-position
+from app.task_services import NullCache, TaskService  # pylint: disable=wrong-import-position
+
+WORDS_PER_TITLE = 3
+TITLES_PER_WORD = 50
+
+
+def vocabulary(rows: int) -> list:
+    """
+    Returns made-up words, enough for each to appear in about TITLES_PER_WORD titles.
+    """
+    rng = random.Random(rows)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    size = max(1, rows * WORDS_PER_TITLE // TITLES_PER_WORD)
+    return list({"".join(rng.choices(letters, k=8)) for _ in range(size)})
+
+
+def seed(rows: int, words: list) -> sessionmaker:
+    """
+    Creates a file-backed SQLite database holding the given number of tasks with random titles.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "tasks.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(0)
+    start = datetime(2030, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, rows, 50_000):
+            conn.execute(insert(Task), [{"title": " ".join(rng.choices(words, k=WORDS_PER_TITLE)), "status": "pending",
+                                         "user_id": i % 100, "due_date": start + timedelta(minutes=i)}
+                                        for i in range(offset, min(rows, offset + 50_000))])
+    return sessionmaker(bind=engine)
+
+
+def indexed_search(service: TaskService, word: str) -> list:
+    """
+    Search path: one page of prefix matches from the full-text index, best first.
+    """
+    return service.search_task_rows(word[:5], limit=20)[0]
+
+
+def like_scan(service: TaskService, word: str) -> list:
+    """
+    Baseline: one page of titles containing the prefix, found by scanning the table.
+    """
+    query = select(Task.id, Task.title).where(Task.title.like(f"%{word[:5]}%")).order_by(Task.id).limit(20)
+    return service.db.execute(query).all()
+
+
+def main() -> None:
+    """
+    Prints the median latency of both paths for each table size.
+    """
+    parser = argparse.ArgumentParser(description="Task title search benchmark.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    print(f"{'rows':>9} {'index ms':>10} {'like ms':>10} {'speedup':>8}")
+    for rows in args.rows:
+        words = vocabulary(rows)
+        session_factory = seed(rows, words)
+        sample = random.Random(1).sample(words, min(args.queries, len(words)))
+        timings = {}
+        for name, path in (("index", indexed_search), ("like", like_scan)):
+            samples = []
+            with session_factory() as db:
+                service = TaskService(db, user_client=object(), redis_client=NullCache())
+                for word in sample:
+                    started = time.perf_counter()
+                    path(service, word)
+                    samples.append(time.perf_counter() - started)
+            timings[name] = sorted(samples)[len(samples) // 2]
+        print(f"{rows:>9} {timings['index'] * 1000:>10.2f} {timings['like'] * 1000:>10.2f}"
+              f" {timings['like'] / timings['index']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
 import os
 import sys
+import threading
 from datetime import datetime, timedelta
 
 from dotenv import load_dotenv
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 FULL_PATH = os.path.dirname(os.path.abspath(__file__)) + "/test.env"
 load_dotenv(dotenv_path=FULL_PATH, override=True)
@@ -15,6 +23,15 @@ sys.path.append(PROJECT_ROOT)
 
 import app.task_services as service
 from app.main import app
+from app.task_admission import AdmissionMiddleware, LoadShedder, RateLimiter
+from app.task_async_routes import async_router
+from app.task_auth import TokenVerifier
+from app.task_async_services import AsyncNullCache
+from app.task_db import Base, get_async_task_db
+from app.task_metrics import MetricsMiddleware, current_timings, record_redis
+from app.task_resources import TaskResources, get_task_resources
+from app.task_services import NullCache
+from tests.test_task_services import FakeRedis
 
 
 def test_create_and_list_task_flow(monkeypatch):
@@ -35,3 +52,323 @@ def test_create_and_list_task_flow(monkeypatch):
     listed = client.get("/tasks")
     assert listed.status_code == 200
     assert len(listed.json()) >= 1
+
+
+def test_lifespan_shares_resources_across_requests(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    payload = {"title": "Shared", "user_id": 1, "due_date": datetime.now().isoformat()}
+
+    with TestClient(app) as client:
+        resources = app.state.resources
+        assert client.post("/tasks", json=payload).status_code == 201
+        assert client.post("/tasks", json=payload).status_code == 201
+        assert app.state.resources is resources
+        assert resources.user_client.session is resources.http_session
+
+    assert app.state.resources is None
+
+
+def test_batch_create_reports_errors_per_item(monkeypatch):
+    validated = []
+
+    def validate_users(self, user_ids):
+        validated.append(sorted(user_ids))
+        return {user_id: user_id != 2 for user_id in validated[-1]}
+
+    monkeypatch.setattr(service.UserClient, "validate_users", validate_users)
+    client = TestClient(app)
+    due_date = (datetime.now() + timedelta(days=1)).isoformat()
+
+    response = client.post(
+        "/tasks/batch",
+        json={"tasks": [
+            {"title": "a", "user_id": 1, "due_date": due_date},
+            {"title": "b", "user_id": 2, "due_date": due_date},
+            {"title": "c", "user_id": 1, "due_date": due_date},
+        ]},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 2 and body["failed"] == 1
+    assert [result["status"] for result in body["results"]] == [201, 400, 201]
+    assert [body["results"][i]["task"]["title"] for i in (0, 2)] == ["a", "c"]
+    assert body["results"][1]["error"] == "Unknown user"
+    assert validated == [[1, 2]]
+
+
+def test_bulk_update_and_delete_endpoints(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    client = TestClient(app)
+    ids = [client.post("/tasks", json={"title": f"sprint {i}", "user_id": 55,
+                                       "due_date": datetime(2035, 1, 1 + i).isoformat()}).json()["id"]
+           for i in range(3)]
+
+    updated = client.patch("/tasks/status", json={"status": "closed", "filter": {"user_id": 55}})
+    assert updated.json() == {"updated": 3}
+    assert client.get(f"/tasks/{ids[0]}").json()["status"] == "closed"
+    assert client.patch("/tasks/status", json={"status": "open", "ids": ids[:1]}).json() == {"updated": 1}
+    assert client.patch("/tasks/status", json={"status": "open"}).status_code == 400
+    reopened = client.patch("/tasks/status",
+                            json={"status": "closed", "filter": {"status": ["open,archived"], "user_id": 55}})
+    assert reopened.json() == {"updated": 1}
+
+    assert client.delete("/tasks", params={"ids": f"{ids[0]},{ids[1]}"}).json() == {"deleted": 2}
+    assert client.delete("/tasks", params={"status": "closed", "user_id": 55}).json() == {"deleted": 1}
+    assert client.get(f"/tasks/{ids[2]}").status_code == 404
+    assert client.delete("/tasks").status_code == 400
+    assert client.delete("/tasks", params={"ids": "x"}).status_code == 422
+
+
+def test_task_stats_endpoint(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    client = TestClient(app)
+    before = client.get("/tasks/stats", params={"user_id": 66}).json()
+    assert before["by_user"] == {"66": 0}
+    client.post("/tasks", json={"title": "counted", "user_id": 66, "due_date": datetime(2000, 1, 1).isoformat()})
+    after = client.get("/tasks/stats", params={"user_id": 66}).json()
+    assert after["by_user"] == {"66": 1}
+    assert after["total"] == before["total"] + 1 and after["source"] == "process"
+    assert (after["overdue"], after["overdue_as_of"]) == (before["overdue"], before["overdue_as_of"])
+
+
+def test_list_tasks_paginates_and_streams(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    client = TestClient(app)
+    for i in range(3):
+        task = client.post("/tasks", json={"title": f"p{i}", "user_id": 1,
+                                           "due_date": datetime(2031, 1, 1 + i).isoformat()}).json()
+        client.put(f"/tasks/{task['id']}", json={"status": "paged"})
+
+    first = client.get("/tasks", params={"status": "paged", "limit": 2})
+    assert [task["title"] for task in first.json()] == ["p0", "p1"]
+    second = client.get("/tasks", params={"status": "paged", "limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [task["title"] for task in second.json()] == ["p2"]
+    assert "X-Next-Cursor" not in second.headers
+
+    streamed = client.get("/tasks", params={"status": "paged"}, headers={"Accept": "application/x-ndjson"})
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["title"] for line in streamed.text.splitlines()] == ["p0", "p1", "p2"]
+    assert client.get("/tasks", params={"cursor": "bogus"}).status_code == 400
+
+    assert len(client.get("/tasks", params={"status": "paged,unused", "user_id": 1}).json()) == 3
+    sparse = client.get("/tasks", params={"status": "paged", "fields": "title,id"})
+    assert sparse.json() == [{"id": task["id"], "title": task["title"]} for task in first.json() + second.json()]
+    assert client.get("/tasks", params={"fields": "title,password"}).status_code == 400
+    assert client.get("/tasks", params={"status": "paged", "user_id": 2}).json() == []
+
+
+def test_search_tasks_combines_filters_and_pages(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    client = TestClient(app)
+    for title, status in (("Zephyr launch plan", "todo"), ("Plan zephyrine review", "todo"), ("Zephyr", "done")):
+        task = client.post("/tasks", json={"title": title, "user_id": 3, "due_date": "2031-01-01T00:00:00"}).json()
+        client.put(f"/tasks/{task['id']}", json={"status": status})
+
+    first = client.get("/tasks/search", params={"q": "zeph", "limit": 2, "fields": "title"})
+    second = client.get("/tasks/search", params={"q": "zeph", "limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [task["title"] for task in first.json() + second.json()] == ["Zephyr", "Zephyr launch plan",
+                                                                       "Plan zephyrine review"]
+    assert first.json()[0] == {"title": "Zephyr"}
+    assert [task["title"] for task in client.get("/tasks/search", params={"q": "plan zeph", "status": "todo"}).json()] \
+        == ["Zephyr launch plan", "Plan zephyrine review"]
+    assert client.get("/tasks/search", params={"q": "zeph", "user_id": 4}).json() == []
+    assert client.get("/tasks/search", params={"q": "--"}).status_code == 400
+    assert client.get("/tasks/search").status_code == 422
+
+
+def test_event_stream_resumes_after_last_event_id_and_follows_new_changes(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    resources = TaskResources(redis_client=FakeRedis(), async_mode=False)
+    resources.event_feed.max_age = 0.5
+    monkeypatch.setitem(app.dependency_overrides, get_task_resources, lambda: resources)
+    client = TestClient(app)
+    task = client.post("/tasks", json={"title": "live", "user_id": 91, "due_date": "2036-01-01T00:00:00"}).json()
+    client.post("/tasks", json={"title": "elsewhere", "user_id": 92, "due_date": "2036-01-01T00:00:00"})
+    resources.event_feed.read_once()
+    client.put(f"/tasks/{task['id']}", json={"status": "done"})
+    threading.Timer(0.1, resources.event_feed.read_once).start()
+
+    response = client.get("/tasks/events", params={"user_id": 91}, headers={"Last-Event-ID": "0-0"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [dict(line.split(": ", 1) for line in frame.splitlines())
+              for frame in response.text.split("\n\n") if frame.startswith("id:")]
+    assert [(event["id"], event["event"]) for event in events] == [("1-0", "task.created"), ("3-0", "task.updated")]
+    assert json.loads(events[1]["data"]) == {**task, "status": "done"}
+    assert resources.event_feed.subscribers == 0
+
+    resources.event_feed.max_subscribers = 0
+    assert client.get("/tasks/events").status_code == 503
+
+
+def test_polls_with_a_current_etag_get_304_without_touching_the_database(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    resources = TaskResources(redis_client=FakeRedis(), async_mode=False)
+    monkeypatch.setitem(app.dependency_overrides, get_task_resources, lambda: resources)
+    client = TestClient(app)
+    task = client.post("/tasks", json={"title": "polled", "user_id": 61,
+                                       "due_date": datetime(2035, 1, 1).isoformat()}).json()
+    listing = client.get("/tasks", params={"user_id": 61})
+    single = client.get(f"/tasks/{task['id']}")
+    assert listing.headers["ETag"].startswith('W/"') and single.headers["ETag"] != listing.headers["ETag"]
+
+    with monkeypatch.context() as patched:
+        patched.setattr(service.TaskService, "list_task_rows", lambda *args, **kwargs: pytest.fail("queried"))
+        patched.setattr(service.TaskService, "get_task", lambda *args, **kwargs: pytest.fail("loaded"))
+        unchanged = client.get("/tasks", params={"user_id": 61}, headers={"If-None-Match": listing.headers["ETag"]})
+        assert unchanged.status_code == 304 and unchanged.content == b""
+        assert unchanged.headers["ETag"] == listing.headers["ETag"]
+        assert client.get(f"/tasks/{task['id']}", headers={"If-None-Match": single.headers["ETag"]}).status_code == 304
+        client.post("/tasks", json={"title": "other", "user_id": 62, "due_date": datetime(2035, 1, 1).isoformat()})
+        assert client.get("/tasks", params={"user_id": 61},
+                          headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+
+    client.put(f"/tasks/{task['id']}", json={"status": "done"})
+    changed = client.get("/tasks", params={"user_id": 61}, headers={"If-None-Match": listing.headers["ETag"]})
+    assert changed.status_code == 200 and changed.json()[0]["status"] == "done"
+    assert client.get(f"/tasks/{task['id']}", headers={"If-None-Match": single.headers["ETag"]}).status_code == 200
+    assert client.get("/tasks", params={"user_id": 61, "fields": "id"},
+                      headers={"If-None-Match": changed.headers["ETag"]}).status_code == 200
+
+
+def test_health_reports_pool_stats():
+    with TestClient(app) as client:
+        response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+    assert "status" in response.json()["db_pool"]
+
+
+def test_metrics_expose_request_and_query_timings(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    client = TestClient(app)
+    created = client.post("/tasks", json={"title": "measured", "user_id": 1,
+                                          "due_date": datetime(2033, 1, 1).isoformat()}).json()
+    client.get(f"/tasks/{created['id']}")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/tasks/{task_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/tasks"}' in body
+    assert 'http_request_db_queries_bucket{method="POST",route="/tasks",le="+Inf"}' in body
+    assert 'db_query_duration_seconds_count{operation="INSERT"}' in body
+    assert "db_pool_checked_out" in body
+
+
+def test_slow_requests_are_logged_with_their_breakdown(caplog):
+    probe = FastAPI()
+    probe.add_middleware(MetricsMiddleware, slow_request_ms=0)
+
+    @probe.get("/probe/{item}")
+    def handler(item: int):
+        assert current_timings() is not None
+        record_redis("get", 0.002)
+        return {"item": item}
+
+    with caplog.at_level(logging.WARNING):
+        assert TestClient(probe).get("/probe/7").json() == {"item": 7}
+    assert current_timings() is None
+    slow = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Slow request")]
+    assert slow == ["Slow request GET /probe/7 -> 200 took " + slow[0].split(" took ")[1]]
+    assert "redis 1 calls 2.0 ms" in slow[0]
+
+
+def test_admission_sheds_overload_and_limits_each_client():
+    pressure = [0, 0.0]
+    shedder = LoadShedder(max_pool_waiters=5, pool_pressure=lambda: tuple(pressure))
+    probe = FastAPI()
+    probe.add_middleware(AdmissionMiddleware, shedder=shedder)
+    probe.state.resources = TaskResources(redis_client=NullCache(), async_mode=False,
+                                          token_verifier=TokenVerifier(secret="dev-secret"))
+    probe.state.resources.rate_limiter = RateLimiter(NullCache(), rate=1, burst=2)
+    probe.get("/probe")(lambda: {"ok": True})
+    probe.get("/health")(lambda: {"status": "ok"})
+    client = TestClient(probe)
+    body = json.dumps({"user_id": 41, "iat": 0, "exp": 4_102_444_800}, separators=(",", ":")).encode("utf-8")
+    token = f"{body.hex()}.{hmac.new(b'dev-secret', body, hashlib.sha256).hexdigest()}"
+
+    assert [client.get("/probe").status_code for _ in range(3)] == [200, 200, 429]
+    limited = client.get("/probe")
+    assert limited.headers["Retry-After"] == "1" and limited.json() == {"detail": "Too many requests"}
+    assert client.get("/probe", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert client.get("/health").status_code == 200
+
+    pressure[0] = 5
+    shed = client.get("/probe", headers={"Authorization": f"Bearer {token}"})
+    assert shed.status_code == 503 and shed.headers["Retry-After"] == "1"
+    assert client.get("/health").status_code == 200
+    assert shedder.in_flight == 0
+    probe.state.resources.close()
+
+
+def test_async_routes_serve_crud_and_listing(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/async.db")
+
+    async def create_schema():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_schema())
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def async_db():
+        async with sessions() as db:
+            yield db
+
+    resources = TaskResources(redis_client=NullCache(), async_mode=True)
+    resources.async_redis_client = AsyncNullCache()
+    resources.async_user_client.validate_user = lambda user_id: asyncio.sleep(0, result=user_id == 1)
+    async_app = FastAPI()
+    async_app.include_router(async_router)
+    async_app.dependency_overrides[get_async_task_db] = async_db
+    async_app.dependency_overrides[get_task_resources] = lambda: resources
+
+    with TestClient(async_app) as client:
+        due_date = datetime(2032, 1, 1).isoformat()
+        created = client.post("/tasks", json={"title": "async", "user_id": 1, "due_date": due_date})
+        assert created.status_code == 201
+        assert client.post("/tasks", json={"title": "x", "user_id": 2, "due_date": due_date}).status_code == 400
+        task_id = created.json()["id"]
+        assert client.put(f"/tasks/{task_id}", json={"status": "done"}).json()["status"] == "done"
+        assert [task["id"] for task in client.get("/tasks", params={"status": "done"}).json()] == [task_id]
+        streamed = client.get("/tasks", params={"stream": True})
+        assert [json.loads(line)["id"] for line in streamed.text.splitlines()] == [task_id]
+        assert client.get("/tasks", params={"fields": "id,status"}).json() == [{"id": task_id, "status": "done"}]
+        streamed = client.get("/tasks", params={"stream": True, "fields": "id"})
+        assert [json.loads(line) for line in streamed.text.splitlines()] == [{"id": task_id}]
+        assert client.get("/tasks", params={"fields": "id,secret"}).status_code == 400
+        assert client.delete(f"/tasks/{task_id}").json() == {"deleted": True}
+        assert client.delete(f"/tasks/{task_id}").status_code == 404
+    asyncio.run(resources.aclose())
+    asyncio.run(engine.dispose())
+
+
+def test_get_single_task(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    client = TestClient(app)
+    created = client.post("/tasks", json={"title": "single", "user_id": 1,
+                                          "due_date": datetime(2033, 1, 1).isoformat()}).json()
+
+    fetched = client.get(f"/tasks/{created['id']}")
+    assert fetched.status_code == 200
+    assert fetched.json() == created
+    assert client.get("/tasks/987654").status_code == 404
+
+
+def test_list_my_tasks_resolves_caller_from_token(monkeypatch):
+    monkeypatch.setattr(service.UserClient, "validate_user", lambda self, user_id: True)
+    monkeypatch.setattr(service.UserClient, "_fetch_user",
+                        lambda self, user_id: pytest.fail("token check must not call the User Service"))
+    client = TestClient(app)
+    for user_id in (41, 42):
+        client.post("/tasks", json={"title": f"mine {user_id}", "user_id": user_id,
+                                    "due_date": datetime(2034, 1, 1).isoformat()})
+    body = json.dumps({"user_id": 41, "iat": 0, "exp": 4_102_444_800}, separators=(",", ":")).encode("utf-8")
+    token = f"{body.hex()}.{hmac.new(b'dev-secret', body, hashlib.sha256).hexdigest()}"
+
+    mine = client.get("/tasks/me", headers={"Authorization": f"Bearer {token}"})
+    assert mine.status_code == 200
+    assert {task["user_id"] for task in mine.json()} == {41}
+    assert client.get("/tasks/me").status_code == 401
+    assert client.get("/tasks/me", headers={"Authorization": f"Bearer {token[:-1]}0"}).status_code == 401
@@ -1,10 +1,26 @@
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
 import os, sys
+import signal
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from datetime import datetime, timedelta
 
+import httpx
+import pytest
+import requests
 from dotenv import load_dotenv
 from hypothesis import given, strategies as st
-from sqlalchemy import create_engine
+from redis.exceptions import ConnectionError as RedisConnectionError, NoScriptError
+from sqlalchemy import StaticPool, create_engine, event, inspect, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 FULL_PATH = os.path.dirname(os.path.abspath(__file__)) + "/test.env"
@@ -14,8 +30,22 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 logging.info(PROJECT_ROOT)
 sys.path.append(PROJECT_ROOT)
 
-from app.task_db import Base
-from app.task_services import UserClient, TaskService, NullCache
+from app.task_admission import LoadShedder, RateLimiter
+from app.task_async_services import AsyncNullCache, AsyncTaskService, AsyncUserClient
+from app.task_auth import InvalidToken, TokenVerifier
+from app.task_cache import UserValidationCache
+from app.task_overdue import OverdueScheduler
+from app.task_rebalance import rebalance
+from app.task_stats import TaskStats
+from app.task_versions import ChangeVersions, etag_matches, owner_version_key, task_version_key
+import app.task_db as task_db
+from app.task_db import Base, SchedulerMark, Task, TimedQueuePool, pool_options, pool_pressure, pool_stats
+from app.task_events import FeedFull, TaskEventFeed, parse_event_id
+from app.task_metrics import TimedRedis
+from app.task_http import CircuitBreaker, RetryPolicy
+from app.task_shards import MAX_SHARDS, ShardedTaskService, ShardRouter, shard_id_range
+from app.task_services import (TASK_CACHE_FILL_SHA, TASK_FIELDS, UserClient, TaskService, TaskRowEncoder, NullCache,
+                               TaskNotFound, UserServiceUnavailable, parse_fields, task_to_dict)
 
 
 class StubUserClient(UserClient):
@@ -26,6 +56,9 @@ class StubUserClient(UserClient):
     def validate_user(self, user_id: int) -> bool:
         return self._valid
 
+    def validate_users(self, user_ids):
+        return {user_id: self._valid for user_id in user_ids}
+
 
 def make_db():
     engine = create_engine(os.getenv("TASK_DATABASE_URL"))
@@ -53,3 +86,915 @@ def test_create_task_with_varied_titles(title: str):
     task = service.create_task(title=title, user_id=1, due_date=datetime.now() + timedelta(days=1))
     assert task.title == title
     db.close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_user_cache_serves_hits_and_expires_negative_entries():
+    clock = FakeClock()
+    cache = UserValidationCache(ttl=60, negative_ttl=5, clock=clock)
+    calls = []
+
+    def loader(user_id):
+        calls.append(user_id)
+        return user_id == 1
+
+    assert cache.get_or_load(1, loader) is True
+    assert cache.get_or_load(1, loader) is True
+    assert cache.get_or_load(2, loader) is False
+    assert cache.get_or_load(2, loader) is False
+    assert calls == [1, 2]
+
+    clock.now = 6
+    assert cache.get_or_load(2, loader) is False
+    assert cache.get_or_load(1, loader) is True
+    assert calls == [1, 2, 2]
+    assert cache.stats() == {"hits": 2, "negative_hits": 1, "shared_hits": 0, "misses": 3, "size": 2}
+
+
+def test_user_cache_coalesces_concurrent_misses():
+    cache = UserValidationCache()
+    release = threading.Event()
+    calls = []
+
+    def loader(user_id):
+        calls.append(user_id)
+        release.wait(timeout=5)
+        return True
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get_or_load, 7, loader) for _ in range(8)]
+        time.sleep(0.1)
+        release.set()
+        assert all(future.result() for future in futures)
+    assert calls == [7]
+
+
+class StubUserServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        server.client_ports.add(self.client_address[1])
+        status = server.statuses.pop(0) if server.statuses else 200
+        body = b"{}"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        server.requests += 1
+        ids = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["ids"]
+        body = json.dumps({"users": [{"id": user_id} for user_id in ids if user_id in server.known_users],
+                           "missing": [user_id for user_id in ids if user_id not in server.known_users]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_user_service():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubUserServiceHandler)
+    server.requests = 0
+    server.client_ports = set()
+    server.statuses = []
+    server.known_users = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_user_client_reuses_connections_and_retries(stub_user_service):
+    base_url = f"http://127.0.0.1:{stub_user_service.server_port}"
+    client = UserClient(base_url=base_url, retry_policy=RetryPolicy(retries=2), sleep=lambda _: None)
+
+    assert all(client.validate_user(1) for _ in range(5))
+    assert len(stub_user_service.client_ports) == 1
+
+    stub_user_service.statuses = [503, 503, 404]
+    assert client.validate_user(2) is False
+    assert stub_user_service.requests == 8
+
+
+def test_user_client_circuit_breaker_fails_fast(stub_user_service):
+    clock = FakeClock()
+    base_url = f"http://127.0.0.1:{stub_user_service.server_port}"
+    client = UserClient(base_url=base_url, retry_policy=RetryPolicy(retries=0),
+                        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock))
+    stub_user_service.statuses = [503, 503]
+
+    for _ in range(2):
+        with pytest.raises(UserServiceUnavailable):
+            client.validate_user(1)
+    with pytest.raises(UserServiceUnavailable):
+        client.validate_user(1)
+    assert stub_user_service.requests == 2
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 10
+    assert client.validate_user(1) is True
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_user_client_trial_call_settles_the_breaker_on_any_request_error():
+    class BrokenSession:
+        def request(self, method, url, **kwargs):
+            raise requests.exceptions.ChunkedEncodingError("connection broken mid-body")
+
+    clock = FakeClock()
+    client = UserClient(base_url="http://users", session=BrokenSession(),
+                        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock))
+    client.breaker.record_failure()
+    clock.now = 10
+    with pytest.raises(UserServiceUnavailable):
+        client.validate_user(1)
+    assert client.breaker.state == CircuitBreaker.OPEN
+    clock.now = 20
+    assert client.breaker.allow()
+
+    async def decoding_error(request):
+        raise httpx.DecodingError("bad gzip", request=request)
+
+    async def scenario():
+        async_client = AsyncUserClient(base_url="http://users", breaker=CircuitBreaker(failure_threshold=1),
+                                       http_client=httpx.AsyncClient(transport=httpx.MockTransport(decoding_error)))
+        with pytest.raises(UserServiceUnavailable):
+            await async_client.validate_user(1)
+        await async_client.aclose()
+        return async_client.breaker.state
+
+    assert asyncio.run(scenario()) == CircuitBreaker.OPEN
+
+
+def test_user_client_validates_many_users_with_one_call(stub_user_service):
+    stub_user_service.known_users = {1, 3}
+    base_url = f"http://127.0.0.1:{stub_user_service.server_port}"
+    client = UserClient(base_url=base_url, cache=UserValidationCache())
+
+    assert client.validate_users([1, 2, 1, 3]) == {1: True, 2: False, 3: True}
+    assert client.validate_users([3, 2]) == {3: True, 2: False}
+    assert stub_user_service.requests == 1
+    assert client.cache.stats()["misses"] == 3
+
+
+def test_list_tasks_page_walks_keyset_cursor():
+    db = make_db()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache())
+    start = datetime(2030, 1, 1)
+    for i in range(7):
+        service.create_task(f"t{i}", user_id=1, due_date=start + timedelta(days=i % 3))
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = service.list_tasks_page(limit=3, cursor=cursor)
+        seen.extend((task.due_date, task.id) for task in page)
+        if cursor is None:
+            break
+    assert seen == sorted(seen) and len(seen) == 7
+    assert [task.id for task in service.iter_tasks(chunk_size=2)] == [task_id for _, task_id in seen]
+    with pytest.raises(ValueError):
+        service.list_tasks_page(cursor="not-a-cursor")
+    db.close()
+
+
+def test_search_matches_word_prefixes_and_follows_writes():
+    db = make_db()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache())
+    due = datetime(2030, 1, 1)
+    service.create_tasks([{"title": title, "user_id": 1, "due_date": due} for title in
+                          ("Quarterly report draft", "Report the reporting bug", "Buy milk", "Reporter interview")])
+    later = service.create_task("Report", user_id=2, due_date=due + timedelta(days=30))
+
+    rows, _ = service.search_task_rows("REP")
+    assert rows[0].title == "Report" and len(rows) == 4
+    assert [row.title for row in service.search_task_rows("rep, q!")[0]] == ["Quarterly report draft"]
+    assert [row.id for row in service.search_task_rows("report", user_id=2)[0]] == [later.id]
+    assert len(service.search_task_rows("report", due_before=due + timedelta(days=1))[0]) == 3
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = service.search_task_rows("rep", fields=("title",), limit=2, cursor=cursor)
+        pages.append([row.title for row in page])
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [2, 2] and sum(pages, []) == [row.title for row in rows]
+
+    service.update_tasks_status("done", status="pending", user_id=1)
+    assert len(service.search_task_rows("rep", status="done")[0]) == 3
+    service.delete_task(later.id)
+    service.delete_tasks(status="done")
+    service.create_task("Repaint the fence", user_id=1, due_date=due)
+    assert [row.title for row in service.search_task_rows("rep")[0]] == ["Repaint the fence"]
+    for query, cursor in (("?!", None), ("rep", "bogus")):
+        with pytest.raises(ValueError):
+            service.search_task_rows(query, cursor=cursor)
+    db.close()
+
+
+def test_lean_rows_match_orm_path_and_encode_like_task_to_dict():
+    db = make_db()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache())
+    for i in range(5):
+        service.create_task(f'lean "{i}" \u00e9', user_id=9, due_date=datetime(2030, 2, 1 + i % 2))
+
+    tasks, task_cursor = service.list_tasks_page(user_id=9, limit=3)
+    rows, row_cursor = service.list_task_rows(user_id=9, limit=3)
+    assert row_cursor == task_cursor
+    assert json.loads(TaskRowEncoder().encode_rows(rows)) == [task_to_dict(task) for task in tasks]
+    rest, _ = service.list_task_rows(("status",), user_id=9, cursor=row_cursor)
+    assert json.loads(TaskRowEncoder(("status",)).encode_rows(rest)) == [{"status": "pending"}] * 2
+    streamed = [TaskRowEncoder(("id",)).encode_row(row) for row in service.iter_task_rows(("id",), user_id=9)]
+    assert [json.loads(line)["id"] for line in streamed] == [task.id for task in service.iter_tasks(user_id=9)]
+
+    assert parse_fields(None) == TASK_FIELDS
+    assert parse_fields("user_id, id") == ("id", "user_id")
+    with pytest.raises(ValueError):
+        parse_fields("id,secret")
+    db.close()
+
+
+def explain(db, query):
+    sql = query.statement.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN " if db.bind.dialect.name == "sqlite" else "EXPLAIN "
+    return " ".join(str(row) for row in db.execute(text(prefix + str(sql))))
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({"user_id": 1, "status": "pending", "due_before": datetime(2030, 1, 1)}, "ix_tasks_user_status_due"),
+    ({"user_id": 1, "status": ["pending", "done"]}, "ix_tasks_user_status_due"),
+    ({"status": "pending", "due_before": datetime(2030, 1, 1)}, "ix_tasks_status_due"),
+])
+def test_list_filters_use_composite_indexes_on_sqlite(filters, index):
+    db = make_db()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache())
+    assert index in explain(db, service._task_query(**filters))
+    db.close()
+
+
+def test_create_all_upgrades_the_indexes_and_search_of_an_existing_tasks_table():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tasks (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, "
+                          "status VARCHAR NOT NULL, due_date DATETIME, user_id INTEGER NOT NULL)"))
+        conn.execute(text("CREATE INDEX ix_tasks_user_id ON tasks (user_id)"))
+        conn.execute(text("INSERT INTO tasks VALUES (1, 'Quarterly report', 'pending', '2030-01-01', 1)"))
+    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("tasks")}
+    assert {"ix_tasks_user_status_due", "ix_tasks_status_due", "ix_tasks_due_id"} <= indexes
+    assert "ix_tasks_user_id" not in indexes
+    with sessionmaker(bind=engine)() as db:
+        service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache())
+        service.create_task("Report backlog", user_id=1, due_date=datetime(2030, 1, 2))
+        rows, _ = service.search_task_rows("rep", fields=("title",))
+        assert sorted(row.title for row in rows) == ["Quarterly report", "Report backlog"]
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set")
+def test_list_filters_use_composite_indexes_on_postgres():
+    engine = create_engine(os.getenv("TEST_POSTGRES_URL"))
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.execute(text("SET enable_seqscan = off"))
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache())
+    plan = explain(db, service._task_query(user_id=1, status=["pending", "done"], due_before=datetime(2030, 1, 1)))
+    assert "ix_tasks_user_status_due" in plan
+    plan = explain(db, service._task_query(status="pending", due_before=datetime(2030, 1, 1)))
+    assert "ix_tasks_status_due" in plan
+    db.close()
+
+
+def test_pool_options_come_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "5")
+    monkeypatch.setenv("DB_POOL_RECYCLE", "1800")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "2500")
+    options = pool_options("postgresql+psycopg2://user:pw@db/taskflow")
+    assert options["poolclass"] is TimedQueuePool
+    assert (options["pool_size"], options["max_overflow"], options["pool_recycle"]) == (20, 5, 1800)
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=2500"}
+    assert "poolclass" not in pool_options("sqlite:///tasks.db")
+
+
+def test_timed_queue_pool_records_checkout_waits(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+    first = engine.connect()
+    threading.Timer(0.1, first.close).start()
+    with engine.connect():
+        pass
+    assert engine.pool.checkouts == 2
+    assert engine.pool.wait_max >= 0.05
+
+    monkeypatch.setattr(task_db, "SHARD_ENGINES", [engine])
+    stats = pool_stats()
+    assert stats["status"].count(";") == 1 and stats["checkouts"] >= 2 and stats["wait_max_ms"] >= 50
+    assert pool_pressure()[0] == 0
+    engine.dispose()
+
+
+class StubAsyncUserClient:
+    def __init__(self, valid: bool = True):
+        self._valid = valid
+
+    async def validate_user(self, user_id: int) -> bool:
+        return self._valid
+
+
+async def make_async_db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return async_sessionmaker(bind=engine, expire_on_commit=False)()
+
+
+def test_async_task_service_crud_and_pagination():
+    async def scenario():
+        db = await make_async_db()
+        service = AsyncTaskService(db, user_client=StubAsyncUserClient(True), redis_client=AsyncNullCache())
+        tasks = [await service.create_task(f"a{i}", user_id=1, due_date=datetime(2030, 1, 1 + i)) for i in range(3)]
+        await service.update_task_status(tasks[0].id, "done")
+        await service.delete_task(tasks[1].id)
+        page, cursor = await service.list_tasks_page(limit=1)
+        rest, last = await service.list_tasks_page(limit=5, cursor=cursor)
+        streamed = [task.id async for task in service.iter_tasks(status="pending")]
+        with pytest.raises(ValueError):
+            await service.update_task_status(tasks[1].id, "done")
+        rejected = AsyncTaskService(db, user_client=StubAsyncUserClient(False), redis_client=AsyncNullCache())
+        with pytest.raises(ValueError):
+            await rejected.create_task("nope", user_id=2, due_date=datetime(2030, 1, 1))
+        await db.close()
+        return tasks, page, rest, last, streamed
+
+    tasks, page, rest, last, streamed = asyncio.run(scenario())
+    assert [task.status for task in page] == ["done"]
+    assert [task.id for task in rest] == [tasks[2].id] and last is None
+    assert streamed == [tasks[2].id]
+
+
+def test_async_user_client_coalesces_concurrent_misses():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200 if request.url.path == "/users/1" else 404)
+
+    async def scenario():
+        client = AsyncUserClient(base_url="http://users", cache=UserValidationCache(),
+                                 http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        results = await asyncio.gather(*(client.validate_user(1) for _ in range(10)), client.validate_user(2))
+        again = await client.validate_user(1)
+        await client.aclose()
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert results == [True] * 10 + [False]
+    assert again is True
+    assert sorted(calls) == ["/users/1", "/users/2"]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        if sha != TASK_CACHE_FILL_SHA:
+            raise NoScriptError("No matching script")
+        cache_key, version_key, version, payload, _ = keys_and_args
+        if str(self.data.get(version_key, "")) != version:
+            return 0
+        self.data[cache_key] = payload
+        return 1
+
+    def eval(self, script, numkeys, *keys_and_args):
+        raise RedisConnectionError("scripting is not emulated")
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        fields[str(field).encode()] = int(fields.get(str(field).encode(), 0)) + amount
+        return fields[str(field).encode()]
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(str(field).encode())
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({str(field).encode(): str(value).encode()
+                                              for field, value in mapping.items()})
+
+    def publish(self, channel, message):
+        self.data.setdefault(("published", channel), []).append(message)
+        return 0
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        entries = self.data.setdefault(name, [])
+        event_id = f"{int(entries[-1][0].split(b'-')[0]) + 1 if entries else 1}-0".encode()
+        entries.append((event_id, {key.encode(): str(value).encode() for key, value in fields.items()}))
+        del entries[:max(0, len(entries) - (maxlen or len(entries)))]
+        return event_id
+
+    def xrevrange(self, name, count=None):
+        return list(reversed(self.data.get(name, [])))[:count]
+
+    def xread(self, streams, count=None, block=None):
+        response = []
+        for name, last_id in streams.items():
+            last = int(str(last_id).split("-")[0])
+            entries = [entry for entry in self.data.get(name, []) if int(entry[0].split(b"-")[0]) > last]
+            if entries:
+                response.append([name.encode(), entries[:count]])
+        return response
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [getattr(self.redis_client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class DownRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise RedisConnectionError("redis is down")
+        return fail
+
+
+def test_get_task_reads_through_cache_and_follows_writes():
+    db = make_db()
+    redis_client = FakeRedis()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=redis_client)
+    task = service.create_task("cached", user_id=1, due_date=datetime(2030, 1, 1))
+    redis_client.delete(f"task:{task.id}")
+
+    assert service.get_task(task.id)["title"] == "cached"
+    db.execute(text("UPDATE tasks SET title = 'stale-in-cache' WHERE id = :id"), {"id": task.id})
+    db.commit()
+    assert service.get_task(task.id)["title"] == "cached"
+    assert not any(key.endswith(":lock") for key in redis_client.data)
+
+    service.update_task_status(task.id, "done")
+    assert service.get_task(task.id)["status"] == "done"
+    service.delete_task(task.id)
+    assert f"task:{task.id}" not in redis_client.data
+    with pytest.raises(ValueError):
+        service.get_task(task.id)
+    db.close()
+
+
+def test_get_task_does_not_cache_a_read_overtaken_by_an_update(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    redis_client = FakeRedis()
+    reader, writer = (TaskService(session_factory(), user_client=StubUserClient(True), redis_client=redis_client)
+                      for _ in range(2))
+    task_id = writer.create_task("raced", user_id=1, due_date=datetime(2030, 1, 1)).id
+    redis_client.delete(f"task:{task_id}")
+
+    fill = reader._fill_cache
+
+    def update_before_fill(task, version):
+        writer.update_task_status(task_id, "done")
+        fill(task, version)
+
+    monkeypatch.setattr(reader, "_fill_cache", update_before_fill)
+    assert reader.get_task(task_id)["status"] == "pending"
+    assert json.loads(redis_client.get(f"task:{task_id}"))["status"] == "done"
+
+    redis_client.delete(f"task:{task_id}")
+    monkeypatch.setattr(reader, "_fill_cache", fill)
+    reader.db.expire_all()
+    assert reader.get_task(task_id)["status"] == "done"
+    assert json.loads(redis_client.get(f"task:{task_id}"))["status"] == "done"
+
+
+def test_get_task_falls_back_to_database(monkeypatch):
+    db = make_db()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=DownRedis())
+    task = service.create_task("no redis", user_id=1, due_date=datetime(2030, 1, 1))
+    assert service.get_task(task.id)["title"] == "no redis"
+
+    redis_client = FakeRedis()
+    redis_client.set(f"task:{task.id}:lock", "someone-else")
+    monkeypatch.setattr("app.task_services.TASK_CACHE_LOCK_POLL_INTERVAL", 0)
+    locked_out = TaskService(db, user_client=StubUserClient(True), redis_client=redis_client)
+    assert locked_out.get_task(task.id)["title"] == "no redis"
+    assert f"task:{task.id}" not in redis_client.data
+    db.close()
+
+
+def test_bulk_status_update_and_delete_are_set_based():
+    db = make_db()
+    redis_client = FakeRedis()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=redis_client)
+    tasks = [service.create_task(f"bulk {i}", user_id=70 + i % 2, due_date=datetime(2030, 1, 1 + i))
+             for i in range(4)]
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert service.update_tasks_status("done", user_id=70) == 2
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    assert [statement.split()[0] for statement in statements] == ["SELECT", "UPDATE"]
+    assert [json.loads(redis_client.get(f"task:{task.id}"))["status"] for task in tasks] == [
+        "done", "pending", "done", "pending"]
+
+    assert service.update_tasks_status("archived", ids=[tasks[1].id, tasks[2].id], status="done") == 1
+    assert service.delete_tasks(ids=[tasks[0].id, tasks[2].id, 424242]) == 2
+    assert sorted(key for key in redis_client.data if key.startswith("task:")) == [
+        f"task:{tasks[1].id}", f"task:{tasks[3].id}"]
+    assert service.delete_tasks(user_id=71, due_before=datetime(2030, 1, 2)) == 1
+    assert [task.id for task in service.list_tasks(user_id=71)] == [tasks[3].id]
+    with pytest.raises(ValueError):
+        service.delete_tasks()
+    with pytest.raises(ValueError):
+        service.update_tasks_status("done")
+    db.close()
+
+
+def test_task_stats_follow_writes_and_reconcile_drift():
+    db = make_db()
+    redis_client = FakeRedis()
+    stats = TaskStats(redis_client, clock=lambda: datetime(2030, 1, 10))
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=redis_client, stats=stats)
+    assert service.get_stats()["source"] == "database"
+
+    tasks = [service.create_task(f"s{i}", user_id=80 + i % 2, due_date=datetime(2030, 1, 1 + i * 5))
+             for i in range(4)]
+    service.create_tasks([{"title": "batch", "user_id": 82, "due_date": datetime(2030, 2, 1)}])
+    service.update_task_status(tasks[0].id, "done")
+    service.update_tasks_status("review", user_id=81)
+    service.delete_task(tasks[2].id)
+    service.delete_tasks(ids=[tasks[3].id])
+
+    counted = service.get_stats()
+    assert counted["source"] == "counters"
+    assert counted["by_status"] == {"done": 1, "review": 1, "pending": 1}
+    assert counted["by_user"] == {80: 1, 81: 1, 82: 1} and counted["total"] == 3
+    assert service.get_stats(user_id=81)["by_user"] == {81: 1}
+    expected = stats.compute(db)
+    assert (counted["by_status"], counted["by_user"]) == (expected["by_status"], expected["by_user"])
+    assert expected["overdue"] == 1
+
+    redis_client.hincrby("tasks:stats:status", "pending", 41)
+    assert service.get_stats()["by_status"]["pending"] == 42
+    stats.reconcile(db)
+    assert service.get_stats()["by_status"] == expected["by_status"]
+    assert service.get_stats()["overdue"] == 1
+    db.close()
+
+
+def test_task_stats_without_redis_are_computed_once_per_process():
+    db = make_db()
+    stats = TaskStats(NullCache(), clock=lambda: datetime(2030, 1, 10))
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=NullCache(), stats=stats)
+    service.create_task("before", user_id=90, due_date=datetime(2030, 1, 1))
+    assert service.get_stats()["source"] == "database"
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        kept = service.get_stats()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    assert statements == [] and kept["source"] == "process"
+
+    task = service.create_task("after", user_id=91, due_date=datetime(2030, 2, 1))
+    service.update_task_status(task.id, "done")
+    kept = service.get_stats()
+    assert kept["by_status"] == {"pending": 1, "done": 1} and kept["by_user"] == {90: 1, 91: 1}
+    assert kept["overdue"] == 1 and kept["total"] == 2
+    db.close()
+
+
+def test_overdue_scheduler_moves_newly_due_tasks_from_its_mark():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    redis_client = FakeRedis()
+    now = [datetime(2030, 1, 10)]
+    scheduler = OverdueScheduler(session_factory, redis_client, TaskStats(redis_client), batch_size=1,
+                                 clock=lambda: now[0])
+    with session_factory() as db:
+        db.add_all([Task(title="late", status="pending", user_id=1, due_date=datetime(2030, 1, 1)),
+                    Task(title="doing", status="doing", user_id=2, due_date=datetime(2030, 1, 5)),
+                    Task(title="closed", status="done", user_id=1, due_date=datetime(2030, 1, 3)),
+                    Task(title="later", status="pending", user_id=1, due_date=datetime(2030, 2, 1))])
+        db.commit()
+
+        assert scheduler.tick(db) == 2
+        assert dict(db.execute(select(Task.title, Task.status)).all()) == {
+            "late": "overdue", "doing": "overdue", "closed": "done", "later": "pending"}
+        assert json.loads(redis_client.get("task:1"))["status"] == "overdue"
+        events = [json.loads(message) for message in redis_client.data[("published", "task.overdue")]]
+        assert events == [{"task_id": 1, "user_id": 1, "due_date": "2030-01-01T00:00:00"},
+                          {"task_id": 2, "user_id": 2, "due_date": "2030-01-05T00:00:00"}]
+        assert redis_client.hgetall("tasks:stats:status") == {b"pending": -1, b"doing": -1, b"overdue": 2}
+        assert db.get(SchedulerMark, "overdue").scanned_until == datetime(2030, 1, 10)
+        assert scheduler.tick(db) == 0
+
+        db.add(Task(title="created late", status="pending", user_id=3, due_date=datetime(2030, 1, 2)))
+        db.commit()
+        now[0] = datetime(2030, 2, 2)
+        assert scheduler.run_once() == 2
+        assert scheduler.run_once() is None
+        assert {title for title, status in db.execute(select(Task.title, Task.status)) if status == "overdue"} == {
+            "late", "doing", "later", "created late"}
+
+    window = scheduler._batch_query((Task.due_date, Task.id), [Task.due_date <= datetime(2030, 3, 1)], None)
+    sql = window.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    with session_factory() as db:
+        assert "ix_tasks_status_due" in " ".join(str(row) for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+    with session_factory() as db:
+        db.add(Task(title="raced", status="pending", user_id=4, due_date=datetime(2030, 1, 4)))
+        db.commit()
+        rows = db.execute(scheduler._batch_query((Task.id,), [Task.title == "raced"], None)).all()
+        db.execute(update(Task).where(Task.title == "raced").values(status="done"))
+        assert scheduler._move(db, rows) == 0
+        assert db.scalar(select(Task.status).where(Task.title == "raced")) == "done"
+
+
+def test_change_versions_retag_what_each_write_touched():
+    db = make_db()
+    redis_client = FakeRedis()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=redis_client)
+    first = service.create_task("one", user_id=1, due_date=datetime(2030, 1, 1))
+    second = service.create_task("two", user_id=2, due_date=datetime(2030, 1, 2))
+    versions = service.versions
+
+    def tags():
+        return (versions.etag([task_version_key(first.id)]), versions.etag([owner_version_key(1)]),
+                versions.etag([owner_version_key(2)]))
+
+    before = tags()
+    assert before == tags() and None not in before
+    service.update_task_status(second.id, "done")
+    after = tags()
+    assert after[:2] == before[:2] and after[2] != before[2]
+    service.update_tasks_status("doing", user_id=1)
+    assert tags()[0] != after[0] and tags()[2] == after[2]
+    assert versions.etag([owner_version_key(1)], "?fields=id") != tags()[1]
+
+    tag = tags()[0]
+    assert etag_matches(tag, tag) and etag_matches(f'"x", {tag.removeprefix("W/")}', tag) and etag_matches("*", tag)
+    assert not etag_matches('W/"stale"', tag) and not etag_matches(None, tag) and not etag_matches("*", None)
+
+    redis_client.data.clear()
+    assert tags()[0] != tag
+    assert ChangeVersions(NullCache()).etag([task_version_key(first.id)]) is None
+    assert ChangeVersions(DownRedis()).etag([task_version_key(first.id)]) is None
+
+
+def test_rate_limiter_refills_buckets_and_falls_back_while_redis_is_down():
+    clock = FakeClock()
+    limiter = RateLimiter(DownRedis(), rate=2, burst=2, trusted=["10.0.0.0/8", ""], redis_retry_interval=5,
+                          clock=clock)
+    assert limiter.shared
+    assert [limiter.acquire("ip:1.2.3.4")[0] for _ in range(3)] == [True, True, False]
+    assert not limiter.shared
+    assert limiter.acquire("ip:1.2.3.4") == (False, 0.5)
+    assert limiter.acquire("user:7")[0]
+    clock.now = 0.5
+    assert limiter.acquire("ip:1.2.3.4") == (True, 0.0)
+    clock.now = 5
+    assert limiter.shared
+    assert limiter.is_trusted("10.1.2.3") and not limiter.is_trusted("11.1.2.3") and not limiter.is_trusted("testclient")
+    assert not RateLimiter(NullCache(), rate=1, burst=1).shared
+
+
+def test_load_shedder_refuses_beyond_in_flight_and_pool_limits():
+    pressure = [0, 0.0]
+    shedder = LoadShedder(max_in_flight=2, max_pool_waiters=3, max_pool_wait_ms=100,
+                          pool_pressure=lambda: tuple(pressure))
+    assert [shedder.try_enter() for _ in range(3)] == [None, None, "in_flight"]
+    shedder.leave()
+    pressure[:] = [3, 0.0]
+    assert shedder.try_enter() == "pool_waiters"
+    pressure[:] = [0, 0.2]
+    assert shedder.try_enter() == "pool_wait"
+    pressure[:] = [0, 0.05]
+    assert shedder.try_enter() is None and shedder.in_flight == 2
+    assert LoadShedder().try_enter() is None
+
+
+def sign_token(payload: dict, secret: str = "test-secret") -> str:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return f"{body.hex()}.{hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()}"
+
+
+def test_token_verifier_checks_signature_and_expiry_and_caches():
+    clock = FakeClock()
+    verifier = TokenVerifier(secret="test-secret", max_age=60, cache_size=2, clock=clock)
+    token = sign_token({"user_id": 7, "iat": int(clock()), "exp": int(clock()) + 30})
+    assert verifier.verify_token(token) == 7
+
+    verifier.secret = b"rotated"
+    assert verifier.verify_token(token) == 7
+    verifier.secret = b"test-secret"
+
+    body_hex, signature = token.split(".")
+    for bad in (sign_token({"user_id": 7, "iat": 0}, secret="other"), "garbage", f"{body_hex}x.{signature}",
+                sign_token({"user_id": 7, "iat": int(clock()) - 61}), sign_token({"iat": int(clock())})):
+        with pytest.raises(InvalidToken):
+            verifier.verify_token(bad)
+
+    clock.now += 31
+    with pytest.raises(InvalidToken):
+        verifier.verify_token(token)
+
+
+def test_event_feed_replays_filtered_changes_and_resets_lagging_clients():
+    db = make_db()
+    redis_client = FakeRedis()
+    service = TaskService(db, user_client=StubUserClient(True), redis_client=redis_client)
+    feed = TaskEventFeed(redis_client, buffer_size=3, max_subscribers=1, heartbeat=0.01, max_age=0.05)
+    task = service.create_task("followed", user_id=81, due_date=datetime(2030, 1, 1))
+    assert feed.read_once() == 1
+    service.update_task_status(task.id, "done")
+    service.create_tasks([{"title": "other", "user_id": 82, "due_date": datetime(2030, 1, 2)}])
+    service.delete_task(task.id)
+    assert feed.read_once() == 3 and feed.read_once() == 0
+
+    events, missed = feed.since(parse_event_id("1-0"))
+    assert [(event.kind, event.user_id, event.status) for event in events] == [
+        ("task.updated", 81, "done"), ("task.created", 82, "pending"), ("task.deleted", 81, "done")]
+    assert not missed and json.loads(events[-1].data) == {"id": task.id, "status": "done", "user_id": 81}
+    assert feed.since((0, 0))[1] is True and feed.since((4, 0)) == ([], False)
+
+    async def follow(cursor):
+        subscription = feed.subscribe(cursor)
+        with pytest.raises(FeedFull):
+            feed.subscribe()
+        return [frame async for frame in feed.stream(subscription, user_id=81, statuses={"done"})]
+
+    frames = asyncio.run(follow((1, 0)))
+    assert frames[0] == "retry: 2000\n\n" and frames[-1] == ": keep-alive\n\n"
+    assert [line for line in "".join(frames).splitlines() if line.startswith("id:")] == ["id: 2-0", "id: 4-0"]
+    assert asyncio.run(follow((0, 0)))[1] == "event: reset\ndata: {}\n\n"
+    assert feed.subscribers == 0
+    assert TaskEventFeed.from_env(TimedRedis(redis_client)).redis_client is redis_client
+    db.close()
+
+
+def test_sharded_service_routes_each_owner_and_merges_cross_shard_reads(tmp_path):
+    router = ShardRouter([create_engine(f"sqlite:///{tmp_path}/shard{index}.db") for index in range(3)])
+    redis_client = FakeRedis()
+    owners = {router.shard_for(user_id): user_id for user_id in range(1, 50)}
+    assert sorted(owners) == [0, 1, 2]
+    with router.sessions() as sessions:
+        service = ShardedTaskService(router, sessions, user_client=StubUserClient(True), redis_client=redis_client)
+        created = service.create_tasks([{"title": f"sharded {i}", "user_id": owners[i % 3],
+                                         "due_date": datetime(2030, 1, 1 + i)} for i in range(9)])
+        assert all(router.home_shard(task.id) == router.shard_for(task.user_id) for task in created)
+        assert [task.id for task in created[:3]] == [shard_id_range(index)[0] for index in range(3)]
+        assert shard_id_range(MAX_SHARDS - 1)[1] <= 2 ** 31 - 1
+
+        pages, cursor = [], None
+        while True:
+            page, cursor = service.list_tasks_page(limit=4, cursor=cursor)
+            pages.append([task.title.split()[1] for task in page])
+            if cursor is None:
+                break
+        assert pages == [["0", "1", "2", "3"], ["4", "5", "6", "7"], ["8"]]
+        rows, _ = service.list_task_rows(("title",), user_id=owners[1], limit=10)
+        assert [row.title for row in rows] == ["sharded 1", "sharded 4", "sharded 7"]
+        assert [row.id for row in service.iter_task_rows(("id",))] == [task.id for task in created]
+        assert len(service.search_task_rows("shard", limit=5)[0]) == 5
+
+        scheduler = OverdueScheduler(router.sessions, redis_client, TaskStats(redis_client),
+                                     clock=lambda: datetime(2030, 1, 3))
+        assert scheduler.run_once() == 3
+        assert service.update_task_status(created[4].id, "done").status == "done"
+        assert service.get_task(created[4].id)["status"] == "done"
+        assert service.update_tasks_status("doing", status="pending", due_before=datetime(2030, 1, 6)) == 2
+        assert service.get_stats()["by_status"] == {"overdue": 3, "done": 1, "doing": 2, "pending": 3}
+        service.delete_task(created[0].id)
+        with pytest.raises(TaskNotFound):
+            service.get_task(created[0].id)
+        assert service.delete_tasks(status="overdue") == 2
+    router.close()
+
+
+def test_rebalance_moves_owners_to_an_appended_shard(tmp_path):
+    engines = [create_engine(f"sqlite:///{tmp_path}/shard{index}.db") for index in range(3)]
+    before = ShardRouter(engines[:2])
+    with before.sessions() as sessions:
+        service = ShardedTaskService(before, sessions, user_client=StubUserClient(True), redis_client=FakeRedis())
+        created = [(task.id, task.user_id) for task in service.create_tasks(
+            [{"title": f"owner {user_id}", "user_id": user_id, "due_date": datetime(2030, 1, 1)}
+             for user_id in range(1, 41)])]
+    after = ShardRouter(engines)
+    moving = [(task_id, user_id) for task_id, user_id in created if after.shard_for(user_id) == 2]
+    assert moving and all(before.shard_for(user_id) == after.shard_for(user_id) for _, user_id in created
+                          if after.shard_for(user_id) != 2)
+    with after.sessions() as sessions:
+        sessions[2].execute(text("INSERT INTO tasks (id, title, status, due_date, user_id) "
+                                 "SELECT :id, 'copied', 'pending', '2030-01-01', :user_id"),
+                            {"id": moving[0][0], "user_id": moving[0][1]})
+        sessions[2].commit()
+
+    assert sum(rebalance(after, dry_run=True).values()) == len(moving)
+    redis_client = FakeRedis()
+    assert sum(rebalance(after, ChangeVersions(redis_client), batch_size=1).values()) == len(moving)
+    assert redis_client.get(owner_version_key(moving[0][1])) == 1
+    assert rebalance(after) == {}
+    with after.sessions() as sessions:
+        service = ShardedTaskService(after, sessions, user_client=StubUserClient(True), redis_client=FakeRedis())
+        assert sorted(task.id for task in service.list_tasks()) == sorted(task_id for task_id, _ in created)
+        assert [task.id for task in service.list_tasks(user_id=moving[-1][1])] == [moving[-1][0]]
+        assert service.get_task(moving[-1][0])["user_id"] == moving[-1][1]
+        fresh = service.create_task("fresh", user_id=moving[-1][1], due_date=datetime(2030, 2, 1))
+        assert fresh.id == shard_id_range(2)[0]
+    with pytest.raises(ValueError):
+        rebalance(ShardRouter([engines[0], engines[2], engines[1]]))
+    after.close()
+
+
+def test_server_forks_workers_and_drains_in_flight_requests_on_sigterm(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = {**os.environ, "TASK_DATABASE_URL": f"sqlite:///{tmp_path}/tasks.db", "REDIS_URL": "redis://127.0.0.1:1/0"}
+    server = subprocess.Popen([sys.executable, "-m", "app.task_server", "--host", "127.0.0.1", "--port", str(port),
+                               "--workers", "2", "--log-level", "warning"], cwd=PROJECT_ROOT, env=env)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            assert server.poll() is None and time.monotonic() < deadline
+            time.sleep(0.1)
+        with socket.create_connection(("127.0.0.1", port)) as conn:
+            body = b'{"title": "drained", "user_id": 1}'
+            conn.sendall(b"POST /tasks HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body))
+            time.sleep(0.5)
+            server.send_signal(signal.SIGTERM)
+            time.sleep(0.5)
+            conn.sendall(body)
+            conn.settimeout(10)
+            assert conn.recv(4096).startswith(b"HTTP/1.1 ")
+        assert server.wait(20) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
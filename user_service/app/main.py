@@ -1,14 +1,65 @@
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 logging.info(PROJECT_ROOT)
 sys.path.append(PROJECT_ROOT)
 
+from app.user_admission import AdmissionMiddleware, LoadShedder
+from app.user_db import ASYNC_MODE, init_async_db, init_db, pool_pressure, pool_stats
+from app.user_metrics import METRICS, MetricsMiddleware
+from app.user_resources import UserResources, get_user_resources
 from app.user_routes import router
 
-app = FastAPI(title="User Service")
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    init_db()
+    if ASYNC_MODE:
+        await init_async_db()
+    application.state.resources = UserResources()
+    application.state.resources.outbox.start()
+    try:
+        yield
+    finally:
+        await application.state.resources.aclose()
+        application.state.resources = None
+
+
+SHEDDER = LoadShedder.from_env(pool_pressure)
+
+app = FastAPI(title="User Service", lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware, shedder=SHEDDER)
+app.add_middleware(MetricsMiddleware)
+if ASYNC_MODE:
+    from app.user_async_routes import async_router
+    app.include_router(async_router)
 app.include_router(router)
+
+
+@app.get("/health")
+def health(resources: UserResources = Depends(get_user_resources)):
+    return {"status": "ok", "db_pool": pool_stats(), "outbox": resources.outbox.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(resources: UserResources = Depends(get_user_resources)):
+    pool, outbox = pool_stats(), resources.outbox.stats()
+    samples = [
+        ("db_pool_checked_out", "gauge", "Connections currently checked out.", pool.get("checked_out", 0)),
+        ("db_pool_saturation", "gauge", "Share of the pool capacity in use.", pool.get("saturation", 0.0)),
+        ("db_pool_checkouts_total", "counter", "Connection checkouts.", pool.get("checkouts", 0)),
+        ("db_pool_wait_max_seconds", "gauge", "Longest connection checkout wait.", pool.get("wait_max_ms", 0.0) / 1000),
+        ("db_pool_waiting", "gauge", "Connection checkouts in progress.", pool.get("waiting", 0)),
+        ("http_requests_in_flight", "gauge", "Requests admitted and not yet answered.", SHEDDER.in_flight),
+        ("outbox_pending", "gauge", "Events waiting in the outbox.", outbox["pending"]),
+        ("outbox_lag_seconds", "gauge", "Age of the oldest undelivered event.", outbox["lag_seconds"]),
+        ("outbox_dispatched_total", "counter", "Events published from the outbox.", outbox["dispatched"]),
+        ("outbox_failures_total", "counter", "Failed outbox dispatch batches.", outbox["failures"]),
+    ]
+    return PlainTextResponse(METRICS.render(samples), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+from redis import RedisError
+from redis.exceptions import NoScriptError
+
+from app.user_metrics import ADMISSION_REJECTIONS
+from app.user_services import InvalidToken
+
+RATE_LIMIT_KEY_PREFIX = "ratelimit:"
+EXEMPT_PATHS = ("/health", "/metrics")
+
+# KEYS[1]: bucket; ARGV: refill rate per second, burst. Uses the Redis clock so processes need not agree.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET_SCRIPT.encode("utf-8")).hexdigest()
+
+
+# Fallback while Redis cannot be reached; the least recently used buckets are dropped beyond max_keys.
+class LocalTokenBuckets:
+    def __init__(self, rate: float, burst: int, max_keys: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> Tuple[bool, float]:
+        now = self._clock()
+        with self._lock:
+            tokens, at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + max(0.0, now - at) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / self.rate
+
+
+class RateLimiter:
+    # Buckets live in Redis, updated atomically by TOKEN_BUCKET_SCRIPT and shared by every process. After a
+    # Redis failure, or without scripting (NullPublisher), each process uses its own buckets for a while.
+    def __init__(self, redis_client, rate: float, burst: int, trusted: Iterable[str] = (),
+                 redis_retry_interval: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.trusted = [ipaddress.ip_network(network.strip(), strict=False) for network in trusted if network.strip()]
+        self.redis_retry_interval = redis_retry_interval
+        self.local = LocalTokenBuckets(rate, burst, clock=clock)
+        self._redis_client = redis_client
+        self._clock = clock
+        self._redis_down_until = 0.0 if callable(getattr(redis_client, "evalsha", None)) else math.inf
+
+    @classmethod
+    def from_env(cls, redis_client) -> Optional["RateLimiter"]:
+        rate = float(os.getenv("RATE_LIMIT_RPS", "0"))
+        if rate <= 0:
+            return None
+        return cls(redis_client, rate, int(os.getenv("RATE_LIMIT_BURST", str(max(1, int(rate * 2))))),
+                   trusted=os.getenv("RATE_LIMIT_TRUSTED_CLIENTS", "").split(","))
+
+    # Whether the next acquire goes to Redis, and so should run off the event loop.
+    @property
+    def shared(self) -> bool:
+        return self._clock() >= self._redis_down_until
+
+    def is_trusted(self, host: Optional[str]) -> bool:
+        try:
+            address = ipaddress.ip_address(host or "")
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted)
+
+    def acquire(self, key: str) -> Tuple[bool, float]:
+        if not self.shared:
+            return self.local.acquire(key)
+        redis_key, args = RATE_LIMIT_KEY_PREFIX + key, (self.rate, self.burst)
+        try:
+            try:
+                allowed, retry_after = self._redis_client.evalsha(TOKEN_BUCKET_SHA, 1, redis_key, *args)
+            except NoScriptError:
+                allowed, retry_after = self._redis_client.eval(TOKEN_BUCKET_SCRIPT, 1, redis_key, *args)
+        except RedisError as exc:
+            logging.warning("Redis unavailable, rate limiting in process for %.0f s: %s", self.redis_retry_interval,
+                            exc)
+            self._redis_down_until = self._clock() + self.redis_retry_interval
+            return self.local.acquire(key)
+        return bool(int(allowed)), float(retry_after)
+
+
+# A limit of 0 disables its check. Only touched from the event loop, so the counter needs no lock.
+class LoadShedder:
+    def __init__(self, max_in_flight: int = 0, max_pool_waiters: int = 0, max_pool_wait_ms: float = 0.0,
+                 pool_pressure: Optional[Callable[[], Tuple[int, float]]] = None):
+        self.max_in_flight = max_in_flight
+        self.max_pool_waiters = max_pool_waiters
+        self.max_pool_wait = max_pool_wait_ms / 1000
+        self.in_flight = 0
+        self._pool_pressure = pool_pressure
+
+    @classmethod
+    def from_env(cls, pool_pressure: Optional[Callable[[], Tuple[int, float]]] = None) -> "LoadShedder":
+        return cls(max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "0")),
+                   max_pool_waiters=int(os.getenv("ADMISSION_MAX_POOL_WAITERS", "0")),
+                   max_pool_wait_ms=float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "0")),
+                   pool_pressure=pool_pressure)
+
+    # Returns None when admitted, which must be followed by leave(), otherwise the reason of the refusal.
+    def try_enter(self) -> Optional[str]:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self._pool_pressure is not None and (self.max_pool_waiters or self.max_pool_wait):
+            waiters, wait = self._pool_pressure()
+            if self.max_pool_waiters and waiters >= self.max_pool_waiters:
+                return "pool_waiters"
+            if self.max_pool_wait and wait >= self.max_pool_wait:
+                return "pool_wait"
+        self.in_flight += 1
+        return None
+
+    def leave(self) -> None:
+        self.in_flight -= 1
+
+
+def bearer_token(scope: dict) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token.strip():
+                return token.strip()
+    return None
+
+
+# Sheds load, then enforces per-client rate limits, before a request is routed. The limiter and the token
+# manager come from the application resources; until they exist only load shedding applies.
+class AdmissionMiddleware:
+    def __init__(self, app, shedder: Optional[LoadShedder] = None, exempt_paths: Iterable[str] = EXEMPT_PATHS):
+        self.app = app
+        self.shedder = shedder or LoadShedder()
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        reason = self.shedder.try_enter()
+        if reason is not None:
+            ADMISSION_REJECTIONS.inc(reason)
+            await _refuse(send, 503, "Service overloaded, retry later", 1.0)
+            return
+        try:
+            retry_after = await self._rate_limit(scope)
+            if retry_after is not None:
+                ADMISSION_REJECTIONS.inc("rate_limit")
+                await _refuse(send, 429, "Too many requests", retry_after)
+                return
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.leave()
+
+    async def _rate_limit(self, scope: dict) -> Optional[float]:
+        resources = getattr(scope["app"].state, "resources", None) if "app" in scope else None
+        limiter = getattr(resources, "rate_limiter", None)
+        if limiter is None:
+            return None
+        host = (scope.get("client") or ("unknown",))[0]
+        if limiter.is_trusted(host):
+            return None
+        key = f"ip:{host}"
+        token = bearer_token(scope)
+        if token is not None:
+            try:
+                key = f"user:{resources.jwt_manager.verify_token(token)}"
+            except InvalidToken:
+                pass
+        if limiter.shared:
+            allowed, retry_after = await asyncio.to_thread(limiter.acquire, key)
+        else:
+            allowed, retry_after = limiter.acquire(key)
+        return None if allowed else retry_after
+
+
+async def _refuse(send, status: int, detail: str, retry_after: float) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"retry-after", str(max(1, math.ceil(retry_after))).encode("ascii"))]})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode("utf-8")})
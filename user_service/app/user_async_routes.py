@@ -0,0 +1,93 @@
+import asyncio
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from app.user_async_services import AsyncUserService
+from app.user_passwords import HashingOverloaded
+from app.user_resources import get_async_user_service, get_jwt_manager
+from app.user_routes import (LoginRequest, LookupUsersRequest, RegisterUserRequest, UpdateProfileRequest,
+                             _not_modified, _overloaded, _parse_ids, _users_etag)
+from app.user_services import JWTManager
+
+async_router = APIRouter(prefix="/users", tags=["users"])
+
+
+async def _lookup(service: AsyncUserService, ids: List[int]) -> dict:
+    try:
+        users = await service.get_users(ids)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    found = {user.id for user in users}
+    return {
+        "users": [{"id": user.id, "name": user.name, "email": user.email} for user in users],
+        "missing": [user_id for user_id in dict.fromkeys(ids) if user_id not in found],
+    }
+
+
+@async_router.post("/register")
+async def register(payload: RegisterUserRequest, service: AsyncUserService = Depends(get_async_user_service)):
+    try:
+        user = await service.create_user(payload.name, payload.email, payload.password)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except HashingOverloaded as exc:
+        raise _overloaded(exc) from exc
+    return {"id": user.id, "name": user.name, "email": user.email}
+
+
+@async_router.post("/login")
+async def login(payload: LoginRequest, service: AsyncUserService = Depends(get_async_user_service),
+                jwt_manager: JWTManager = Depends(get_jwt_manager)):
+    try:
+        user = await service.authenticate(payload.email, payload.password)
+    except HashingOverloaded as exc:
+        raise _overloaded(exc) from exc
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    token = jwt_manager.create_token(user.id)
+    return {"access_token": token, "token_type": "bearer"}
+
+
+@async_router.get("")
+async def get_users(request: Request, response: Response, ids: List[str] = Query(),
+                    service: AsyncUserService = Depends(get_async_user_service)):
+    parsed = _parse_ids(ids)
+    etag = await asyncio.to_thread(_users_etag, request, service.versions, parsed)
+    unchanged = _not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    found = await _lookup(service, parsed)
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return found
+
+
+@async_router.post("/lookup")
+async def lookup_users(payload: LookupUsersRequest, service: AsyncUserService = Depends(get_async_user_service)):
+    return await _lookup(service, payload.ids)
+
+
+@async_router.put("/{user_id}")
+async def update_profile(user_id: int, payload: UpdateProfileRequest,
+                         service: AsyncUserService = Depends(get_async_user_service)):
+    try:
+        user = await service.update_profile(user_id, payload.name)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    return {"id": user.id, "name": user.name, "email": user.email}
+
+
+@async_router.get("/{user_id}")
+async def get_user(user_id: int, request: Request, response: Response,
+                   service: AsyncUserService = Depends(get_async_user_service)):
+    etag = await asyncio.to_thread(_users_etag, request, service.versions, [user_id])
+    unchanged = _not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    user = await service.get_user(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return {"id": user.id, "name": user.name, "email": user.email}
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.user_metrics import record_hashing
+from app.user_models import User
+from app.user_passwords import HashingPool, PasswordHashers
+from app.user_services import MAX_LOOKUP_IDS, user_created_event
+from app.user_versions import ChangeVersions
+
+
+class AsyncUserService:
+    def __init__(self, db: AsyncSession, hashers: Optional[PasswordHashers] = None,
+                 hash_pool: Optional[HashingPool] = None, outbox=None, versions: Optional[ChangeVersions] = None):
+        self.db = db
+        self.hashers = hashers or PasswordHashers.from_env()
+        self.hash_pool = hash_pool
+        self.outbox = outbox
+        self.versions = versions
+
+    # The versions live behind the synchronous Redis client, so bumps run off the event loop.
+    async def _bump(self, user_id: int) -> None:
+        if self.versions is not None:
+            await asyncio.to_thread(self.versions.bump, [user_id])
+
+    async def _run_hashing(self, func, *args):
+        started = time.perf_counter()
+        try:
+            if self.hash_pool is None:
+                return await asyncio.to_thread(func, *args)
+            return await self.hash_pool.arun(func, *args)
+        finally:
+            record_hashing(time.perf_counter() - started)
+
+    async def create_user(self, name: str, email: str, password: str) -> User:
+        existing = await self.get_user_by_email(email)
+        if existing:
+            raise ValueError("Email already registered")
+        user = User(name=name, email=email, hashed_password=await self._run_hashing(self.hashers.hash, password))
+        self.db.add(user)
+        await self.db.flush()
+        self.db.add(user_created_event(user))
+        await self.db.commit()
+        await self.db.refresh(user)
+        await self._bump(user.id)
+        if self.outbox is not None:
+            self.outbox.wake()
+        return user
+
+    async def authenticate(self, email: str, password: str) -> Optional[User]:
+        user = await self.get_user_by_email(email)
+        if not user:
+            return None
+        valid, outdated = await self._run_hashing(self.hashers.verify, password, user.hashed_password)
+        if not valid:
+            return None
+        if outdated:
+            user.hashed_password = await self._run_hashing(self.hashers.hash, password)
+            await self.db.commit()
+        return user
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        return await self.db.scalar(select(User).where(User.email == email).limit(1))
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        return await self.db.get(User, user_id)
+
+    async def get_users(self, user_ids: Iterable[int]) -> List[User]:
+        ids = list(dict.fromkeys(user_ids))
+        if len(ids) > MAX_LOOKUP_IDS:
+            raise ValueError(f"At most {MAX_LOOKUP_IDS} ids can be looked up at once")
+        if not ids:
+            return []
+        return list(await self.db.scalars(select(User).where(User.id.in_(ids)).order_by(User.id)))
+
+    async def update_profile(self, user_id: int, name: str) -> User:
+        user = await self.get_user(user_id)
+        if user is None:
+            raise ValueError("User not found")
+        user.name = name
+        await self.db.commit()
+        await self.db.refresh(user)
+        await self._bump(user.id)
+        return user
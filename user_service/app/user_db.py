@@ -1,18 +1,101 @@
 import os
+import threading
+import time
+from typing import Optional, Tuple
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, StaticPool
+from sqlalchemy import AsyncAdaptedQueuePool, create_engine, make_url, QueuePool, StaticPool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session, DeclarativeBase
 
+from app.user_metrics import instrument_engine
+
 load_dotenv()
 
+ASYNC_MODE = os.getenv("ASYNC_MODE", "false").lower() == "true"
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+WAIT_EWMA_WEIGHT = 0.2
+
+
+class TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._wait_recent = 0.0
+        self._wait_recent_at = time.perf_counter()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        with self._wait_lock:
+            self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            now = time.perf_counter()
+            waited = now - start
+            with self._wait_lock:
+                self.waiting -= 1
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                self._wait_recent = self.recent_wait(now) * (1 - WAIT_EWMA_WEIGHT) + waited * WAIT_EWMA_WEIGHT
+                self._wait_recent_at = now
+
+    # Moving average of checkout waits, halved for every second without a checkout so it recovers once
+    # requests stop reaching the pool.
+    def recent_wait(self, now: Optional[float] = None) -> float:
+        elapsed = (time.perf_counter() if now is None else now) - self._wait_recent_at
+        return self._wait_recent * 0.5 ** max(elapsed, 0.0)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(url: str, poolclass=TimedQueuePool) -> dict:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    options = {"pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"}
+    if backend == "sqlite":
+        return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "-1")),
+    )
+    statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout and backend == "postgresql":
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(int(statement_timeout))}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={int(statement_timeout)}"}
+    return options
+
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
 ENGINE = None
 
-if os.getenv("DISABLE_CHECK_SAME_THREAD").lower() == "true":
+if os.getenv("DISABLE_CHECK_SAME_THREAD", "false").lower() == "true":
     extra_args = {"check_same_thread": False}
     ENGINE = create_engine(os.getenv("USER_DATABASE_URL"), poolclass=StaticPool, connect_args=extra_args)
 else:
-    ENGINE = create_engine(os.getenv("USER_DATABASE_URL"))
+    ENGINE = create_engine(os.getenv("USER_DATABASE_URL"), **pool_options(os.getenv("USER_DATABASE_URL")))
+instrument_engine(ENGINE)
 
 SESSION_LOCAL = sessionmaker(autocommit=False, autoflush=False, bind=ENGINE)
 
@@ -21,10 +104,91 @@ class Base(DeclarativeBase):
     __abstract__ = True
 
 
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_READY = False
+_ASYNC_ENGINE = None
+_ASYNC_SESSION_LOCAL = None
+_ASYNC_SCHEMA_READY = False
+
+
+def init_db() -> None:
+    global _SCHEMA_READY  # pylint: disable=global-statement
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if not _SCHEMA_READY:
+            Base.metadata.create_all(bind=ENGINE)
+            _SCHEMA_READY = True
+
+
+def pool_stats() -> dict:
+    pool = ENGINE.pool
+    stats = {"status": pool.status()}
+    if isinstance(pool, TimedPoolMixin):
+        capacity = pool.size() + max(pool._max_overflow, 0)  # pylint: disable=protected-access
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            saturation=pool.checkedout() / capacity if capacity else 0.0,
+            checkouts=pool.checkouts,
+            wait_avg_ms=pool.wait_total / pool.checkouts * 1000 if pool.checkouts else 0.0,
+            wait_max_ms=pool.wait_max * 1000,
+            waiting=pool.waiting,
+            wait_recent_ms=pool.recent_wait() * 1000,
+        )
+    return stats
+
+
+# Checkouts in progress and recent checkout wait in seconds, read by the load shedder.
+def pool_pressure() -> Tuple[int, float]:
+    pool = ENGINE.pool
+    if isinstance(pool, TimedPoolMixin):
+        return pool.waiting, pool.recent_wait()
+    return 0, 0.0
+
+
+# Called before forking workers, and with close=False in each worker: connections inherited from the
+# supervisor must not be closed there, only dropped.
+def dispose_engines(close: bool = True) -> None:
+    ENGINE.dispose(close=close)
+    if _ASYNC_ENGINE is not None:
+        # Asyncio connections can only be closed from their event loop, so they are always dropped.
+        _ASYNC_ENGINE.sync_engine.dispose(close=False)
+
+
 def get_user_db() -> Session:
-    Base.metadata.create_all(bind=ENGINE)
+    init_db()
     db = SESSION_LOCAL()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_async_engine() -> AsyncEngine:
+    global _ASYNC_ENGINE, _ASYNC_SESSION_LOCAL  # pylint: disable=global-statement
+    if _ASYNC_ENGINE is None:
+        url = async_url(os.getenv("USER_DATABASE_URL"))
+        if os.getenv("DISABLE_CHECK_SAME_THREAD", "false").lower() == "true":
+            _ASYNC_ENGINE = create_async_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+        else:
+            _ASYNC_ENGINE = create_async_engine(url, **pool_options(url, poolclass=TimedAsyncQueuePool))
+        instrument_engine(_ASYNC_ENGINE.sync_engine)
+        _ASYNC_SESSION_LOCAL = async_sessionmaker(bind=_ASYNC_ENGINE, autoflush=False, expire_on_commit=False)
+    return _ASYNC_ENGINE
+
+
+async def init_async_db() -> None:
+    global _ASYNC_SCHEMA_READY  # pylint: disable=global-statement
+    if _ASYNC_SCHEMA_READY:
+        return
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    _ASYNC_SCHEMA_READY = True
+
+
+async def get_async_user_db() -> AsyncSession:
+    await init_async_db()
+    async with _ASYNC_SESSION_LOCAL() as db:
+        yield db
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.user_models import OutboxEvent
+
+
+class OutboxDispatcher:
+    # Events are published first and deleted after, so a crash in between re-sends them (at-least-once).
+    def __init__(self, session_factory: Callable[[], Session], redis_client, batch_size: int = 100,
+                 interval: float = 0.5, clock: Callable[[], float] = time.time):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._session_factory = session_factory
+        self._client = redis_client
+        self._clock = clock
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"dispatched": 0, "batches": 0, "failures": 0, "last_dispatch_lag_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls, session_factory: Callable[[], Session], redis_client) -> "OutboxDispatcher":
+        return cls(session_factory, redis_client,
+                   batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "100")),
+                   interval=float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5")))
+
+    def dispatch_once(self) -> int:
+        with self._session_factory() as db:
+            events = (db.query(OutboxEvent).order_by(OutboxEvent.id).limit(self.batch_size)
+                      .with_for_update(skip_locked=True).all())
+            if not events:
+                return 0
+            try:
+                pipe = self._client.pipeline(transaction=False)
+                for event in events:
+                    pipe.publish(event.channel, event.payload)
+                pipe.execute()
+            except Exception as excp:  # pylint: disable=broad-exception-caught
+                db.rollback()
+                self._count(failures=1)
+                logging.error("Failed to dispatch %d outbox events: %s", len(events), excp)
+                return 0
+            oldest = events[0].created_at
+            db.query(OutboxEvent).filter(OutboxEvent.id.in_([event.id for event in events])).delete(
+                synchronize_session=False)
+            db.commit()
+        self._count(dispatched=len(events), batches=1)
+        with self._stats_lock:
+            self._stats["last_dispatch_lag_seconds"] = max(self._clock() - oldest, 0.0)
+        return len(events)
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="user-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._session_factory() as db:
+            pending, oldest = db.query(func.count(OutboxEvent.id),  # pylint: disable=not-callable
+                                       func.min(OutboxEvent.created_at)).one()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(pending=pending, lag_seconds=max(self._clock() - oldest, 0.0) if oldest else 0.0)
+        return stats
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                drained = self.dispatch_once() < self.batch_size
+            except Exception as excp:  # pylint: disable=broad-exception-caught
+                logging.error("Outbox dispatcher iteration failed: %s", excp)
+                drained = True
+            if drained:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+        self._drain()
+
+    def _drain(self) -> None:
+        try:
+            while self.dispatch_once() == self.batch_size:
+                pass
+        except Exception as excp:  # pylint: disable=broad-exception-caught
+            logging.error("Outbox dispatcher failed to drain on shutdown: %s", excp)
+
+    def _count(self, **amounts: int) -> None:
+        with self._stats_lock:
+            for name, amount in amounts.items():
+                self._stats[name] += amount
@@ -0,0 +1,182 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from app.user_metrics import record_hashing
+
+
+class HashingOverloaded(RuntimeError):
+    pass
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class PasswordHasher:
+    algorithm = ""
+
+    def hash(self, password: str) -> str:
+        raise NotImplementedError
+
+    def verify(self, password: str, encoded: str) -> bool:
+        raise NotImplementedError
+
+    def needs_rehash(self, encoded: str) -> bool:
+        raise NotImplementedError
+
+
+class Pbkdf2Hasher(PasswordHasher):
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations: int = 600_000, salt_size: int = 16):
+        self.iterations = iterations
+        self.salt_size = salt_size
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(self.salt_size)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, self.iterations)
+        return f"{self.algorithm}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password: str, encoded: str) -> bool:
+        _, iterations, salt, digest = encoded.split("$")
+        expected = _b64decode(digest)
+        actual = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), _b64decode(salt), int(iterations),
+                                     dklen=len(expected))
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, encoded: str) -> bool:
+        return int(encoded.split("$")[1]) != self.iterations
+
+
+class ScryptHasher(PasswordHasher):
+    algorithm = "scrypt"
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1, salt_size: int = 16):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.salt_size = salt_size
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(self.salt_size)
+        digest = self._derive(password, salt, self.n, self.r, self.p, 64)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password: str, encoded: str) -> bool:
+        _, n, r, p, salt, digest = encoded.split("$")
+        expected = _b64decode(digest)
+        actual = self._derive(password, _b64decode(salt), int(n), int(r), int(p), len(expected))
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, encoded: str) -> bool:
+        _, n, r, p = encoded.split("$")[:4]
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+    @staticmethod
+    def _derive(password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=dklen)
+
+
+class LegacySha256Hasher(PasswordHasher):
+    # Unsalted hex digests written before hashers were pluggable; verified once, then upgraded.
+    algorithm = "sha256"
+
+    def hash(self, password: str) -> str:
+        return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+    def verify(self, password: str, encoded: str) -> bool:
+        return hmac.compare_digest(self.hash(password), encoded)
+
+    def needs_rehash(self, encoded: str) -> bool:
+        return True
+
+
+class PasswordHashers:
+    def __init__(self, preferred: PasswordHasher, *others: PasswordHasher):
+        self.preferred = preferred
+        self._by_algorithm: Dict[str, PasswordHasher] = {
+            hasher.algorithm: hasher for hasher in (LegacySha256Hasher(), *others, preferred)
+        }
+
+    @classmethod
+    def from_env(cls) -> "PasswordHashers":
+        pbkdf2 = Pbkdf2Hasher(iterations=int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000")))
+        scrypt = ScryptHasher(n=int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14))))
+        if os.getenv("PASSWORD_HASHER", Pbkdf2Hasher.algorithm) == ScryptHasher.algorithm:
+            return cls(scrypt, pbkdf2)
+        return cls(pbkdf2, scrypt)
+
+    def hash(self, password: str) -> str:
+        return self.preferred.hash(password)
+
+    def verify(self, password: str, encoded: str) -> Tuple[bool, bool]:
+        algorithm = encoded.split("$", 1)[0] if "$" in encoded else LegacySha256Hasher.algorithm
+        hasher = self._by_algorithm.get(algorithm)
+        if hasher is None:
+            logging.warning("Refusing a password hash of unknown algorithm %r", algorithm[:32])
+            return False, False
+        try:
+            valid = hasher.verify(password, encoded)
+        except (ValueError, TypeError, OverflowError) as exc:
+            # Only the error type is logged: its message may quote part of the stored hash.
+            logging.warning("Refusing an unreadable %s password hash (%s)", algorithm, type(exc).__name__)
+            return False, False
+        if not valid:
+            return False, False
+        return True, hasher is not self.preferred or hasher.needs_rehash(encoded)
+
+
+class HashingPool:
+    # Runs hashing on its own small pool so a login burst cannot take over the request threadpool.
+    # At most max_pending calls are admitted; the rest wait up to admission_timeout, then are rejected.
+    def __init__(self, workers: int = 2, max_pending: int = 16, admission_timeout: float = 0.5):
+        self.admission_timeout = admission_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    @classmethod
+    def from_env(cls) -> "HashingPool":
+        return cls(workers=int(os.getenv("HASH_POOL_WORKERS", "2")),
+                   max_pending=int(os.getenv("HASH_POOL_MAX_PENDING", "16")),
+                   admission_timeout=float(os.getenv("HASH_POOL_ADMISSION_TIMEOUT", "0.5")))
+
+    def run(self, func, *args):
+        return self._submit(self._slots.acquire(timeout=self.admission_timeout), func, *args).result()
+
+    async def arun(self, func, *args):
+        admitted = self._slots.acquire(blocking=False) or await asyncio.to_thread(
+            self._slots.acquire, timeout=self.admission_timeout)
+        return await asyncio.wrap_future(self._submit(admitted, func, *args))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, admitted: bool, func, *args):
+        if not admitted:
+            raise HashingOverloaded("Too many password hashing requests in flight")
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+def run_hashing(pool: Optional[HashingPool], func, *args):
+    started = time.perf_counter()
+    try:
+        if pool is None:
+            return func(*args)
+        return pool.run(func, *args)
+    finally:
+        record_hashing(time.perf_counter() - started)
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Optional
+
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.user_admission import RateLimiter
+from app.user_async_services import AsyncUserService
+from app.user_db import SESSION_LOCAL, get_async_user_db, get_user_db
+from app.user_outbox import OutboxDispatcher
+from app.user_passwords import HashingPool, PasswordHashers
+from app.user_services import JWTManager, UserService, connect_redis
+from app.user_versions import ChangeVersions
+
+
+class UserResources:
+    def __init__(self, redis_client=None, jwt_manager: Optional[JWTManager] = None,
+                 hashers: Optional[PasswordHashers] = None, hash_pool: Optional[HashingPool] = None,
+                 outbox: Optional[OutboxDispatcher] = None):
+        self.redis_client = redis_client if redis_client is not None else connect_redis()
+        self.jwt_manager = jwt_manager or JWTManager()
+        self.hashers = hashers or PasswordHashers.from_env()
+        self.hash_pool = hash_pool or HashingPool.from_env()
+        self.outbox = outbox or OutboxDispatcher.from_env(SESSION_LOCAL, self.redis_client)
+        self.versions = ChangeVersions(self.redis_client)
+        self.rate_limiter = RateLimiter.from_env(self.redis_client)
+
+    def close(self) -> None:
+        self.outbox.stop()
+        self.hash_pool.shutdown()
+        self.redis_client.close()
+
+    async def aclose(self) -> None:
+        await asyncio.to_thread(self.close)
+
+
+def get_user_resources(request: Request) -> UserResources:
+    resources = getattr(request.app.state, "resources", None)
+    if resources is None:
+        resources = UserResources()
+        request.app.state.resources = resources
+    return resources
+
+
+def get_user_service(db: Session = Depends(get_user_db),
+                     resources: UserResources = Depends(get_user_resources)) -> UserService:
+    return UserService(db, hashers=resources.hashers, hash_pool=resources.hash_pool, outbox=resources.outbox,
+                       versions=resources.versions)
+
+
+def get_jwt_manager(resources: UserResources = Depends(get_user_resources)) -> JWTManager:
+    return resources.jwt_manager
+
+
+def get_async_user_service(db: AsyncSession = Depends(get_async_user_db),
+                           resources: UserResources = Depends(get_user_resources)) -> AsyncUserService:
+    return AsyncUserService(db, hashers=resources.hashers, hash_pool=resources.hash_pool,
+                            outbox=resources.outbox, versions=resources.versions)
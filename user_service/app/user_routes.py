@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
 
-from app.user_db import get_user_db
-from app.user_services import JWTManager, UserService
+from app.user_passwords import HashingOverloaded
+from app.user_resources import get_jwt_manager, get_user_service
+from app.user_services import MAX_LOOKUP_IDS, JWTManager, UserService
+from app.user_versions import ChangeVersions, etag_matches, user_version_key
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -23,29 +26,92 @@ class UpdateProfileRequest(BaseModel):
     name: str
 
 
+class LookupUsersRequest(BaseModel):
+    ids: List[int]
+
+
+def _overloaded(exc: HashingOverloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+
+
+def _parse_ids(ids: List[str]) -> List[int]:
+    try:
+        return [int(part) for value in ids for part in value.split(",") if part]
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="ids must be integers") from exc
+
+
+# Tags come from the change versions alone, so a matching If-None-Match is answered before any query.
+def _users_etag(request: Request, versions: Optional[ChangeVersions], user_ids: List[int]) -> Optional[str]:
+    ids = list(dict.fromkeys(user_ids))
+    if versions is None or not ids or len(ids) > MAX_LOOKUP_IDS:
+        return None
+    return versions.etag([user_version_key(user_id) for user_id in ids], request.url.path)
+
+
+def _not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def _lookup(service: UserService, ids: List[int]) -> dict:
+    try:
+        users = service.get_users(ids)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    found = {user.id for user in users}
+    return {
+        "users": [{"id": user.id, "name": user.name, "email": user.email} for user in users],
+        "missing": [user_id for user_id in dict.fromkeys(ids) if user_id not in found],
+    }
+
+
 @router.post("/register")
-def register(payload: RegisterUserRequest, db: Session = Depends(get_user_db)):
-    service = UserService(db)
+def register(payload: RegisterUserRequest, service: UserService = Depends(get_user_service)):
     try:
         user = service.create_user(payload.name, payload.email, payload.password)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except HashingOverloaded as exc:
+        raise _overloaded(exc) from exc
     return {"id": user.id, "name": user.name, "email": user.email}
 
 
 @router.post("/login")
-def login(payload: LoginRequest, db: Session = Depends(get_user_db)):
-    service = UserService(db)
-    user = service.authenticate(payload.email, payload.password)
+def login(payload: LoginRequest, service: UserService = Depends(get_user_service),
+          jwt_manager: JWTManager = Depends(get_jwt_manager)):
+    try:
+        user = service.authenticate(payload.email, payload.password)
+    except HashingOverloaded as exc:
+        raise _overloaded(exc) from exc
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = JWTManager().create_token(user.id)
+    token = jwt_manager.create_token(user.id)
     return {"access_token": token, "token_type": "bearer"}
 
 
+@router.get("")
+def get_users(request: Request, response: Response, ids: List[str] = Query(),
+              service: UserService = Depends(get_user_service)):
+    parsed = _parse_ids(ids)
+    etag = _users_etag(request, service.versions, parsed)
+    unchanged = _not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    found = _lookup(service, parsed)
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return found
+
+
+@router.post("/lookup")
+def lookup_users(payload: LookupUsersRequest, service: UserService = Depends(get_user_service)):
+    return _lookup(service, payload.ids)
+
+
 @router.put("/{user_id}")
-def update_profile(user_id: int, payload: UpdateProfileRequest, db: Session = Depends(get_user_db)):
-    service = UserService(db)
+def update_profile(user_id: int, payload: UpdateProfileRequest, service: UserService = Depends(get_user_service)):
     try:
         user = service.update_profile(user_id, payload.name)
     except ValueError as exc:
@@ -54,9 +120,14 @@ def update_profile(user_id: int, payload: UpdateProfileRequest, db: Session = De
 
 
 @router.get("/{user_id}")
-def get_user(user_id: int, db: Session = Depends(get_user_db)):
-    service = UserService(db)
+def get_user(user_id: int, request: Request, response: Response, service: UserService = Depends(get_user_service)):
+    etag = _users_etag(request, service.versions, [user_id])
+    unchanged = _not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
     user = service.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if etag is not None:
+        response.headers["ETag"] = etag
     return {"id": user.id, "name": user.name, "email": user.email}
@@ -0,0 +1,139 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+import uvicorn
+
+from app.main import app
+from app.user_db import dispose_engines, init_db
+
+RESPAWN_DELAY = 1.0
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    # Imports the app once, then forks uvicorn workers sharing one socket. Workers drop the database
+    # connections inherited from the supervisor and build their Redis clients and hashing pool in the
+    # lifespan. SIGTERM / SIGINT drain in-flight requests within graceful_timeout; crashed workers are replaced.
+    def __init__(self, application, host: str = "0.0.0.0", port: int = 8000, workers: int = 1,
+                 graceful_timeout: float = 30.0, log_level: str = "info",
+                 before_fork: Optional[Callable[[], None]] = None, after_fork: Optional[Callable[[], None]] = None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.before_fork = before_fork
+        self.after_fork = after_fork
+        self.pids: Dict[int, int] = {}
+        self._running = False
+        self._socket: Optional[socket.socket] = None
+
+    def run(self) -> None:
+        self._socket = bind_socket(self.host, self.port)
+        if self.before_fork is not None:
+            self.before_fork()
+        self._running = True
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for index in range(self.workers):
+            self._spawn(index)
+        logging.info("Serving on %s:%s with %d workers", self.host, self.port, self.workers)
+        try:
+            while self._running:
+                self._reap()
+                time.sleep(0.2)
+        finally:
+            self._stop_workers()
+            self._socket.close()
+
+    def _handle_stop(self, signum, _frame) -> None:
+        logging.info("Received %s, draining workers", signal.Signals(signum).name)
+        self._running = False
+
+    def _spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = index
+            return
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            if self.after_fork is not None:
+                self.after_fork()
+            config = uvicorn.Config(self.application, log_level=self.log_level,
+                                    timeout_graceful_shutdown=self.graceful_timeout)
+            uvicorn.Server(config).run(sockets=[self._socket])
+        except BaseException:  # pylint: disable=broad-exception-caught
+            logging.exception("Worker %d failed", index)
+            code = 1
+        finally:
+            # Never return into the supervisor's code, nor run its exit handlers.
+            os._exit(code)  # pylint: disable=protected-access
+
+    def _reap(self) -> None:
+        while self.pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            index = self.pids.pop(pid, None)
+            if index is None or not self._running:
+                continue
+            logging.warning("Worker %d (pid %d) exited with status %d, replacing it", index, pid,
+                            os.waitstatus_to_exitcode(status))
+            time.sleep(RESPAWN_DELAY)
+            self._spawn(index)
+
+    def _stop_workers(self) -> None:
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.pids and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.pids:
+            logging.warning("Worker pid %d did not stop in time, killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.pids.clear()
+
+
+# Creates the schema once for every worker, then closes the supervisor's connections.
+def prepare_fork() -> None:
+    init_db()
+    dispose_engines()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the User Service with several worker processes.")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--graceful-timeout", type=float,
+                        default=float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--log-level", default=os.getenv("SERVER_LOG_LEVEL", "info"))
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(process)d %(levelname)s %(message)s",
+                        force=True)
+    Supervisor(app, host=args.host, port=args.port, workers=args.workers, graceful_timeout=args.graceful_timeout,
+               log_level=args.log_level, before_fork=prepare_fork,
+               after_fork=lambda: dispose_engines(close=False)).run()
+
+
+if __name__ == "__main__":
+    main()
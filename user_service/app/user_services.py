@@ -1,30 +1,82 @@
 import hashlib
 import hmac
 import json
-import logging
 import os
+import threading
 import time
-from typing import Optional
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
 
 import redis
 from sqlalchemy.orm import Session
 
-from app.user_models import User
+from app.user_metrics import TimedRedis
+from app.user_models import OutboxEvent, User
+from app.user_passwords import HashingPool, PasswordHashers, run_hashing
+from app.user_versions import ChangeVersions
+
+
+MAX_LOOKUP_IDS = 500
+USER_CREATED_CHANNEL = "user.created"
 
 
 class NullPublisher:
-    def publish(self, channel, payload: dict) -> None:
+    def publish(self, channel, payload) -> None:
         _ = channel, payload
 
+    # Without Redis there are no change versions, so responses go untagged.
+    def mget(self, keys) -> list:
+        return [None] * len(keys)
+
+    def set(self, key, value, **kwargs) -> bool:
+        _ = key, value, kwargs
+        return True
+
+    def incr(self, key) -> int:
+        _ = key
+        return 1
+
+    def delete(self, key) -> None:
+        _ = key
+
+    def pipeline(self, transaction: bool = True):
+        _ = transaction
+        return self
+
+    def execute(self) -> list:
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+def user_created_event(user: User) -> OutboxEvent:
+    return OutboxEvent(channel=USER_CREATED_CHANNEL, payload=json.dumps({"user_id": user.id, "email": user.email}),
+                       created_at=time.time())
+
+
+def connect_redis(redis_url: Optional[str] = None):
+    redis_url = redis_url or os.getenv("REDIS_URL")
+    if redis_url is None or redis_url == "":
+        return NullPublisher()
+    return TimedRedis(redis.from_url(redis_url))
+
 
 class UserService:
-    def __init__(self, db: Session, publisher: Optional["UserCreatedPublisher"] = None):
+    def __init__(self, db: Session, hashers: Optional[PasswordHashers] = None,
+                 hash_pool: Optional[HashingPool] = None, outbox=None, versions: Optional[ChangeVersions] = None):
         self.db = db
-        self.publisher = publisher or UserCreatedPublisher()
+        self.hashers = hashers or PasswordHashers.from_env()
+        self.hash_pool = hash_pool
+        self.outbox = outbox
+        self.versions = versions
 
-    @staticmethod
-    def _hash_password(password: str) -> str:
-        return hashlib.sha256(password.encode("utf-8")).hexdigest()
+    def _bump(self, user_id: int) -> None:
+        if self.versions is not None:
+            self.versions.bump([user_id])
+
+    def _hash_password(self, password: str) -> str:
+        return run_hashing(self.hash_pool, self.hashers.hash, password)
 
     def create_user(self, name: str, email: str, password: str) -> User:
         existing = self.get_user_by_email(email)
@@ -32,17 +84,25 @@ class UserService:
             raise ValueError("Email already registered")
         user = User(name=name, email=email, hashed_password=self._hash_password(password))
         self.db.add(user)
+        self.db.flush()
+        self.db.add(user_created_event(user))
         self.db.commit()
         self.db.refresh(user)
-        self.publisher.publish({"user_id": user.id, "email": user.email})
+        self._bump(user.id)
+        if self.outbox is not None:
+            self.outbox.wake()
         return user
 
     def authenticate(self, email: str, password: str) -> Optional[User]:
         user = self.get_user_by_email(email)
         if not user:
             return None
-        if user.hashed_password != self._hash_password(password):
+        valid, outdated = run_hashing(self.hash_pool, self.hashers.verify, password, user.hashed_password)
+        if not valid:
             return None
+        if outdated:
+            user.hashed_password = self._hash_password(password)
+            self.db.commit()
         return user
 
     def get_user_by_email(self, email: str) -> Optional[User]:
@@ -51,6 +111,14 @@ class UserService:
     def get_user(self, user_id: int) -> Optional[User]:
         return self.db.query(User).filter(User.id == user_id).first()
 
+    def get_users(self, user_ids: Iterable[int]) -> List[User]:
+        ids = list(dict.fromkeys(user_ids))
+        if len(ids) > MAX_LOOKUP_IDS:
+            raise ValueError(f"At most {MAX_LOOKUP_IDS} ids can be looked up at once")
+        if not ids:
+            return []
+        return self.db.query(User).filter(User.id.in_(ids)).order_by(User.id).all()
+
     def update_profile(self, user_id: int, name: str) -> User:
         user = self.get_user(user_id)
         if user is None:
@@ -59,33 +127,59 @@ class UserService:
         self.db.add(user)
         self.db.commit()
         self.db.refresh(user)
+        self._bump(user.id)
         return user
 
 
+class InvalidToken(ValueError):
+    pass
+
+
 class JWTManager:
-    def __init__(self, secret: Optional[str] = None):
+    def __init__(self, secret: Optional[str] = None, ttl: Optional[int] = None, cache_size: int = 4096,
+                 clock: Callable[[], float] = time.time):
         self.secret = (secret or os.getenv("JWT_SECRET", "dev-secret")).encode("utf-8")
+        self.ttl = ttl if ttl is not None else int(os.getenv("JWT_TTL_SECONDS", "3600"))
+        self.cache_size = cache_size
+        self._clock = clock
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
 
     def create_token(self, user_id: int) -> str:
-        payload = {"user_id": user_id, "iat": int(time.time())}
+        issued_at = int(self._clock())
+        payload = {"user_id": user_id, "iat": issued_at, "exp": issued_at + self.ttl}
         body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
         signature = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
         return f"{body.hex()}.{signature}"
 
-
-class UserCreatedPublisher:
-    def __init__(self, client=None):
-        self._channel = "user.created"
-        self._client = client
-        if self._client is None:
-            redis_url = os.getenv("REDIS_URL")
-            if redis_url is None or redis_url == "":
-                self._client = NullPublisher()
-            else:
-                self._client = redis.from_url(redis_url)
-
-    def publish(self, payload: dict) -> None:
+    def verify_token(self, token: str) -> int:
+        now = self._clock()
+        with self._lock:
+            cached = self._verified.get(token)
+            if cached is not None:
+                self._verified.move_to_end(token)
+        if cached is None:
+            cached = self._decode(token)
+            with self._lock:
+                self._verified[token] = cached
+                while len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+        user_id, expires_at = cached
+        if expires_at <= now:
+            raise InvalidToken("Token expired")
+        return user_id
+
+    def _decode(self, token: str) -> Tuple[int, float]:
+        try:
+            body_hex, signature = token.split(".")
+            body = bytes.fromhex(body_hex)
+        except ValueError as exc:
+            raise InvalidToken("Malformed token") from exc
+        expected = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            raise InvalidToken("Invalid token signature")
         try:
-            self._client.publish(self._channel, json.dumps(payload))
-        except Exception as excp:
-            logging.error(f"Failed to publish user created event: {excp}")
+            payload = json.loads(body)
+            return int(payload["user_id"]), float(payload.get("exp", payload["iat"] + self.ttl))
+        except (ValueError, KeyError, TypeError) as exc:
+            raise InvalidToken("Malformed token") from exc
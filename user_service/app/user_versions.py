@@ -0,0 +1,63 @@
+import hashlib
+import logging
+import uuid
+from typing import Iterable, List, Optional, Sequence
+
+from redis import RedisError
+
+VERSION_EPOCH_KEY = "users:version:epoch"
+USERS_VERSION_KEY = "users:version"
+
+
+def user_version_key(user_id: int) -> str:
+    return f"users:version:user:{user_id}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    # Weak comparison: W/"x" and "x" name the same representation.
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class ChangeVersions:
+    # Writes bump the counters after their commit; ETags are derived from them alone, so a current
+    # If-None-Match costs one MGET. The random epoch goes with the counters if Redis loses them.
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    def bump(self, user_ids: Iterable[int]) -> None:
+        keys = [user_version_key(user_id) for user_id in user_ids]
+        if not keys:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in [USERS_VERSION_KEY, *keys]:
+                pipe.incr(key)
+            pipe.execute()
+        except RedisError:
+            # A lost bump could leave a stale tag current; dropping the epoch invalidates every tag instead.
+            logging.error("Failed to bump user versions in redis, rotating the version epoch")
+            try:
+                self.redis_client.delete(VERSION_EPOCH_KEY)
+            except RedisError:
+                logging.error("Failed to rotate the user version epoch")
+
+    def etag(self, keys: Sequence[str], variant: str = "") -> Optional[str]:
+        try:
+            values = self.redis_client.mget([VERSION_EPOCH_KEY, *keys])
+            if values[0] is None:
+                self.redis_client.set(VERSION_EPOCH_KEY, uuid.uuid4().hex, nx=True)
+                values = self.redis_client.mget([VERSION_EPOCH_KEY, *keys])
+        except RedisError:
+            logging.warning("Redis unavailable, serving responses without ETag")
+            return None
+        if values[0] is None:
+            return None
+        parts: List[bytes] = [value if isinstance(value, bytes) else str(value or 0).encode() for value in values]
+        parts += [key.encode("utf-8") for key in keys]
+        digest = hashlib.blake2b(b"|".join([*parts, variant.encode("utf-8")]), digest_size=12).hexdigest()
+        return f'W/"{digest}"'
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import count
+from typing import Callable, Dict
+
+os.environ.setdefault("USER_DATABASE_URL", "sqlite://")
+
+from sqlalchemy import StaticPool, create_engine  # pylint: disable=wrong-import-position
+from sqlalchemy.orm import sessionmaker  # pylint: disable=wrong-import-position
+
+from app.user_db import Base  # pylint: disable=wrong-import-position
+from app.user_models import User  # pylint: disable=wrong-import-position
+from app.user_passwords import PasswordHashers, Pbkdf2Hasher  # pylint: disable=wrong-import-position
+from app.user_services import JWTManager, UserService  # pylint: disable=wrong-import-position
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SEED_USERS = 2_000
+# Hashing cost is measured by benchmarks.password_hashing; a cheap setting keeps it from hiding the rest.
+FAST_HASHERS = PasswordHashers(Pbkdf2Hasher(iterations=1000))
+
+
+# Results are divided by this loop's time, measured right after each benchmark, to compare across machines.
+def calibrate(rounds: int = 5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        total = 0
+        for i in range(200_000):
+            total += i % 7
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def best_per_op(func: Callable[[], object], ops: int, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(ops):
+            func()
+        best = min(best, (time.perf_counter() - started) / ops)
+    return best
+
+
+def build_service() -> UserService:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    hashed = FAST_HASHERS.hash("password")
+    db.add_all(User(name=f"user {i}", email=f"user{i}@example.com", hashed_password=hashed)
+               for i in range(SEED_USERS))
+    db.commit()
+    return UserService(db, hashers=FAST_HASHERS)
+
+
+def run_benchmarks(rounds: int) -> Dict[str, float]:
+    service = build_service()
+    emails = (f"micro{i}@example.com" for i in count())
+    ids = list(range(1, 101))
+    jwt_manager = JWTManager(secret="micro", ttl=3600)
+    uncached = JWTManager(secret="micro", ttl=3600, cache_size=0)
+    token = jwt_manager.create_token(42)
+    benchmarks = {
+        "create_user": (lambda: service.create_user("micro", next(emails), "password"), 100),
+        "authenticate": (lambda: service.authenticate("user42@example.com", "password"), 100),
+        "get_user": (lambda: service.get_user(42), 500),
+        "get_users_100": (lambda: service.get_users(ids), 100),
+        "create_token": (lambda: jwt_manager.create_token(42), 5000),
+        "verify_token_cached": (lambda: jwt_manager.verify_token(token), 5000),
+        "verify_token_uncached": (lambda: uncached.verify_token(token), 5000),
+    }
+    return {name: best_per_op(func, ops, rounds) / calibrate() for name, (func, ops) in benchmarks.items()}
+
+
+def compare(results: Dict[str, float], baselines: Dict[str, float], tolerance: float) -> bool:
+    ok = True
+    print(f"{'benchmark':<24}{'baseline':>10}{'current':>10}{'change':>9}")
+    for name, value in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<24}{'-':>10}{value:>10.4g}{'new':>9}")
+            continue
+        change = value / baseline - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{name:<24}{baseline:>10.4g}{value:>10.4g}{change:>+8.0%}{'  REGRESSED' if regressed else ''}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="UserService and JWTManager micro-benchmarks.")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baselines.")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a benchmark regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="Allowed slowdown, 0.4 meaning 40%%.")
+    args = parser.parse_args()
+    results = run_benchmarks(args.rounds)
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as stored:
+            baselines = json.load(stored)
+    ok = compare(results, baselines, args.tolerance)
+    if args.update:
+        with open(BASELINES_PATH, "w", encoding="utf-8") as stored:
+            json.dump({name: float(f"{value:.4g}") for name, value in results.items()}, stored, indent=2)
+            stored.write("\n")
+    elif args.check and not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.user_passwords import HashingPool, PasswordHasher, Pbkdf2Hasher, ScryptHasher
+
+SETTINGS = [
+    Pbkdf2Hasher(iterations=100_000),
+    Pbkdf2Hasher(iterations=300_000),
+    Pbkdf2Hasher(iterations=600_000),
+    ScryptHasher(n=2 ** 14),
+    ScryptHasher(n=2 ** 15),
+]
+
+
+def describe(hasher: PasswordHasher) -> str:
+    if isinstance(hasher, Pbkdf2Hasher):
+        return f"{hasher.algorithm} iterations={hasher.iterations}"
+    return f"{hasher.algorithm} n={hasher.n} r={hasher.r} p={hasher.p}"
+
+
+def logins_per_second(hasher: PasswordHasher, workers: int, logins: int) -> float:
+    encoded = hasher.hash("correct horse battery staple")
+    pool = HashingPool(workers=workers, max_pending=logins, admission_timeout=60)
+    with ThreadPoolExecutor(max_workers=logins) as callers:
+        started = time.perf_counter()
+        results = list(callers.map(lambda _: pool.run(hasher.verify, "correct horse battery staple", encoded),
+                                   range(logins)))
+        elapsed = time.perf_counter() - started
+    pool.shutdown()
+    assert all(results)
+    return logins / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Login throughput per password hashing setting.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--logins", type=int, default=16)
+    args = parser.parse_args()
+    print(f"{'setting':<36}" + "".join(f"{f'{w} worker(s)':>14}" for w in args.workers))
+    for hasher in SETTINGS:
+        rates = [logins_per_second(hasher, workers, args.logins) for workers in args.workers]
+        print(f"{describe(hasher):<36}" + "".join(f"{rate:>10.1f} /s  " for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
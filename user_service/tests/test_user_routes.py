@@ -1,12 +1,16 @@
 import os
 
 from dotenv import load_dotenv
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 FULL_PATH = os.path.dirname(os.path.abspath(__file__)) + "/test.env"
 load_dotenv(dotenv_path=FULL_PATH, override=True)
 
 from app.main import app
+from app.user_admission import AdmissionMiddleware, LoadShedder, RateLimiter
+from app.user_resources import UserResources, get_user_resources
+from tests.test_user_services import FakeRedis
 
 client = TestClient(app)
 
@@ -24,3 +28,109 @@ def test_register_and_login_flow():
     )
     assert login.status_code == 200
     assert "access_token" in login.json()
+
+
+def test_lifespan_shares_resources_across_requests():
+    with TestClient(app) as scoped_client:
+        resources = app.state.resources
+        register = scoped_client.post(
+            "/users/register",
+            json={"name": "Carol", "email": "carol@example.com", "password": "secret"},
+        )
+        assert register.status_code == 200
+        login = scoped_client.post(
+            "/users/login",
+            json={"email": "carol@example.com", "password": "secret"},
+        )
+        assert login.status_code == 200
+        assert app.state.resources is resources
+
+    assert app.state.resources is None
+
+
+def test_bulk_lookup_by_query_and_body():
+    ids = []
+    for name in ("Dan", "Eve"):
+        register = client.post(
+            "/users/register",
+            json={"name": name, "email": f"{name.lower()}@example.com", "password": "secret"},
+        )
+        ids.append(register.json()["id"])
+
+    by_query = client.get("/users", params={"ids": f"{ids[0]},{ids[1]},99999"})
+    assert by_query.status_code == 200
+    assert [user["name"] for user in by_query.json()["users"]] == ["Dan", "Eve"]
+    assert by_query.json()["missing"] == [99999]
+
+    by_body = client.post("/users/lookup", json={"ids": [ids[1], ids[1]]})
+    assert by_body.status_code == 200
+    assert by_body.json() == {"users": [{"id": ids[1], "name": "Eve", "email": "eve@example.com"}], "missing": []}
+
+    assert client.get("/users", params={"ids": "a,b"}).status_code == 422
+    assert client.post("/users/lookup", json={"ids": list(range(501))}).status_code == 400
+
+
+def test_health_reports_pool_stats():
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+
+def test_metrics_break_down_request_time():
+    client.post("/users/register", json={"name": "Mia", "email": "mia@example.com", "password": "secret"})
+    client.post("/users/login", json={"email": "mia@example.com", "password": "secret"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_requests_total{method="POST",route="/users/login",status="200"}' in body
+    assert 'db_query_duration_seconds_count{operation="SELECT"}' in body
+    assert "password_hash_duration_seconds_count" in body
+    assert "outbox_pending" in body
+
+
+def test_polls_with_a_current_etag_get_304_until_the_user_changes():
+    resources = UserResources(redis_client=FakeRedis())
+    app.dependency_overrides[get_user_resources] = lambda: resources
+    try:
+        user_id = client.post("/users/register", json={"name": "Nia", "email": "nia@example.com",
+                                                       "password": "secret"}).json()["id"]
+        single = client.get(f"/users/{user_id}")
+        bulk = client.get("/users", params={"ids": f"{user_id},99998"})
+        assert single.headers["ETag"].startswith('W/"') and bulk.headers["ETag"] != single.headers["ETag"]
+
+        unchanged = client.get(f"/users/{user_id}", headers={"If-None-Match": single.headers["ETag"]})
+        assert unchanged.status_code == 304 and unchanged.content == b""
+        assert client.get("/users", params={"ids": f"{user_id},99998"},
+                          headers={"If-None-Match": bulk.headers["ETag"]}).status_code == 304
+
+        client.put(f"/users/{user_id}", json={"name": "Nina"})
+        renamed = client.get(f"/users/{user_id}", headers={"If-None-Match": single.headers["ETag"]})
+        assert renamed.status_code == 200 and renamed.json()["name"] == "Nina"
+        assert client.get("/users", params={"ids": f"{user_id},99998"},
+                          headers={"If-None-Match": bulk.headers["ETag"]}).status_code == 200
+    finally:
+        app.dependency_overrides.pop(get_user_resources)
+        resources.close()
+
+
+def test_admission_limits_each_client_and_sheds_overload():
+    shedder = LoadShedder(max_in_flight=1)
+    probe = FastAPI()
+    probe.add_middleware(AdmissionMiddleware, shedder=shedder)
+    resources = UserResources()
+    resources.rate_limiter = RateLimiter(resources.redis_client, rate=1, burst=1)
+    probe.state.resources = resources
+    probe.get("/probe")(lambda: {"ok": True})
+    scoped = TestClient(probe)
+    token = resources.jwt_manager.create_token(5)
+
+    assert [scoped.get("/probe").status_code for _ in range(2)] == [200, 429]
+    assert scoped.get("/probe").headers["Retry-After"] == "1"
+    assert scoped.get("/probe", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert scoped.get("/health").status_code == 404
+
+    shedder.in_flight = 1
+    shed = scoped.get("/probe", headers={"Authorization": f"Bearer {token}"})
+    assert shed.status_code == 503 and shed.json() == {"detail": "Service overloaded, retry later"}
+    resources.close()
@@ -1,20 +1,32 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
 import pytest
 from hypothesis import given, strategies as st
-from sqlalchemy import create_engine
+from sqlalchemy import StaticPool, create_engine, event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.user_async_services import AsyncUserService
 from app.user_db import Base
-from app.user_services import JWTManager, UserService
+from app.user_models import OutboxEvent, User
+from app.user_outbox import OutboxDispatcher
+from app.user_passwords import HashingOverloaded, HashingPool, PasswordHashers, Pbkdf2Hasher, ScryptHasher
+from app.user_services import InvalidToken, JWTManager, UserService
 
 engine = create_engine("sqlite:///:memory:")
 SessionTesting = sessionmaker(bind=engine)
 Base.metadata.create_all(bind=engine)
+FAST_HASHERS = PasswordHashers(Pbkdf2Hasher(iterations=1000), ScryptHasher(n=2 ** 4))
 
 
 @pytest.fixture
 def make_service():
     db = SessionTesting()
-    return UserService(db), db
+    return UserService(db, hashers=FAST_HASHERS), db
 
 
 def test_create_and_authenticate_user(make_service):
@@ -25,9 +37,239 @@ def test_create_and_authenticate_user(make_service):
     db.close()
 
 
+def test_hashes_encode_their_parameters_and_verify():
+    for hasher in (Pbkdf2Hasher(iterations=1000), ScryptHasher(n=2 ** 4)):
+        encoded = hasher.hash("secret")
+        assert encoded.startswith(f"{hasher.algorithm}$")
+        assert encoded != hasher.hash("secret")
+        assert hasher.verify("secret", encoded) and not hasher.verify("wrong", encoded)
+        assert not hasher.needs_rehash(encoded)
+    assert Pbkdf2Hasher(iterations=2000).needs_rehash(Pbkdf2Hasher(iterations=1000).hash("secret"))
+
+
+def test_login_upgrades_legacy_and_outdated_hashes(make_service):
+    service, db = make_service
+    legacy = User(name="Old", email="old@example.com",
+                  hashed_password=hashlib.sha256(b"secret").hexdigest())
+    db.add(legacy)
+    db.commit()
+    assert service.authenticate("old@example.com", "wrong") is None
+    assert service.authenticate("old@example.com", "secret") is not None
+    assert legacy.hashed_password.startswith("pbkdf2_sha256$1000$")
+
+    stronger = UserService(db, hashers=PasswordHashers(Pbkdf2Hasher(iterations=1500)))
+    assert stronger.authenticate("old@example.com", "secret") is not None
+    assert legacy.hashed_password.startswith("pbkdf2_sha256$1500$")
+    unchanged = legacy.hashed_password
+    assert stronger.authenticate("old@example.com", "secret") is not None
+    assert legacy.hashed_password == unchanged
+    db.close()
+
+
+@pytest.mark.parametrize("stored", ["pbkdf2_sha256$oops", "pbkdf2_sha256$x$c2FsdA$ZGlnZXN0", "scrypt$0$8$1$c2FsdA$ZA",
+                                    "bcrypt$2b$12$abc", "caf\u00e9"])
+def test_login_refuses_unreadable_stored_hashes(make_service, stored):
+    service, db = make_service
+    email = f"broken{abs(hash(stored))}@example.com"
+    db.add(User(name="Broken", email=email, hashed_password=stored))
+    db.commit()
+    assert FAST_HASHERS.verify("secret", stored) == (False, False)
+    assert service.authenticate(email, "secret") is None
+    db.close()
+
+
+def test_hashing_pool_rejects_work_beyond_its_admission_limit():
+    pool = HashingPool(workers=1, max_pending=1, admission_timeout=0.01)
+    started, release = threading.Event(), threading.Event()
+    blocked = threading.Thread(target=pool.run, args=(lambda: started.set() or release.wait(),))
+    blocked.start()
+    started.wait()
+    try:
+        with pytest.raises(HashingOverloaded):
+            pool.run(FAST_HASHERS.hash, "secret")
+        with pytest.raises(HashingOverloaded):
+            asyncio.run(pool.arun(FAST_HASHERS.hash, "secret"))
+    finally:
+        release.set()
+        blocked.join()
+    assert FAST_HASHERS.verify("secret", pool.run(FAST_HASHERS.hash, "secret")) == (True, False)
+    assert asyncio.run(pool.arun(FAST_HASHERS.verify, "secret", FAST_HASHERS.hash("secret"))) == (True, False)
+    pool.shutdown()
+
+
 @given(st.integers(min_value=1, max_value=10_000))
 def test_jwt_manager_contains_user_id(user_id: int):
     token = JWTManager(secret="test-secret").create_token(user_id)
     body_hex, _ = token.split(".")
     body = bytes.fromhex(body_hex).decode("utf-8")
     assert f'"user_id":{user_id}' in body
+
+
+def test_jwt_manager_verifies_its_own_tokens():
+    now = [1_000_000.0]
+    manager = JWTManager(secret="test-secret", ttl=60, cache_size=2, clock=lambda: now[0])
+    token = manager.create_token(7)
+    assert manager.verify_token(token) == 7
+    assert manager.verify_token(token) == 7
+    body_hex, signature = token.split(".")
+    forged = bytes.fromhex(body_hex).replace(b'"user_id":7', b'"user_id":8').hex()
+    for bad in (f"{forged}.{signature}", "garbage", f"{body_hex}.{'0' * 64}"):
+        with pytest.raises(InvalidToken):
+            manager.verify_token(bad)
+    with pytest.raises(InvalidToken):
+        JWTManager(secret="other-secret").verify_token(token)
+    now[0] += 61
+    with pytest.raises(InvalidToken):
+        manager.verify_token(token)
+
+
+def test_get_users_resolves_ids_with_one_query(make_service):
+    service, db = make_service
+    ids = [service.create_user(f"U{i}", f"u{i}@example.com", "secret").id for i in range(3)]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        users = service.get_users([ids[2], ids[0], 424242])
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert [user.id for user in users] == [ids[0], ids[2]]
+    assert len(statements) == 1 and " IN " in statements[0]
+    db.close()
+
+
+def test_async_user_service_register_authenticate_and_lookup():
+    async def scenario():
+        async_engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(bind=async_engine, expire_on_commit=False)() as db:
+            service = AsyncUserService(db, hashers=FAST_HASHERS, hash_pool=HashingPool(workers=1))
+            user = await service.create_user("Zoe", "zoe@example.com", "secret")
+            with pytest.raises(ValueError):
+                await service.create_user("Zoe", "zoe@example.com", "other")
+            authenticated = await service.authenticate("zoe@example.com", "secret")
+            rejected = await service.authenticate("zoe@example.com", "wrong")
+            renamed = await service.update_profile(user.id, "Zoey")
+            found = await service.get_users([user.id, 999])
+            events = list(await db.scalars(select(OutboxEvent)))
+        await async_engine.dispose()
+        return user, authenticated, rejected, renamed, found, events
+
+    user, authenticated, rejected, renamed, found, events = asyncio.run(scenario())
+    assert authenticated.id == user.id and rejected is None
+    assert renamed.name == "Zoey"
+    assert [found_user.id for found_user in found] == [user.id]
+    assert [json.loads(event.payload) for event in events] == [{"user_id": user.id, "email": "zoe@example.com"}]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+        self.executions = 0
+        self.down = False
+        self.data = {}
+        self._pending = []
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, nx=False):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def pipeline(self, transaction: bool = True):
+        _ = transaction
+        return self
+
+    def publish(self, channel, payload):
+        self._pending.append((channel, payload))
+
+    def execute(self):
+        pending, self._pending = self._pending, []
+        if self.down:
+            raise ConnectionError("redis is down")
+        self.executions += 1
+        self.published.extend(pending)
+        return [1] * len(pending)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def outbox_session(tmp_path):
+    # A file database, so the dispatcher thread gets a connection of its own.
+    outbox_engine = create_engine(f"sqlite:///{tmp_path}/outbox.db")
+    Base.metadata.create_all(bind=outbox_engine)
+    yield sessionmaker(bind=outbox_engine)
+    outbox_engine.dispose()
+
+
+def test_create_user_writes_event_to_outbox_in_same_commit(outbox_session):
+    db = outbox_session()
+    service = UserService(db, hashers=FAST_HASHERS)
+    user = service.create_user("Olive", "olive@example.com", "secret")
+    with pytest.raises(ValueError):
+        service.create_user("Olive", "olive@example.com", "secret")
+    events = db.query(OutboxEvent).all()
+    assert [(event.channel, json.loads(event.payload)) for event in events] == [
+        ("user.created", {"user_id": user.id, "email": "olive@example.com"})]
+    db.close()
+
+
+def test_outbox_dispatcher_publishes_batches_at_least_once(outbox_session):
+    redis_client = FakeRedis()
+    now = [1_000.0]
+    dispatcher = OutboxDispatcher(outbox_session, redis_client, batch_size=2, clock=lambda: now[0])
+    db = outbox_session()
+    db.add_all([OutboxEvent(channel="user.created", payload=json.dumps({"user_id": i}), created_at=990.0 + i)
+                for i in range(3)])
+    db.commit()
+    db.close()
+
+    redis_client.down = True
+    assert dispatcher.dispatch_once() == 0
+    assert dispatcher.stats()["pending"] == 3 and dispatcher.stats()["failures"] == 1
+    assert dispatcher.stats()["lag_seconds"] == 10.0
+
+    redis_client.down = False
+    assert dispatcher.dispatch_once() == 2
+    assert dispatcher.dispatch_once() == 1
+    assert dispatcher.dispatch_once() == 0
+    assert [json.loads(payload)["user_id"] for _, payload in redis_client.published] == [0, 1, 2]
+    assert redis_client.executions == 2
+    stats = dispatcher.stats()
+    assert stats["pending"] == 0 and stats["lag_seconds"] == 0.0
+    assert stats["dispatched"] == 3 and stats["batches"] == 2 and stats["last_dispatch_lag_seconds"] == 8.0
+
+
+def test_outbox_dispatcher_thread_delivers_on_wake_and_drains_on_stop(outbox_session):
+    redis_client = FakeRedis()
+    dispatcher = OutboxDispatcher(outbox_session, redis_client, interval=60)
+    dispatcher.start()
+    db = outbox_session()
+    service = UserService(db, hashers=FAST_HASHERS, outbox=dispatcher)
+    service.create_user("Wade", "wade@example.com", "secret")
+    deadline = time.monotonic() + 5
+    while not redis_client.published and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(redis_client.published) == 1
+
+    db.add(OutboxEvent(channel="user.created", payload="{}", created_at=time.time()))
+    db.commit()
+    db.close()
+    dispatcher.stop()
+    assert len(redis_client.published) == 2